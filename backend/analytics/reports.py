@@ -0,0 +1,114 @@
+"""
+Report generation for AnalyticsReport.
+
+A report covers the period implied by its report_type (or
+``parameters['start_date']``/``['end_date']`` for custom reports),
+optionally narrowed to ``parameters['platform_id']``. The detection
+statistics of that period are stored in content_summary and written to
+REPORTS_DIR in the report's format.
+"""
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import dateparse, timezone
+from django.utils.html import escape
+
+from detection.models import DetectionResult
+from detection.rollups import live_stats
+
+REPORT_PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+    'quarterly': timedelta(days=91),
+    'annual': timedelta(days=365),
+}
+
+
+def _parse_datetime(value):
+    parsed = dateparse.parse_datetime(value) or dateparse.parse_date(value)
+    if parsed is None:
+        raise ValueError(f'Invalid report date: {value!r}')
+    if not isinstance(parsed, datetime):
+        parsed = datetime.combine(parsed, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def report_period(report, now=None):
+    """Return the (start, end) datetimes a report covers."""
+    parameters = report.parameters or {}
+    end = _parse_datetime(parameters['end_date']) if parameters.get('end_date') else (now or timezone.now())
+    if parameters.get('start_date'):
+        start = _parse_datetime(parameters['start_date'])
+    elif report.report_type in REPORT_PERIODS:
+        start = end - REPORT_PERIODS[report.report_type]
+    else:
+        raise ValueError('Custom reports need a start_date parameter')
+    return start, end
+
+
+def build_summary(report, now=None):
+    """Detection statistics for the report's period and filters."""
+    start, end = report_period(report, now)
+    detections = DetectionResult.objects.filter(detected_at__gte=start, detected_at__lt=end)
+    platform_id = (report.parameters or {}).get('platform_id')
+    if platform_id:
+        detections = detections.filter(platform_id=platform_id)
+    summary = live_stats(detections, now=end)
+    summary['detections_by_severity'] = dict(
+        detections.values_list('severity_level').annotate(count=Count('id')).order_by()
+    )
+    summary['period'] = {'start': start.isoformat(), 'end': end.isoformat()}
+    return summary
+
+
+def _rows(summary, prefix=''):
+    """Flatten a summary into (key, value) rows."""
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            yield from _rows(value, f'{prefix}{key}.')
+        else:
+            yield f'{prefix}{key}', value
+
+
+def _write_json(handle, report, summary):
+    json.dump({'report': report.name, 'type': report.report_type, 'summary': summary}, handle, indent=2)
+
+
+def _write_csv(handle, report, summary):
+    writer = csv.writer(handle)
+    writer.writerow(['metric', 'value'])
+    writer.writerows(_rows(summary))
+
+
+def _write_html(handle, report, summary):
+    handle.write(f'<html><head><title>{escape(report.name)}</title></head><body>\n')
+    handle.write(f'<h1>{escape(report.name)}</h1>\n<table>\n')
+    for key, value in _rows(summary):
+        handle.write(f'<tr><th>{escape(key)}</th><td>{escape(value)}</td></tr>\n')
+    handle.write('</table>\n</body></html>\n')
+
+
+REPORT_WRITERS = {
+    'json': _write_json,
+    'csv': _write_csv,
+    'html': _write_html,
+}
+
+
+def write_report(report, summary):
+    """Write the report file; returns (path relative to MEDIA_ROOT, size in bytes)."""
+    writer = REPORT_WRITERS.get(report.format)
+    if writer is None:
+        raise ValueError(f'{report.get_format_display()} reports are not supported')
+    settings.REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = settings.REPORTS_DIR / f'report_{report.pk}.{report.format}'
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer(handle, report, summary)
+    return str(path.relative_to(settings.MEDIA_ROOT)), path.stat().st_size
@@ -0,0 +1,49 @@
+"""
+Celery tasks for the analytics app, routed to the ``bulk`` queue.
+"""
+
+import logging
+from datetime import date as date_type, timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from detection.counters import rebuild_daily_analytics
+from .models import AnalyticsReport
+from .reports import build_summary, write_report
+from .trends import recompute_trends
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(acks_late=True)
+def generate_report(report_id):
+    """Compute and write one AnalyticsReport."""
+    report = AnalyticsReport.objects.filter(pk=report_id).first()
+    if report is None:
+        return None
+    report.generation_status = 'generating'
+    report.save(update_fields=['generation_status'])
+    try:
+        summary = build_summary(report)
+        file_path, file_size = write_report(report, summary)
+    except Exception:
+        logger.exception('Report %s failed', report_id)
+        report.mark_failed()
+        return None
+    report.mark_completed(file_path=file_path, file_size=file_size, content_summary=summary)
+    return file_path
+
+
+@shared_task(acks_late=True)
+def recompute_daily_analytics(date=None):
+    """Rebuild the DetectionAnalytics row of ``date`` (ISO string); defaults to yesterday (UTC)."""
+    day = date_type.fromisoformat(date) if date else timezone.now().date() - timedelta(days=1)
+    rebuild_daily_analytics(day)
+    return day.isoformat()
+
+
+@shared_task(acks_late=True)
+def recompute_trend_analysis():
+    """Recompute the daily TrendAnalysis rows ending yesterday."""
+    return len(recompute_trends())
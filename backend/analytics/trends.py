@@ -0,0 +1,100 @@
+"""
+Daily detection trends for TrendAnalysis.
+
+Series are read from the DetectionRollup buckets, so a recomputation
+costs one grouped query per metric instead of a scan of DetectionResult.
+Each series covers TREND_WINDOW_DAYS days ending yesterday (UTC), with
+missing days counted as zero, and is summarised by its mean, median,
+standard deviation and the correlation of count with time.
+"""
+
+import statistics
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from detection.models import DetectionRollup
+from .models import TrendAnalysis
+
+# |correlation| below this is no trend; then a high relative spread
+# makes the series fluctuating instead of stable.
+TREND_CORRELATION = 0.3
+FLUCTUATION = 0.5
+
+
+def _daily_series(queryset, start, end, key=None):
+    """Return {key value: [count per day from start to end]}; key None sums everything."""
+    days = (end - start).days + 1
+    fields = [key, 'day'] if key else ['day']
+    rows = queryset.filter(hour__date__gte=start, hour__date__lte=end).annotate(
+        day=TruncDate('hour')
+    ).values_list(*fields).annotate(total=Sum('count')).order_by()
+    series = {}
+    for *name, day, total in rows:
+        series.setdefault(name[0] if name else None, [0] * days)[(day - start).days] += total
+    return series
+
+
+def describe(values):
+    """Summary statistics and trend direction of a series."""
+    mean = statistics.fmean(values)
+    deviation = statistics.pstdev(values)
+    correlation = None
+    if len(values) > 1 and deviation:
+        correlation = statistics.correlation(range(len(values)), values)
+    if correlation is not None and abs(correlation) >= TREND_CORRELATION:
+        direction = 'increasing' if correlation > 0 else 'decreasing'
+    elif mean and deviation / mean > FLUCTUATION:
+        direction = 'fluctuating'
+    else:
+        direction = 'stable'
+    return {
+        'mean_value': mean,
+        'median_value': statistics.median(values),
+        'standard_deviation': deviation,
+        'correlation_coefficient': correlation,
+        'trend_direction': direction,
+        'trend_strength': abs(correlation) if correlation is not None else 0.0,
+    }
+
+
+def _insights(metric_name, values, summary):
+    first, last = values[0], values[-1]
+    insights = [f'{metric_name}: {sum(values)} detections, {summary["mean_value"]:.1f} per day']
+    if summary['trend_direction'] in ('increasing', 'decreasing'):
+        insights.append(f'{summary["trend_direction"].capitalize()} from {first} to {last} per day')
+    return insights
+
+
+def recompute_trends(end=None, days=None):
+    """Store daily detection_rate and platform_activity trends; returns the rows written."""
+    end = end or timezone.now().date() - timedelta(days=1)
+    days = days or settings.TREND_WINDOW_DAYS
+    start = end - timedelta(days=days - 1)
+    rollups = DetectionRollup.objects.all()
+
+    total = _daily_series(rollups, start, end).get(None, [0] * days)
+    metrics = [('detection_rate', 'All detections', total)]
+    for platform, values in sorted(_daily_series(rollups, start, end, 'platform__name').items()):
+        metrics.append(('platform_activity', platform, values))
+
+    trends = []
+    for metric_type, metric_name, values in metrics:
+        summary = describe(values)
+        trend, created = TrendAnalysis.objects.update_or_create(
+            metric_type=metric_type, metric_name=metric_name, period_type='daily',
+            start_date=start, end_date=end,
+            defaults={
+                **summary,
+                'data_points': [
+                    {'date': (start + timedelta(days=offset)).isoformat(), 'value': value}
+                    for offset, value in enumerate(values)
+                ],
+                'key_insights': _insights(metric_name, values, summary),
+            },
+        )
+        trends.append(trend)
+    return trends
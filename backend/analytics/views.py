@@ -4,6 +4,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+from django.db import transaction
 from django.db.models import Count, Avg, Q
 from django.utils import timezone
 from datetime import timedelta
@@ -16,6 +17,7 @@ from .serializers import (
     GeographicAnalysisSerializer, UserBehaviorAnalysisSerializer,
     PerformanceMetricsSerializer, AlertMetricsSerializer
 )
+from .tasks import generate_report
 
 
 class AnalyticsReportViewSet(viewsets.ModelViewSet):
@@ -32,8 +34,10 @@ class AnalyticsReportViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def regenerate(self, request, pk=None):
         report = self.get_object()
-        # Placeholder for regeneration logic
-        return Response({'message': 'Report regeneration initiated'})
+        report.generation_status = 'pending'
+        report.save(update_fields=['generation_status'])
+        transaction.on_commit(lambda: generate_report.delay(report.pk))
+        return Response({'message': 'Report regeneration initiated'}, status=status.HTTP_202_ACCEPTED)
 
 
 class TrendAnalysisViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,157 @@
+"""
+DataExport processing.
+
+An export names a model (``model_type``), field names and filters. Only
+the models in EXPORT_MODELS can be exported and only the fields listed
+for them in EXPORT_FIELDS (foreign keys export their id); filters may
+only reference those fields, so an export cannot reach credentials or
+related tables such as users. Detections are limited to those the
+requesting user may see (detection.views.scope_detections). Rows are
+streamed in EXPORT_CHUNK_SIZE chunks and progress is saved after every
+chunk.
+
+Files are written to EXPORTS_DIR, outside MEDIA_ROOT, under a random
+name; they are only handed out through the DataExport API.
+"""
+
+import csv
+import json
+import secrets
+
+from django.apps import apps
+from django.conf import settings
+
+EXPORT_MODELS = {
+    'detection': 'detection.DetectionResult',
+    'content': 'monitoring.CollectedContent',
+    'platform': 'detection.Platform',
+    'pattern': 'detection.DetectionPattern',
+    'analytics': 'detection.DetectionAnalytics',
+}
+
+# Exportable fields per model type, in default column order. Never list
+# credentials (Platform.api_key, Platform.api_secret).
+EXPORT_FIELDS = {
+    'detection': (
+        'id', 'platform', 'detection_pattern', 'content_text', 'content_url', 'content_id',
+        'user_id', 'username', 'confidence_score', 'severity_level', 'detected_keywords',
+        'status', 'assigned_to', 'reviewed_by', 'detected_at', 'reviewed_at', 'resolved_at',
+    ),
+    'content': (
+        'id', 'monitoring_session', 'platform', 'content_type', 'content_id', 'content_text',
+        'content_url', 'content_hash', 'user_id', 'username', 'channel_id', 'channel_name',
+        'is_suspicious', 'confidence_score', 'detected_keywords', 'timestamp', 'cluster',
+        'collected_at', 'processed',
+    ),
+    'platform': (
+        'id', 'name', 'platform_type', 'is_active', 'monitoring_enabled', 'rate_limit',
+        'total_detections', 'last_monitoring', 'created_at', 'updated_at',
+    ),
+    'pattern': (
+        'id', 'name', 'pattern_type', 'pattern_data', 'description', 'model_version',
+        'confidence_threshold', 'is_active', 'priority', 'match_count', 'scan_count',
+        'created_at', 'updated_at', 'last_used',
+    ),
+    'analytics': (
+        'id', 'date', 'telegram_detections', 'instagram_detections',
+        'whatsapp_detections', 'twitter_detections', 'other_detections', 'low_severity',
+        'medium_severity', 'high_severity', 'critical_severity', 'pending_review', 'confirmed',
+        'false_positives', 'escalated', 'avg_confidence_score', 'detection_rate',
+        'false_positive_rate',
+    ),
+}
+
+
+def export_queryset(export):
+    """Return (values_list queryset, field names) for a DataExport."""
+    label = EXPORT_MODELS.get(export.model_type)
+    if label is None:
+        raise ValueError(f'Unknown export model: {export.model_type!r}')
+    model = apps.get_model(label)
+    allowed = EXPORT_FIELDS[export.model_type]
+    concrete = {
+        field.name: field for field in model._meta.concrete_fields if field.name in allowed
+    }
+    columns = {name: field.attname for name, field in concrete.items()}
+    names = export.fields or [name for name in allowed if name in columns]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f'Unknown export fields: {", ".join(unknown)}')
+
+    filters = {}
+    for lookup, value in (export.filters or {}).items():
+        name, *rest = lookup.split('__')
+        if name not in concrete or len(rest) > 1 or (rest and rest[0] not in concrete[name].get_lookups()):
+            raise ValueError(f'Unsupported export filter: {lookup!r}')
+        filters['__'.join([columns[name], *rest])] = value
+    queryset = model.objects.filter(**filters).order_by('pk')
+    if export.model_type == 'detection':
+        from detection.views import scope_detections
+        queryset = scope_detections(queryset, export.user)
+    return queryset.values_list(*(columns[name] for name in names)), names
+
+
+class _CSVWriter:
+    def __init__(self, handle, names):
+        self.writer = csv.writer(handle)
+        self.writer.writerow(names)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class _JSONWriter:
+    """Writes a JSON array of objects without holding the rows in memory."""
+
+    def __init__(self, handle, names):
+        self.handle = handle
+        self.names = names
+        self.first = True
+        handle.write('[')
+
+    def write(self, rows):
+        for row in rows:
+            self.handle.write('\n' if self.first else ',\n')
+            self.handle.write(json.dumps(dict(zip(self.names, row)), default=str))
+            self.first = False
+
+    def close(self):
+        self.handle.write('\n]\n')
+
+
+EXPORT_WRITERS = {
+    'csv': _CSVWriter,
+    'json': _JSONWriter,
+}
+
+
+def run_export(export):
+    """Write a DataExport's file; returns (path relative to EXPORTS_DIR, size in bytes)."""
+    writer_class = EXPORT_WRITERS.get(export.format)
+    if writer_class is None:
+        raise ValueError(f'{export.get_format_display()} exports are not supported')
+    queryset, names = export_queryset(export)
+    total = queryset.count()
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    export.update_progress(0, total)
+
+    settings.EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = settings.EXPORTS_DIR / f'export_{export.pk}_{secrets.token_hex(16)}.{export.format}'
+    processed = 0
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = writer_class(handle, names)
+        chunk = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                processed += len(chunk)
+                export.update_progress(processed, total)
+                chunk = []
+        writer.write(chunk)
+        writer.close()
+    export.update_progress(processed + len(chunk), total)
+    return path.name, path.stat().st_size
@@ -0,0 +1,117 @@
+"""
+System health probes.
+
+Each probe checks one SystemHealth component and returns
+(status, response time in ms, details, error message). probe_all()
+runs them from the periodic probe_system_health task and stores one
+SystemHealth row per component, so the health endpoint only reads the
+latest rows instead of touching every service on each request.
+"""
+
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import SystemHealth
+
+
+def _probe_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return 'healthy', {'vendor': connection.vendor}
+
+
+def _probe_cache():
+    key = f'health:{uuid.uuid4().hex}'
+    cache.set(key, 1, 10)
+    found = cache.get(key) == 1
+    cache.delete(key)
+    return ('healthy' if found else 'critical'), {'backend': settings.CACHES['default']['BACKEND']}
+
+
+def _probe_queue():
+    from hack2drug.celery import app
+
+    with app.connection_for_write() as broker:
+        broker.ensure_connection(max_retries=1, timeout=settings.HEALTH_CHECK_TIMEOUT)
+    return 'healthy', {'broker': broker.as_uri()}
+
+
+def _probe_storage():
+    usage = shutil.disk_usage(settings.MEDIA_ROOT if settings.MEDIA_ROOT.exists() else settings.BASE_DIR)
+    free = usage.free / usage.total * 100
+    if free < settings.HEALTH_DISK_CRITICAL_PERCENT:
+        status = 'critical'
+    elif free < settings.HEALTH_DISK_WARNING_PERCENT:
+        status = 'warning'
+    else:
+        status = 'healthy'
+    return status, {'free_percent': round(free, 1), 'free_bytes': usage.free}
+
+
+def _probe_monitoring():
+    from monitoring.models import MonitoringSession
+
+    sessions = MonitoringSession.objects.filter(status='active')
+    active = sessions.count()
+    # Sessions that stored nothing for three collection intervals.
+    idle_since = timezone.now() - timedelta(seconds=settings.MONITORING_INTERVAL * 3)
+    idle = sessions.filter(last_activity__lt=idle_since).count()
+    status = 'healthy'
+    if active and idle == active:
+        status = 'critical'
+    elif idle:
+        status = 'warning'
+    return status, {'active_sessions': active, 'idle_sessions': idle}
+
+
+PROBES = {
+    'database': _probe_database,
+    'cache': _probe_cache,
+    'queue': _probe_queue,
+    'storage': _probe_storage,
+    'monitoring': _probe_monitoring,
+}
+
+
+def probe(component):
+    """Run one probe; failures are reported as 'offline'."""
+    started = time.monotonic()
+    try:
+        status, details = PROBES[component]()
+        error = ''
+    except Exception as exc:
+        status, details, error = 'offline', {}, str(exc)
+    return status, (time.monotonic() - started) * 1000, details, error
+
+
+def probe_all():
+    """Probe every component and store the results; returns the new rows."""
+    rows = []
+    for component in PROBES:
+        status, response_time, details, error = probe(component)
+        rows.append(SystemHealth(
+            component=component,
+            status=status,
+            response_time=response_time,
+            availability=0.0 if status == 'offline' else 100.0,
+            details=details,
+            error_message=error,
+        ))
+    return SystemHealth.objects.bulk_create(rows)
+
+
+def latest_health():
+    """Return {component: latest SystemHealth row}."""
+    latest = {}
+    since = timezone.now() - timedelta(seconds=settings.HEALTH_CHECK_INTERVAL * 3)
+    for row in SystemHealth.objects.filter(checked_at__gte=since).order_by('checked_at'):
+        latest[row.component] = row
+    return latest
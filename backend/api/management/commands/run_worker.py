@@ -0,0 +1,35 @@
+"""
+Start a Celery worker for one queue with that queue's options.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hack2drug.celery import app
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a Celery worker consuming one queue, with the concurrency, '
+        'prefetch multiplier and pool from WORKER_QUEUE_OPTIONS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', help=f"One of: {', '.join(settings.WORKER_QUEUE_OPTIONS)}")
+        parser.add_argument('--concurrency', type=int, help='Override the configured concurrency.')
+        parser.add_argument('--loglevel', default='info')
+
+    def handle(self, *args, **options):
+        queue = options['queue']
+        if queue not in settings.WORKER_QUEUE_OPTIONS:
+            raise CommandError(f'Unknown queue {queue!r}')
+        queue_options = settings.WORKER_QUEUE_OPTIONS[queue]
+        app.worker_main([
+            'worker',
+            '--queues', queue,
+            '--hostname', f'{queue}@%h',
+            '--concurrency', str(options['concurrency'] or queue_options['concurrency']),
+            '--prefetch-multiplier', str(queue_options.get('prefetch_multiplier', 4)),
+            '--pool', queue_options.get('pool', 'prefork'),
+            '--loglevel', options['loglevel'],
+        ])
@@ -43,18 +43,34 @@ class WebhookEndpointCreateSerializer(serializers.ModelSerializer):
 
 
 class DataExportSerializer(serializers.ModelSerializer):
-    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    user_name = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = DataExport
-        fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'completed_at']
+        exclude = ['file_path']
+        read_only_fields = [
+            'id', 'user', 'status', 'file_size', 'total_records', 'processed_records',
+            'progress_percentage', 'error_message', 'retry_count', 'created_at', 'started_at',
+            'completed_at',
+        ]
 
 
 class DataExportCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataExport
-        fields = ['export_type', 'data_source', 'format', 'filters', 'include_metadata']
+        fields = ['id', 'name', 'description', 'format', 'model_type', 'filters', 'fields']
+        read_only_fields = ['id']
+
+    def validate(self, attrs):
+        from .exports import EXPORT_WRITERS, export_queryset
+
+        if attrs['format'] not in EXPORT_WRITERS:
+            raise serializers.ValidationError({'format': f'Supported formats: {", ".join(EXPORT_WRITERS)}'})
+        try:
+            export_queryset(DataExport(user=self.context['request'].user, **attrs))
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return attrs
 
 
 class SystemHealthSerializer(serializers.ModelSerializer):
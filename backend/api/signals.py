@@ -4,7 +4,10 @@ Signals for API app.
 
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from detection.cache import bump_version_on_commit
+from detection.models import DetectionResult
 from .models import APIAccessLog, APIKey, WebhookEndpoint
+from .webhooks import notify_detections_created
 
 
 @receiver(post_save, sender=APIAccessLog)
@@ -46,3 +49,17 @@ def log_webhook_creation(sender, instance, created, **kwargs):
             resource_type='webhook_endpoint',
             resource_id=instance.id
         )
+
+
+@receiver(post_save, sender=DetectionResult)
+def notify_detection_webhooks(sender, instance, created, raw=False, **kwargs):
+    """Send detections saved one by one to subscribed webhook endpoints."""
+    if created and not raw:
+        notify_detections_created([instance])
+
+
+@receiver(post_save, sender=WebhookEndpoint)
+@receiver(post_delete, sender=WebhookEndpoint)
+def invalidate_endpoint_cache(sender, **kwargs):
+    """Bump the cached webhook subscriptions when an endpoint changes."""
+    bump_version_on_commit('webhook_endpoints')
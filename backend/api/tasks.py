@@ -0,0 +1,86 @@
+"""
+Celery tasks for the api app.
+
+Data exports and purges run on the ``bulk`` queue, webhook deliveries
+on the I/O-bound ``webhooks`` queue and health probes on ``default``
+(see CELERY_TASK_ROUTES).
+"""
+
+import logging
+import urllib.error
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from hack2drug.retention import delete_in_chunks
+from .exports import run_export
+from .health import probe_all
+from .models import APIAccessLog, DataExport, SystemHealth, WebhookEndpoint
+from .webhooks import record_delivery, send
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(acks_late=True)
+def run_data_export(export_id):
+    """Process one pending DataExport."""
+    export = DataExport.objects.filter(pk=export_id, status='pending').first()
+    if export is None:
+        return None
+    export.start_processing()
+    try:
+        file_path, file_size = run_export(export)
+    except Exception as exc:
+        logger.exception('Export %s failed', export_id)
+        export.mark_failed(str(exc))
+        return None
+    export.mark_completed(file_path, file_size)
+    return file_path
+
+
+@shared_task(bind=True, ignore_result=True)
+def deliver_webhook(self, endpoint_id, event, payload):
+    """
+    POST an event to one endpoint, retrying network errors and 5xx
+    responses up to the endpoint's retry_count with exponential backoff.
+    """
+    endpoint = WebhookEndpoint.objects.filter(pk=endpoint_id, is_active=True).first()
+    if endpoint is None:
+        return
+    try:
+        send(endpoint, event, payload)
+    except OSError as exc:  # URLError, HTTPError and timeouts
+        server_error = not isinstance(exc, urllib.error.HTTPError) or exc.code >= 500
+        if server_error and self.request.retries < endpoint.retry_count:
+            raise self.retry(
+                exc=exc,
+                countdown=settings.WEBHOOK_RETRY_BACKOFF * 2 ** self.request.retries,
+                max_retries=endpoint.retry_count,
+            )
+        logger.warning('Webhook %s delivery of %s failed: %s', endpoint_id, event, exc)
+        record_delivery(endpoint_id, False)
+        return
+    record_delivery(endpoint_id, True)
+
+
+@shared_task(ignore_result=True)
+def probe_system_health():
+    """Record the health of every SystemHealth component."""
+    for row in probe_all():
+        if row.status != 'healthy':
+            logger.warning('%s is %s %s', row.component, row.status, row.error_message)
+
+
+@shared_task(acks_late=True)
+def purge_expired_records():
+    """Delete API access logs and health probes past their retention."""
+    now = timezone.now()
+    logs = delete_in_chunks(APIAccessLog.objects.filter(
+        timestamp__lt=now - timedelta(days=settings.API_LOG_RETENTION_DAYS)
+    ))
+    probes = delete_in_chunks(SystemHealth.objects.filter(
+        checked_at__lt=now - timedelta(days=settings.HEALTH_RETENTION_DAYS)
+    ))
+    return {'api_logs': logs, 'health_checks': probes}
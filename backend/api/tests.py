@@ -1,3 +1,185 @@
-from django.test import TestCase
+"""
+Tests for data exports, webhook events and periodic maintenance.
+"""
 
-# Create your tests here.
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from detection.models import DetectionPattern, DetectionResult, Platform
+from detection.services import bulk_create_detections
+from hack2drug.celery import app
+from hack2drug.testing import IsolatedTestCase
+from users.models import User
+from .models import APIAccessLog, DataExport, SystemHealth, WebhookEndpoint
+from .tasks import probe_system_health, purge_expired_records, run_data_export
+from .webhooks import endpoint_cache
+
+
+class DataExportTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.exports_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.exports_dir)
+        settings_override = override_settings(EXPORTS_DIR=self.exports_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='analyst', email='analyst@example.org', password='x')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+        self.platform = Platform.objects.create(
+            name='Telegram', platform_type='telegram', api_key='KEY-123', api_secret='SECRET-456',
+        )
+
+    def create(self, **data):
+        data = {'name': 'export', 'format': 'csv', 'model_type': 'platform', **data}
+        with mock.patch('api.views.run_data_export.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/data-exports/', data, format='json')
+        return response, delay
+
+    def test_credentials_cannot_be_exported(self):
+        for data in ({'fields': ['name', 'api_key']}, {'filters': {'api_secret': 'SECRET-456'}}):
+            response, delay = self.create(**data)
+            self.assertEqual(response.status_code, 400, data)
+            delay.assert_not_called()
+
+        response, delay = self.create()
+        self.assertEqual(response.status_code, 201)
+        delay.assert_called_once_with(response.data['id'])
+        run_data_export(response.data['id'])
+        export = DataExport.objects.get(pk=response.data['id'])
+        self.assertEqual(export.status, 'completed')
+        text = (self.exports_dir / export.file_path).read_text()
+        self.assertIn('Telegram', text)
+        self.assertNotIn('KEY-123', text)
+        self.assertNotIn('SECRET-456', text)
+
+    def test_file_is_private_and_unguessable(self):
+        response, delay = self.create()
+        run_data_export(response.data['id'])
+        export = DataExport.objects.get(pk=response.data['id'])
+        self.assertNotEqual(export.file_path, f'export_{export.pk}.csv')
+        self.assertFalse(str(settings.EXPORTS_DIR).startswith(str(settings.MEDIA_ROOT)))
+
+        download = self.client.get(f'/api/data-exports/{export.pk}/download/')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(b'Telegram', b''.join(download.streaming_content))
+
+        other = User.objects.create_user(username='other', email='other@example.org', password='x')
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f'/api/data-exports/{export.pk}/download/').status_code, 404)
+
+    def test_detection_exports_are_scoped(self):
+        pattern = DetectionPattern.objects.create(name='p', pattern_type='keyword', pattern_data='coke')
+        other = User.objects.create_user(username='other', email='other@example.org', password='x')
+        for assignee in (self.user, other):
+            DetectionResult.objects.create(
+                platform=self.platform, detection_pattern=pattern, content_text=assignee.username,
+                confidence_score=0.9, severity_level='high', assigned_to=assignee,
+            )
+        self.user.role = 'USER'
+        self.user.save(update_fields=['role'])
+        response, delay = self.create(model_type='detection', format='json', fields=['content_text'])
+        run_data_export(response.data['id'])
+        export = DataExport.objects.get(pk=response.data['id'])
+        self.assertEqual(export.total_records, 1)
+        self.assertIn('analyst', (self.exports_dir / export.file_path).read_text())
+
+
+class DetectionWebhookTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='analyst', email='analyst@example.org', password='x')
+        self.platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        self.pattern = DetectionPattern.objects.create(name='p', pattern_type='keyword', pattern_data='coke')
+        for name, events in (('created', ['detection.created']), ('all', ['*']), ('other', ['export.completed'])):
+            WebhookEndpoint.objects.create(
+                name=name, url='https://hooks.example.org/', user=self.user, events=events, secret='s',
+            )
+        endpoint_cache.invalidate()
+        self.addCleanup(endpoint_cache.invalidate)
+
+    def test_bulk_insert_sends_one_event_per_endpoint(self):
+        items = [
+            {
+                'detection_pattern': self.pattern, 'content_text': f'coke {i}',
+                'confidence_score': 0.9, 'severity_level': 'high',
+            }
+            for i in range(5)
+        ]
+        endpoint_cache.get()
+        with mock.patch('api.tasks.deliver_webhook.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    created_ids = bulk_create_detections(self.platform, items)
+        self.assertFalse(any('api_webhookendpoint' in query['sql'] for query in queries.captured_queries))
+
+        self.assertEqual(delay.call_count, 2)
+        for call in delay.call_args_list:
+            endpoint_id, event, payload = call.args
+            self.assertEqual(event, 'detection.created')
+            self.assertEqual([item['id'] for item in payload['detections']], created_ids)
+
+    def test_single_create_is_sent_as_a_batch_of_one(self):
+        with mock.patch('api.tasks.deliver_webhook.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                detection = DetectionResult.objects.create(
+                    platform=self.platform, detection_pattern=self.pattern, content_text='coke',
+                    confidence_score=0.9, severity_level='high',
+                )
+        self.assertEqual(delay.call_count, 2)
+        self.assertEqual([item['id'] for item in delay.call_args.args[2]['detections']], [detection.pk])
+
+
+class MaintenanceTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='analyst', email='analyst@example.org', password='x')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def test_beat_schedule_names_registered_tasks(self):
+        app.loader.import_default_modules()
+        for name, entry in settings.CELERY_BEAT_SCHEDULE.items():
+            self.assertIn(entry['task'], app.tasks, name)
+
+    def test_health_check_reports_stored_probes(self):
+        self.assertEqual(self.client.get('/health/').json()['status'], 'unknown')
+
+        with mock.patch.dict('api.health.PROBES', {'queue': mock.Mock(side_effect=ConnectionError('no broker'))}):
+            probe_system_health()
+        response = self.client.get('/health/').json()
+        self.assertEqual(response['status'], 'unhealthy')
+        self.assertEqual(response['services']['queue']['status'], 'offline')
+        self.assertEqual(response['services']['database']['status'], 'healthy')
+
+    def test_purge_removes_only_expired_records(self):
+        for _ in range(3):
+            APIAccessLog.objects.create(
+                user=self.user, endpoint='/api/', method='GET', status_code=200, response_time=1.0,
+                ip_address='127.0.0.1',
+            )
+            SystemHealth.objects.create(component='database')
+        expired = timezone.now() - timedelta(days=settings.API_LOG_RETENTION_DAYS + 1)
+        APIAccessLog.objects.filter(pk__in=APIAccessLog.objects.values('pk')[:2]).update(timestamp=expired)
+        SystemHealth.objects.filter(pk__in=SystemHealth.objects.values('pk')[:1]).update(
+            checked_at=timezone.now() - timedelta(days=settings.HEALTH_RETENTION_DAYS + 1)
+        )
+        with override_settings(RETENTION_DELETE_CHUNK=1):
+            self.assertEqual(purge_expired_records(), {'api_logs': 2, 'health_checks': 1})
+        self.assertEqual((APIAccessLog.objects.count(), SystemHealth.objects.count()), (1, 2))
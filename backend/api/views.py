@@ -4,11 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import LimitOffsetPagination
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import FileResponse
 from users.models import UserProfile, UserSession, UserActivity
 from detection.models import DetectionResult, DetectionPattern, DrugCategory, Platform, DetectionRule
 from monitoring.models import MonitoringSession, CollectedContent, MonitoringRule, MonitoringMetrics, PlatformConnection
 from analytics.models import AnalyticsReport, TrendAnalysis, GeographicAnalysis, UserBehaviorAnalysis, PerformanceMetrics, AlertMetrics
+from detection.search import search
+from detection.fuzzy import fuzzy_search
+from detection.views import scope_detections
+from monitoring.serializers import CollectedContentSerializer
+from .models import DataExport
+from .serializers import DataExportCreateSerializer, DataExportSerializer
+from .tasks import run_data_export
 
 User = get_user_model()
 
@@ -121,8 +132,35 @@ class WebhookEndpointViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 class DataExportViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
-    permission_classes = [IsAuthenticated]
+    """
+    A user's data exports. Creating one queues api.tasks.run_data_export;
+    the finished file is fetched with the ``download`` action.
+    """
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return DataExport.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return DataExportCreateSerializer
+        return DataExportSerializer
+
+    def perform_create(self, serializer):
+        export = serializer.save(user=self.request.user)
+        transaction.on_commit(lambda: run_data_export.delay(export.pk))
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        export = self.get_object()
+        if export.status != 'completed' or not export.file_path:
+            return Response({'error': 'Export is not completed'}, status=status.HTTP_409_CONFLICT)
+        path = settings.EXPORTS_DIR / export.file_path
+        if not path.is_file():
+            return Response({'error': 'Export file is gone'}, status=status.HTTP_410_GONE)
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename=f'export_{export.pk}.{export.format}')
 
 class SystemHealthViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -241,7 +279,29 @@ class GlobalSearchView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        return Response({'message': 'Global search endpoint'})
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Search query required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= 100:
+            return Response({'error': 'limit must be between 1 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        fields = ['id', 'content_text', 'username', 'search_rank']
+        detections = search(scope_detections(DetectionResult.objects.all(), request.user), query).values(
+            *fields, 'platform_id', 'severity_level', 'status', 'detected_at'
+        )[:limit]
+        content = search(CollectedContent.objects.all(), query).values(
+            *fields, 'channel_name', 'is_suspicious', 'collected_at'
+        )[:limit]
+        
+        return Response({
+            'query': query,
+            'detections': list(detections),
+            'content': list(content),
+        })
 
 class SearchDetectionsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -259,7 +319,37 @@ class SearchContentView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        return Response({'message': 'Search content endpoint'})
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Search query required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = CollectedContent.objects.all()
+        if request.query_params.get('session'):
+            queryset = queryset.filter(monitoring_session_id=request.query_params['session'])
+        if request.query_params.get('suspicious') is not None:
+            queryset = queryset.filter(
+                is_suspicious=request.query_params['suspicious'].lower() in ('1', 'true', 'yes')
+            )
+        
+        paginator = LimitOffsetPagination()
+        if request.query_params.get('fuzzy', '').lower() in ('1', 'true', 'yes'):
+            # Trigram match on normalized text, for obfuscated spellings
+            try:
+                similarity = float(request.query_params.get('similarity', settings.FUZZY_SEARCH_THRESHOLD))
+            except ValueError:
+                return Response({'error': 'similarity must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+            results = fuzzy_search(queryset, query, threshold=min(max(similarity, 0.1), 1.0),
+                                   limit=settings.FUZZY_SEARCH_MAX_RESULTS)
+            page = paginator.paginate_queryset(results, request, view=self)
+            data = CollectedContentSerializer(page, many=True).data
+            for item, obj in zip(data, page):
+                item['similarity'] = obj.similarity
+            return paginator.get_paginated_response(data)
+        
+        queryset = search(queryset, query)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = CollectedContentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class BulkDetectionOperationsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,110 @@
+"""
+Webhook delivery.
+
+Events are POSTed as JSON to every active WebhookEndpoint subscribed to
+them (``events`` lists event names; '*' subscribes to all). The body is
+signed with the endpoint's secret: X-Hack2Drug-Signature is
+``sha256=<hex HMAC of the raw body>``. Deliveries run as
+api.tasks.deliver_webhook on the ``webhooks`` queue and are queued only
+once the triggering transaction commits.
+
+The active endpoints and their subscriptions are kept in a versioned
+in-process cache (detection.cache), bumped when an endpoint changes, so
+raising an event does not query the endpoints table.
+
+``detection.created`` is sent once per batch of stored detections with
+``{"detections": [...]}``, whether they were inserted one by one or in
+bulk (detection.services.bulk_create_detections).
+"""
+
+import hashlib
+import hmac
+import json
+import urllib.request
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from detection.cache import VersionedCache
+from .models import WebhookEndpoint
+
+
+def sign(secret, body):
+    """Hex HMAC-SHA256 of a request body."""
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def send(endpoint, event, payload):
+    """POST one event to an endpoint; raises URLError/HTTPError on failure."""
+    body = json.dumps(
+        {'event': event, 'sent_at': timezone.now().isoformat(), 'payload': payload},
+        default=str,
+    ).encode('utf-8')
+    request = urllib.request.Request(endpoint.url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'User-Agent': 'Hack2Drug-Webhooks',
+        'X-Hack2Drug-Event': event,
+        'X-Hack2Drug-Signature': f'sha256={sign(endpoint.secret, body)}',
+    })
+    with urllib.request.urlopen(request, timeout=endpoint.timeout) as response:
+        return response.status
+
+
+def record_delivery(endpoint_id, success):
+    """Count a finished delivery (after its last retry) on the endpoint."""
+    result_field = 'successful_deliveries' if success else 'failed_deliveries'
+    WebhookEndpoint.objects.filter(pk=endpoint_id).update(
+        total_deliveries=F('total_deliveries') + 1,
+        last_delivery=timezone.now(),
+        **{result_field: F(result_field) + 1},
+    )
+
+
+def load_endpoint_subscriptions(version=None):
+    """Return [(endpoint id, frozenset of events)] of the active endpoints."""
+    return [
+        (endpoint_id, frozenset(events or ()))
+        for endpoint_id, events in WebhookEndpoint.objects.filter(is_active=True).values_list('pk', 'events')
+    ]
+
+
+endpoint_cache = VersionedCache('webhook_endpoints', load_endpoint_subscriptions)
+
+
+def notify_webhooks(event, payload):
+    """Queue a delivery of ``event`` to each subscribed endpoint after commit."""
+    from .tasks import deliver_webhook
+
+    endpoint_ids = [
+        endpoint_id for endpoint_id, events in endpoint_cache.get()
+        if event in events or '*' in events
+    ]
+    if not endpoint_ids:
+        return
+
+    def enqueue():
+        for endpoint_id in endpoint_ids:
+            deliver_webhook.delay(endpoint_id, event, payload)
+
+    transaction.on_commit(enqueue)
+
+
+def notify_detections_created(detections):
+    """Send one ``detection.created`` event listing saved detections."""
+    if not detections:
+        return
+    notify_webhooks('detection.created', {
+        'detections': [
+            {
+                'id': detection.id,
+                'platform_id': detection.platform_id,
+                'severity_level': detection.severity_level,
+                'status': detection.status,
+                'confidence_score': detection.confidence_score,
+                'content_url': detection.content_url,
+                'detected_at': detection.detected_at.isoformat(),
+            }
+            for detection in detections
+        ],
+    })
@@ -8,7 +8,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     DrugCategory, DetectionPattern, Platform, DetectionResult, 
-    DetectionAnalytics, DetectionRule
+    DetectionAnalytics, DetectionRollup, DetectionRule, MLModelVersion
 )
 
 
@@ -51,7 +51,7 @@ class DetectionPatternAdmin(admin.ModelAdmin):
     """
     list_display = [
         'name', 'pattern_type', 'confidence_threshold', 'priority', 
-        'is_active', 'last_used', 'drug_categories_display'
+        'is_active', 'match_count', 'last_used', 'drug_categories_display'
     ]
     list_filter = [
         'pattern_type', 'is_active', 'priority', 'created_at'
@@ -64,7 +64,7 @@ class DetectionPatternAdmin(admin.ModelAdmin):
             'fields': ('name', 'description', 'pattern_type')
         }),
         ('Pattern Data', {
-            'fields': ('pattern_data',)
+            'fields': ('pattern_data', 'model_version')
         }),
         ('Settings', {
             'fields': ('confidence_threshold', 'priority', 'is_active')
@@ -74,7 +74,7 @@ class DetectionPatternAdmin(admin.ModelAdmin):
         }),
     )
     
-    readonly_fields = ['created_at', 'updated_at', 'last_used']
+    readonly_fields = ['created_at', 'updated_at', 'last_used', 'match_count', 'scan_count']
     filter_horizontal = ['drug_categories']
     
     def drug_categories_display(self, obj):
@@ -86,6 +86,19 @@ class DetectionPatternAdmin(admin.ModelAdmin):
     drug_categories_display.short_description = 'Drug Categories'
 
 
+@admin.register(MLModelVersion)
+class MLModelVersionAdmin(admin.ModelAdmin):
+    """
+    Admin for MLModelVersion model. Artifacts are written by
+    detection.ml.register_model, so only the metadata is editable.
+    """
+    list_display = ['name', 'version', 'feature_set', 'threshold', 'trained_at', 'created_at']
+    list_filter = ['name', 'feature_set']
+    search_fields = ['name', 'description']
+    ordering = ['name', '-version']
+    readonly_fields = ['name', 'version', 'artifact', 'feature_set', 'trained_at', 'metrics', 'created_at']
+
+
 @admin.register(Platform)
 class PlatformAdmin(admin.ModelAdmin):
     """
@@ -285,6 +298,25 @@ class DetectionAnalyticsAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+@admin.register(DetectionRollup)
+class DetectionRollupAdmin(admin.ModelAdmin):
+    """
+    Admin for DetectionRollup model.
+    """
+    list_display = [
+        'hour', 'platform', 'detection_pattern', 'severity_level', 'status',
+        'count', 'confidence_sum'
+    ]
+    list_filter = ['platform', 'severity_level', 'status']
+    date_hierarchy = 'hour'
+    ordering = ['-hour']
+    
+    readonly_fields = [
+        'hour', 'platform', 'detection_pattern', 'severity_level', 'status',
+        'count', 'confidence_sum'
+    ]
+
+
 @admin.register(DetectionRule)
 class DetectionRuleAdmin(admin.ModelAdmin):
     """
@@ -0,0 +1,164 @@
+"""
+Process-local caches for compiled detection state.
+
+Each cache holds one compiled object per process together with the
+version it was built from. The version counter lives in Django's shared
+cache so every worker notices a bump; rebuilding happens in a background
+thread while the previous compiled object keeps serving requests, and
+the new one is swapped in with a single reference assignment.
+
+With a process-local default cache (CACHE_REDIS_URL unset) a bump
+only reaches the process that made it; other processes keep their
+compiled objects until restarted, so that case is logged as an error.
+When the shared cache is unreachable, processes keep serving the
+compiled objects they have and a failed bump is logged.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger('detection')
+
+VERSION_KEY_PREFIX = 'hack2drug:version:'
+
+# Cache backends that are not shared between processes.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_local_cache_checked = False
+
+
+def check_shared_cache():
+    """Log an error once per process when version counters cannot be shared."""
+    global _local_cache_checked
+    if _local_cache_checked:
+        return
+    _local_cache_checked = True
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend in LOCAL_CACHE_BACKENDS:
+        logger.error(
+            'The default cache (%s) is local to this process: pattern and rule changes made '
+            'in other processes are not picked up until restart. Set CACHE_REDIS_URL.',
+            backend,
+        )
+
+
+def get_version(name):
+    """Return the shared version counter for ``name``, or None if the cache is unreachable."""
+    key = VERSION_KEY_PREFIX + name
+    try:
+        version = cache.get(key)
+        if version is None:
+            # Seed from the clock so an evicted counter never repeats an old value.
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            version = cache.get(key)
+    except Exception:
+        logger.warning('Could not read the %s cache version', name, exc_info=True)
+        return None
+    return version
+
+
+def bump_version(name):
+    """Increment the shared version counter for ``name``; returns None if the cache is unreachable."""
+    key = VERSION_KEY_PREFIX + name
+    try:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            version = int(time.time() * 1000)
+            cache.set(key, version, timeout=None)
+            return version
+    except Exception:
+        logger.error('Could not bump the %s cache version; other processes keep the old one', name, exc_info=True)
+        return None
+
+
+def bump_version_on_commit(name):
+    """Bump ``name`` once the current transaction commits."""
+    transaction.on_commit(lambda: bump_version(name))
+
+
+class VersionedCache:
+    """
+    Compiled object kept in-process and rebuilt when its version changes.
+    """
+
+    def __init__(self, name, builder, check_interval=None):
+        self.name = name
+        self.builder = builder
+        self.check_interval = check_interval
+        self._current = None  # (version, value)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def _interval(self):
+        if self.check_interval is not None:
+            return self.check_interval
+        return getattr(settings, 'DETECTION_CACHE_CHECK_INTERVAL', 1.0)
+
+    def _build(self, version):
+        check_shared_cache()
+        value = self.builder(version)
+        self._current = (version, value)
+        logger.info('Rebuilt %s cache at version %s', self.name, version)
+        return value
+
+    def _rebuild_in_background(self, version):
+        def run():
+            try:
+                self._build(version)
+            except Exception:
+                logger.exception('Failed to rebuild %s cache', self.name)
+            finally:
+                self._rebuilding = False
+                connection.close()
+
+        thread = threading.Thread(target=run, name=f'{self.name}-rebuild', daemon=True)
+        thread.start()
+
+    def get(self):
+        """Return the compiled object, scheduling a rebuild if it is stale."""
+        current = self._current
+        now = time.monotonic()
+        if current is not None and now - self._last_check < self._interval():
+            return current[1]
+
+        self._last_check = now
+        version = get_version(self.name)
+        if current is not None and (version is None or current[0] == version):
+            return current[1]
+
+        with self._lock:
+            current = self._current
+            if current is None:
+                return self._build(version)
+            if current[0] != version and not self._rebuilding:
+                self._rebuilding = True
+                self._rebuild_in_background(version)
+        return current[1]
+
+    def invalidate(self):
+        """Drop the local copy so the next get() rebuilds synchronously."""
+        self._current = None
+        self._last_check = 0.0
+
+
+def _build_pattern_set(version):
+    from .engine import load_active_patterns
+    return load_active_patterns(version=version)
+
+
+pattern_cache = VersionedCache('detection_patterns', _build_pattern_set)
+
+
+def get_pattern_set():
+    """Return the compiled set of active detection patterns."""
+    return pattern_cache.get()
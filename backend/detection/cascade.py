@@ -0,0 +1,120 @@
+"""
+Confidence cascade for the detection engine.
+
+CompiledPatternSet.scan_many() evaluates its patterns in tiers of
+increasing cost: keywords (one Aho-Corasick pass), then regexes, then
+ml_model classifiers. An item only reaches a tier when the cheaper tiers
+gave it some evidence: its best pattern confidence so far must be at
+least the tier's gate, DETECTION_CASCADE_GATES[tier] times the lowest
+confidence_threshold of the tier's patterns (capped at
+DETECTION_CONFIDENCE_THRESHOLD). Most collected content is clean, so
+heavy models run on a small fraction of it. A factor of 0 sends every
+item to the tier; a tier with no cheaper tier before it is never gated.
+
+The number of items each tier evaluates is counted per process and
+added to shared cache counters by the counter buffer's periodic flush;
+CascadeStats.totals() reports the pass-through rate of every tier.
+"""
+
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from hack2drug.counter_buffer import counter_buffer
+
+# Pattern types in evaluation order, cheapest first.
+CASCADE_STAGES = ('keyword', 'regex', 'ml_model')
+
+STATS_KEY_PREFIX = 'hack2drug:cascade:'
+
+
+def cascade_gates(specs):
+    """Return {stage: minimum confidence to reach it} for PatternSpecs."""
+    factors = settings.DETECTION_CASCADE_GATES
+    gates = {}
+    cheaper = False
+    for stage in CASCADE_STAGES:
+        thresholds = [spec.threshold for spec in specs if spec.pattern_type == stage]
+        if not thresholds:
+            continue
+        if cheaper:
+            minimum = min(thresholds + [settings.DETECTION_CONFIDENCE_THRESHOLD])
+            gates[stage] = factors.get(stage, 0.0) * minimum
+        else:
+            gates[stage] = 0.0
+        cheaper = True
+    return gates
+
+
+class CascadeStats:
+    """
+    Per-process counts of items scanned and items evaluated per stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, counts):
+        """Add a scan_many() ``stats`` Counter ({'items': n, stage: n, ...})."""
+        if not counts:
+            return
+        with self._lock:
+            self._counts.update(counts)
+        if counter_buffer.is_enabled():
+            counter_buffer.start()
+        else:
+            self.flush()
+
+    def snapshot(self):
+        """Return pending (unflushed) counts."""
+        with self._lock:
+            return dict(self._counts)
+
+    def flush(self):
+        """Add pending counts to the shared cache counters."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        pending = dict(counts)
+        try:
+            for name, count in counts.items():
+                key = STATS_KEY_PREFIX + name
+                cache.add(key, 0, timeout=None)
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    # Evicted between add() and incr()
+                    cache.set(key, count, timeout=None)
+                del pending[name]
+        except Exception:
+            # Put back the counts not written yet so the next flush retries them.
+            with self._lock:
+                self._counts.update(pending)
+            raise
+
+    def totals(self):
+        """Shared and pending counts with the pass-through rate of every stage."""
+        names = ('items',) + CASCADE_STAGES
+        shared = cache.get_many([STATS_KEY_PREFIX + name for name in names])
+        pending = self.snapshot()
+        counts = {
+            name: shared.get(STATS_KEY_PREFIX + name, 0) + pending.get(name, 0) for name in names
+        }
+        items = counts['items']
+        return {
+            'items': items,
+            'stages': [
+                {
+                    'stage': stage,
+                    'evaluated': counts[stage],
+                    'pass_through': round(counts[stage] / items, 6) if items else 0.0,
+                }
+                for stage in CASCADE_STAGES
+            ],
+        }
+
+
+cascade_stats = CascadeStats()
+counter_buffer.add_flusher(cascade_stats.flush)
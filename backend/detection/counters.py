@@ -0,0 +1,126 @@
+"""
+Counter bookkeeping for detection statistics.
+
+Maps detections onto the Platform.total_detections and daily
+DetectionAnalytics counters. The resulting deltas go through the
+write-behind counter buffer, which applies them as F() increments
+in periodic batches instead of one full-row save per detection.
+"""
+
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from hack2drug.counter_buffer import counter_buffer
+from .models import Platform, DetectionAnalytics, DetectionResult
+
+PLATFORM_COUNTER_FIELDS = {
+    'telegram': 'telegram_detections',
+    'instagram': 'instagram_detections',
+    'whatsapp': 'whatsapp_detections',
+    'twitter': 'twitter_detections',
+}
+
+SEVERITY_COUNTER_FIELDS = {
+    'low': 'low_severity',
+    'medium': 'medium_severity',
+    'high': 'high_severity',
+    'critical': 'critical_severity',
+}
+
+STATUS_COUNTER_FIELDS = {
+    'pending': 'pending_review',
+    'confirmed': 'confirmed',
+    'false_positive': 'false_positives',
+    'escalated': 'escalated',
+}
+
+
+def analytics_fields(platform_type, severity_level, status):
+    """Return the DetectionAnalytics fields one detection increments."""
+    fields = [PLATFORM_COUNTER_FIELDS.get(platform_type, 'other_detections')]
+    if severity_level in SEVERITY_COUNTER_FIELDS:
+        fields.append(SEVERITY_COUNTER_FIELDS[severity_level])
+    if status in STATUS_COUNTER_FIELDS:
+        fields.append(STATUS_COUNTER_FIELDS[status])
+    return fields
+
+
+def count_detections(detections, platform_types):
+    """
+    Aggregate counter deltas for an iterable of DetectionResult instances.
+
+    ``platform_types`` maps platform id to platform_type. Returns
+    (platform_deltas, analytics_deltas) as Counters.
+    """
+    platform_deltas = Counter()
+    analytics_deltas = Counter()
+    for detection in detections:
+        platform_deltas[detection.platform_id] += 1
+        analytics_deltas.update(analytics_fields(
+            platform_types.get(detection.platform_id),
+            detection.severity_level,
+            detection.status,
+        ))
+    return platform_deltas, analytics_deltas
+
+
+def record_detection_counts(platform_deltas, analytics_deltas, date=None):
+    """
+    Queue aggregated deltas on the write-behind counter buffer.
+
+    Deltas are handed over once the current transaction commits, and the
+    buffer later applies them as atomic F() increments.
+    """
+    date = date or timezone.now().date()
+    platform_deltas = dict(platform_deltas)
+    analytics_deltas = {field: count for field, count in analytics_deltas.items() if count}
+
+    def enqueue():
+        for platform_id, count in platform_deltas.items():
+            counter_buffer.increment(Platform, {'pk': platform_id}, {'total_detections': count})
+        if analytics_deltas:
+            counter_buffer.increment(
+                DetectionAnalytics, {'date': date}, analytics_deltas, create=True
+            )
+
+    transaction.on_commit(enqueue)
+
+
+def rebuild_daily_analytics(date):
+    """
+    Recompute the DetectionAnalytics row of one (UTC) day from
+    DetectionResult, replacing whatever the incremental counters hold.
+
+    Meant for days that are over: deltas of that day still buffered in
+    other processes would be applied on top of the rebuilt row.
+    """
+    start = datetime.combine(date, time.min, tzinfo=dt_timezone.utc)
+    detections = DetectionResult.objects.filter(
+        detected_at__gte=start, detected_at__lt=start + timedelta(days=1)
+    )
+    counts = Counter()
+    rows = detections.values('platform__platform_type', 'severity_level', 'status').annotate(
+        count=Count('id')
+    ).order_by()
+    for row in rows:
+        for field in analytics_fields(row['platform__platform_type'], row['severity_level'], row['status']):
+            counts[field] += row['count']
+    totals = detections.aggregate(total=Count('id'), confidence=Avg('confidence_score'))
+    total = totals['total']
+
+    fields = {
+        field: counts[field]
+        for field in [
+            *PLATFORM_COUNTER_FIELDS.values(), 'other_detections',
+            *SEVERITY_COUNTER_FIELDS.values(), *STATUS_COUNTER_FIELDS.values(),
+        ]
+    }
+    fields['avg_confidence_score'] = totals['confidence'] or 0.0
+    fields['detection_rate'] = total / 24
+    fields['false_positive_rate'] = counts['false_positives'] / total if total else 0.0
+    analytics, created = DetectionAnalytics.objects.update_or_create(date=date, defaults=fields)
+    return analytics
@@ -0,0 +1,434 @@
+"""
+Compiled multi-pattern matching engine for Hack2Drug detection.
+
+All active keyword patterns are compiled into a single Aho-Corasick
+automaton, so a message is scanned once regardless of how many keyword
+DetectionPattern rows exist. Regex patterns are joined into a single
+alternation that rules out messages none of them can match; messages it
+does match are confirmed against each expression.
+ml_model patterns are scikit-learn classifiers (detection.ml); they are
+evaluated per batch of messages rather than per message (scan_many), and
+only for messages the cheaper patterns flagged (detection.cascade).
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import namedtuple, deque
+
+from django.conf import settings
+
+from .cascade import cascade_gates
+from .ml import load_model
+from .normalization import normalize_text
+
+logger = logging.getLogger('detection')
+
+# Evidence contributed by each distinct term/expression that matched.
+# Pattern confidence is combined noisy-OR style: 1 - (1 - weight) ** hits.
+# One term reaches the default confidence_threshold (0.7), two reach 0.91.
+KEYWORD_TERM_WEIGHT = 0.7
+REGEX_MATCH_WEIGHT = 0.8
+
+# A single matched term or expression inside a message. ``normalized``
+# matches were found in the de-obfuscated text, so their offsets index
+# normalize_text(text) rather than the original.
+Match = namedtuple('Match', ['term', 'start', 'end', 'normalized'], defaults=(False,))
+
+# All matches for one pattern in one message.
+PatternHit = namedtuple('PatternHit', [
+    'pattern_id', 'name', 'pattern_type', 'confidence', 'threshold',
+    'category_ids', 'matches',
+])
+
+# Everything the engine needs to know about a pattern, detached from the ORM.
+# ``min_probability`` is the hit threshold of a registered ml_model version.
+PatternSpec = namedtuple('PatternSpec', [
+    'id', 'name', 'pattern_type', 'terms', 'weight', 'threshold',
+    'priority', 'category_ids', 'min_probability',
+], defaults=(None,))
+
+
+def spec_fingerprint(specs):
+    """Content hash of PatternSpecs, equal for equal patterns in any process."""
+    canonical = sorted(
+        spec._replace(category_ids=tuple(sorted(spec.category_ids))) for spec in specs
+    )
+    return hashlib.sha1(repr(canonical).encode('utf-8')).hexdigest()
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a fixed set of lowercase terms.
+    """
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for index, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        # Breadth-first construction of failure links.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def __len__(self):
+        return len(self.terms)
+
+    def iter(self, text):
+        """Yield (term_index, start, end) for every occurrence in text."""
+        goto, fail, output, terms = self._goto, self._fail, self._output, self.terms
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term_index in output[state]:
+                end = position + 1
+                yield term_index, end - len(terms[term_index]), end
+
+
+def parse_pattern_terms(pattern_type, pattern_data):
+    """
+    Extract the list of terms (keywords or expressions) from pattern_data.
+
+    pattern_data may be a JSON list, a JSON object with a ``keywords``,
+    ``terms``, ``regex`` or ``patterns`` key, or plain text. Plain keyword
+    text is comma separated; plain regex text is a single expression.
+    Returns (terms, options) where options holds any extra JSON keys.
+    """
+    options = {}
+    try:
+        data = json.loads(pattern_data)
+    except (TypeError, ValueError):
+        data = pattern_data
+
+    if isinstance(data, dict):
+        options = data
+        for key in ('keywords', 'terms', 'regex', 'patterns', 'pattern', 'model'):
+            if key in data:
+                data = data[key]
+                break
+        else:
+            data = []
+
+    if isinstance(data, str):
+        data = data.split(',') if pattern_type == 'keyword' else [data]
+    elif not isinstance(data, list):
+        data = [str(data)]
+
+    terms = []
+    for term in data:
+        term = str(term).strip()
+        if pattern_type == 'keyword':
+            term = term.lower()
+        if term and term not in terms:
+            terms.append(term)
+    return terms, options
+
+
+def pattern_spec(pattern, category_ids=None):
+    """Build a PatternSpec from a DetectionPattern instance."""
+    terms, options = parse_pattern_terms(pattern.pattern_type, pattern.pattern_data)
+    min_probability = None
+    if pattern.pattern_type == 'ml_model' and pattern.model_version_id:
+        terms = [pattern.model_version.artifact]
+        min_probability = pattern.model_version.threshold
+    default_weight = KEYWORD_TERM_WEIGHT if pattern.pattern_type == 'keyword' else REGEX_MATCH_WEIGHT
+    if category_ids is None:
+        category_ids = [category.id for category in pattern.drug_categories.all()]
+    return PatternSpec(
+        id=pattern.id,
+        name=pattern.name,
+        pattern_type=pattern.pattern_type,
+        terms=tuple(terms),
+        weight=float(options.get('weight', default_weight)),
+        threshold=pattern.confidence_threshold,
+        priority=pattern.priority,
+        category_ids=tuple(category_ids),
+        min_probability=min_probability,
+    )
+
+
+class CompiledPatternSet:
+    """
+    All keyword and regex patterns compiled for single-pass scanning.
+
+    Keyword patterns share one Aho-Corasick automaton; each automaton term
+    maps back to every pattern that lists it. Regex patterns are joined
+    into one alternation used only as a prefilter: a single search rules
+    out texts no expression matches, and texts it matches are scanned
+    with every expression on its own, so matches that overlap (or share
+    a span) are reported for each pattern. Expressions that carry their
+    own capture groups or flags cannot be safely merged and are always
+    scanned individually. ml_model patterns keep their loaded model; its
+    probability is the pattern's confidence.
+    """
+
+    def __init__(self, specs, version=None):
+        specs = list(specs)
+        self.version = version
+        self.specs = {spec.id: spec for spec in specs}
+        self.fingerprint = spec_fingerprint(specs)
+
+        keyword_specs = [spec for spec in specs if spec.pattern_type == 'keyword']
+        regex_specs = sorted(
+            (spec for spec in specs if spec.pattern_type == 'regex'),
+            key=lambda spec: -spec.priority,
+        )
+
+        # Keyword automaton
+        term_index = {}
+        self._term_owners = []
+        for spec in keyword_specs:
+            for term in spec.terms:
+                if term not in term_index:
+                    term_index[term] = len(self._term_owners)
+                    self._term_owners.append([])
+                self._term_owners[term_index[term]].append(spec.id)
+        self._automaton = AhoCorasick(term_index) if term_index else None
+
+        # Regex prefilter alternation
+        alternatives = []
+        self._prefiltered = []
+        self._standalone = []
+        for spec in regex_specs:
+            for expression in spec.terms:
+                try:
+                    compiled = re.compile(expression, re.IGNORECASE)
+                except re.error as exc:
+                    logger.warning('Skipping invalid regex in pattern %s: %s', spec.id, exc)
+                    continue
+                if compiled.groups or expression.lstrip().startswith('(?'):
+                    self._standalone.append((spec.id, compiled))
+                    continue
+                self._prefiltered.append((spec.id, compiled))
+                alternatives.append(f'(?:{expression})')
+        self._regex = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+
+        # Classifiers
+        self._models = []
+        for spec in specs:
+            if spec.pattern_type != 'ml_model' or not spec.terms:
+                continue
+            try:
+                self._models.append((spec.id, load_model(spec.terms[0])))
+            except Exception as exc:
+                logger.warning('Skipping ML pattern %s, model %s not loaded: %s', spec.id, spec.terms[0], exc)
+
+        # Cascade gates, counting only classifiers that did load
+        loaded = {pattern_id for pattern_id, model in self._models}
+        self.gates = cascade_gates(
+            [spec for spec in specs if spec.pattern_type != 'ml_model' or spec.id in loaded]
+        )
+
+    def __len__(self):
+        return len(self.specs)
+
+    @property
+    def keyword_count(self):
+        return len(self._term_owners)
+
+    @property
+    def regex_count(self):
+        return len(self._prefiltered) + len(self._standalone)
+
+    @property
+    def model_count(self):
+        return len(self._models)
+
+    def scan_keywords(self, text):
+        """Return {pattern_id: [Match, ...]} for keyword patterns."""
+        found = {}
+        if not self._automaton or not text:
+            return found
+        lowered = text.lower()
+        length = len(lowered)
+        for term_index, start, end in self._automaton.iter(lowered):
+            if start > 0 and _is_word_char(lowered[start - 1]):
+                continue
+            if end < length and _is_word_char(lowered[end]):
+                continue
+            term = self._automaton.terms[term_index]
+            for pattern_id in self._term_owners[term_index]:
+                found.setdefault(pattern_id, []).append(Match(term, start, end))
+        return found
+
+    def scan_regex(self, text):
+        """Return {pattern_id: [Match, ...]} for regex patterns."""
+        found = {}
+        if not text:
+            return found
+        candidates = [(pattern_id, compiled, 0) for pattern_id, compiled in self._standalone]
+        first = self._regex.search(text) if self._regex is not None else None
+        if first is not None:
+            # No merged expression can match before the alternation's first match.
+            candidates[:0] = [(pattern_id, compiled, first.start()) for pattern_id, compiled in self._prefiltered]
+        for pattern_id, compiled, start in candidates:
+            for match in compiled.finditer(text, start):
+                found.setdefault(pattern_id, []).append(
+                    Match(match.group(), match.start(), match.end())
+                )
+        return found
+
+    def predict(self, texts):
+        """Return {pattern_id: probability array} for the ml_model patterns."""
+        return {pattern_id: model.predict(texts) for pattern_id, model in self._models}
+
+    def match_confidence(self, pattern_id, matches):
+        """Confidence of a keyword or regex pattern given its matches."""
+        distinct = len({match.term.lower() for match in matches})
+        confidence = 1.0 - (1.0 - self.specs[pattern_id].weight) ** distinct
+        return round(min(1.0, confidence), 4)
+
+    def best_confidence(self, found):
+        """Highest match_confidence() in {pattern_id: matches}."""
+        return max(
+            (self.match_confidence(pattern_id, matches) for pattern_id, matches in found.items()),
+            default=0.0,
+        )
+
+    def hits(self, found, probabilities=None):
+        """
+        Turn {pattern_id: matches} and {pattern_id: probability} into
+        PatternHits, best first.
+        """
+        results = []
+        for pattern_id, probability in (probabilities or {}).items():
+            spec = self.specs[pattern_id]
+            minimum = spec.min_probability
+            if probability < (settings.ML_HIT_MIN_PROBABILITY if minimum is None else minimum):
+                continue
+            results.append(PatternHit(
+                pattern_id=pattern_id,
+                name=spec.name,
+                pattern_type=spec.pattern_type,
+                confidence=round(float(probability), 4),
+                threshold=spec.threshold,
+                category_ids=spec.category_ids,
+                matches=[],
+            ))
+        for pattern_id, matches in found.items():
+            spec = self.specs[pattern_id]
+            results.append(PatternHit(
+                pattern_id=pattern_id,
+                name=spec.name,
+                pattern_type=spec.pattern_type,
+                confidence=self.match_confidence(pattern_id, matches),
+                threshold=spec.threshold,
+                category_ids=spec.category_ids,
+                matches=matches,
+            ))
+        results.sort(key=lambda hit: (-hit.confidence, -self.specs[hit.pattern_id].priority))
+        return results
+
+    def scan_normalized(self, text, found):
+        """Add keyword matches that only appear once text is de-obfuscated."""
+        normalized = normalize_text(text)
+        if not normalized or normalized == text.lower():
+            return found
+        for pattern_id, matches in self.scan_keywords(normalized).items():
+            seen = {match.term for match in found.get(pattern_id, ())}
+            extra = [match._replace(normalized=True) for match in matches if match.term not in seen]
+            if extra:
+                found.setdefault(pattern_id, []).extend(extra)
+        return found
+
+    def scan_many(self, texts, normalize=False, stats=None):
+        """
+        Scan a batch of texts through the cascade of keyword, regex and
+        ml_model stages (detection.cascade). Returns a list of (hits,
+        probabilities) per text; probabilities maps each ml_model pattern
+        to its score for the texts that reached the ml_model stage.
+        ``stats``, a Counter, receives the number of items and the
+        number evaluated by each stage.
+        """
+        texts = list(texts)
+        found = [{} for text in texts]
+        best = [0.0] * len(texts)
+        probabilities = [{} for text in texts]
+        if stats is not None:
+            stats['items'] += len(texts)
+
+        def reaching(stage):
+            gate = self.gates.get(stage)
+            if gate is None:
+                return []
+            selected = [index for index in range(len(texts)) if best[index] >= gate]
+            if stats is not None:
+                stats[stage] += len(selected)
+            return selected
+
+        for index in reaching('keyword'):
+            text = texts[index]
+            found[index] = self.scan_keywords(text)
+            if normalize and self._automaton and text:
+                self.scan_normalized(text, found[index])
+            best[index] = self.best_confidence(found[index])
+
+        for index in reaching('regex'):
+            for pattern_id, matches in self.scan_regex(texts[index]).items():
+                found[index].setdefault(pattern_id, []).extend(matches)
+            best[index] = self.best_confidence(found[index])
+
+        selected = reaching('ml_model')
+        if selected:
+            predicted = self.predict([texts[index] for index in selected])
+            for position, index in enumerate(selected):
+                probabilities[index] = {
+                    pattern_id: float(values[position]) for pattern_id, values in predicted.items()
+                }
+
+        return [(self.hits(found[index], probabilities[index]), probabilities[index]) for index in range(len(texts))]
+
+    def scan(self, text, normalize=False):
+        """Scan text once with every compiled pattern."""
+        return self.scan_many([text], normalize)[0][0]
+
+
+def matched_terms(hits):
+    """Sorted distinct lowercased terms matched by ``hits``."""
+    return sorted({match.term.lower() for hit in hits for match in hit.matches})
+
+
+def compile_patterns(patterns, version=None):
+    """Compile an iterable of DetectionPattern instances."""
+    return CompiledPatternSet([pattern_spec(pattern) for pattern in patterns], version=version)
+
+
+def load_active_patterns(version=None):
+    """Compile every active keyword, regex and ml_model DetectionPattern."""
+    from .models import DetectionPattern
+
+    patterns = DetectionPattern.objects.filter(
+        is_active=True, pattern_type__in=['keyword', 'regex', 'ml_model']
+    ).select_related('model_version').prefetch_related('drug_categories')
+    return compile_patterns(patterns, version=version)
@@ -0,0 +1,77 @@
+"""
+Stateless text features for ML detection models.
+
+The default featurizer is a HashingVectorizer over character n-grams
+(``char_wb``) of normalize_text() output plus the emoji and other
+symbols normalization drops, so "c0ca1ne", "m.d.m.a" and a row of 🍁 or
+❄️ all produce useful features. Hashing needs no fitted vocabulary:
+memory is fixed at 2**20 columns however much content a model is
+trained on, every process builds the identical transform from its name
+alone, and new content never requires refitting it (classifiers with
+partial_fit can keep learning from transform_batches() over a stream).
+
+Feature sets are named. A model records the name it was trained with
+(MLModelVersion.feature_set); parameters of an existing name must never
+change, because the hashed columns would silently shift under already
+trained models. Add a new name instead.
+"""
+
+import threading
+import unicodedata
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from .normalization import normalize_text
+
+FEATURE_SETS = {
+    'hashed-char-v1': {'analyzer': 'char_wb', 'ngram_range': (2, 5), 'n_features': 2 ** 20},
+}
+
+
+def prepare_text(text):
+    """normalize_text() followed by the symbols (emoji) it removes."""
+    if not text:
+        return ''
+    symbols = ''.join(char for char in text if unicodedata.category(char) == 'So')
+    normalized = normalize_text(text)
+    return f'{normalized} {symbols}' if symbols else normalized
+
+
+_featurizers = {}
+_lock = threading.Lock()
+
+
+def get_featurizer(feature_set=None):
+    """Return the (stateless, shared) vectorizer of ``feature_set``, ML_DEFAULT_FEATURE_SET by default."""
+    feature_set = feature_set or settings.ML_DEFAULT_FEATURE_SET
+    featurizer = _featurizers.get(feature_set)
+    if featurizer is not None:
+        return featurizer
+    if feature_set not in FEATURE_SETS:
+        raise ValueError(f'Unknown feature set {feature_set!r}')
+    with _lock:
+        featurizer = _featurizers.get(feature_set)
+        if featurizer is None:
+            featurizer = HashingVectorizer(
+                preprocessor=prepare_text,
+                alternate_sign=False,
+                dtype=np.float32,
+                **FEATURE_SETS[feature_set],
+            )
+            _featurizers[feature_set] = featurizer
+    return featurizer
+
+
+def transform_batches(texts, batch_size=None, feature_set=None):
+    """Yield a feature matrix per ML_BATCH_SIZE texts of any iterable, e.g. a queryset iterator."""
+    batch_size = batch_size or settings.ML_BATCH_SIZE
+    featurizer = get_featurizer(feature_set)
+    texts = iter(texts)
+    while True:
+        batch = [text or '' for text in islice(texts, batch_size)]
+        if not batch:
+            return
+        yield featurizer.transform(batch)
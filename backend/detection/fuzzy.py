@@ -0,0 +1,295 @@
+"""
+Trigram index for fuzzy search over obfuscated content.
+
+Collected content is normalized (see detection.normalization) and stored
+in a trigram index: an FTS5 ``trigram`` table on SQLite, a pg_trgm GIN
+index on PostgreSQL. Queries are normalized the same way and scored by
+trigram coverage, the fraction of the query's trigrams found in a
+document, so "c0ca1ne" finds "cocaine" and "m.d.m.a" finds "mdma".
+
+On SQLite candidates are fetched with prefix filtering: a document that
+reaches coverage t must contain at least one of any |Q| - ceil(t|Q|) + 1
+query trigrams, so only that many of the rarest trigrams (by fts5vocab
+document frequency) are looked up. Posting lists stay short and the
+exact coverage is computed only for the candidates, at most
+FUZZY_SEARCH_CANDIDATE_LIMIT of them in bm25 rank order.
+
+Filters of the searched queryset are applied inside the candidate query,
+so the candidate and result limits only count rows the caller can get.
+"""
+
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from .normalization import normalize_text, trigrams
+
+# Model label -> (index table, source column)
+TRIGRAM_INDEXES = {
+    'monitoring.CollectedContent': ('monitoring_collectedcontent_trgm', 'content_text'),
+}
+
+
+def _index_for(model):
+    return TRIGRAM_INDEXES[model._meta.label]
+
+
+def coverage(query_grams, text):
+    """Fraction of query trigrams present in a normalized text."""
+    if not query_grams:
+        return 0.0
+    return len(query_grams & trigrams(text)) / len(query_grams)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _restriction(queryset, column):
+    """
+    Return ('AND <column> IN (<subquery>)', params) limiting an index
+    query to the rows of a filtered queryset, or ('', []).
+    """
+    if queryset is None or not queryset.query.has_filters():
+        return '', []
+    sql, params = queryset.order_by().values_list('pk', flat=True).query.sql_with_params()
+    return f'AND {column} IN ({sql})', list(params)
+
+
+class BaseTrigramIndex:
+    """
+    Interface for trigram index backends.
+    """
+
+    def index(self, model, objects):
+        """Add or replace the normalized text of objects."""
+        raise NotImplementedError
+
+    def remove(self, model, pks):
+        """Drop rows from the index."""
+        raise NotImplementedError
+
+    def candidates(self, model, normalized_query, threshold, limit, queryset=None):
+        """
+        Return [(pk, similarity), ...] best first, only of rows in
+        ``queryset`` when given.
+        """
+        raise NotImplementedError
+
+    def install(self, schema_editor, model):
+        """Create the index for model (called from migrations)."""
+
+    def uninstall(self, schema_editor, model):
+        """Drop the index for model (called from migrations)."""
+
+    def rebuild(self, model, batch_size=1000):
+        """Index every existing row of model."""
+        table, column = _index_for(model)
+        queryset = model._base_manager.only('pk', column).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            self.index(model, batch)
+            last_pk = batch[-1].pk
+
+
+class NullTrigramIndex(BaseTrigramIndex):
+    """
+    Fallback for databases without trigram support: scans in Python.
+    """
+
+    def index(self, model, objects):
+        pass
+
+    def remove(self, model, pks):
+        pass
+
+    def candidates(self, model, normalized_query, threshold, limit, queryset=None):
+        table, column = _index_for(model)
+        grams = trigrams(normalized_query)
+        results = []
+        rows = queryset if queryset is not None else model._base_manager.all()
+        for pk, text in rows.order_by().values_list('pk', column).iterator():
+            similarity = coverage(grams, normalize_text(text))
+            if similarity >= threshold:
+                results.append((pk, similarity))
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+
+
+class SQLiteTrigramIndex(BaseTrigramIndex):
+    """
+    FTS5 trigram tokenizer with fts5vocab-driven prefix filtering.
+    """
+
+    def install(self, schema_editor, model):
+        table, column = _index_for(model)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"normalized, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_vocab "
+            f"USING fts5vocab({table}, 'row')"
+        )
+
+    def uninstall(self, schema_editor, model):
+        table, column = _index_for(model)
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_vocab')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def index(self, model, objects):
+        table, column = _index_for(model)
+        rows = [(obj.pk, normalize_text(getattr(obj, column))) for obj in objects]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk, text in rows])
+            cursor.executemany(f'INSERT INTO {table}(rowid, normalized) VALUES (%s, %s)', rows)
+
+    def remove(self, model, pks):
+        table, column = _index_for(model)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk in pks])
+
+    def candidates(self, model, normalized_query, threshold, limit, queryset=None):
+        table, column = _index_for(model)
+        grams = trigrams(normalized_query)
+        if not grams:
+            return []
+        restriction, restriction_params = _restriction(queryset, 'rowid')
+
+        with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(grams))
+            cursor.execute(
+                f'SELECT term, doc FROM {table}_vocab WHERE term IN ({placeholders})',
+                list(grams),
+            )
+            frequency = dict(cursor.fetchall())
+
+            needed = len(grams) - math.ceil(threshold * len(grams)) + 1
+            probes = sorted(grams, key=lambda gram: frequency.get(gram, 0))[:max(needed, 1)]
+            probes = [gram for gram in probes if frequency.get(gram)]
+            if not probes:
+                return []
+
+            expression = ' OR '.join('"{}"'.format(gram.replace('"', '""')) for gram in probes)
+            # Best bm25 rank first, so the limit keeps the strongest candidates.
+            cursor.execute(
+                f'SELECT rowid, normalized FROM {table} WHERE {table} MATCH %s {restriction} '
+                f'ORDER BY rank LIMIT %s',
+                [expression, *restriction_params, _setting('FUZZY_SEARCH_CANDIDATE_LIMIT', 5000)],
+            )
+            rows = cursor.fetchall()
+
+        results = []
+        for pk, text in rows:
+            similarity = coverage(grams, text)
+            if similarity >= threshold:
+                results.append((pk, round(similarity, 4)))
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+
+
+class PostgresTrigramIndex(BaseTrigramIndex):
+    """
+    pg_trgm word_similarity over a side table of normalized text.
+    """
+
+    def install(self, schema_editor, model):
+        table, column = _index_for(model)
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (id bigint PRIMARY KEY, normalized text NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_gin ON {table} USING GIN (normalized gin_trgm_ops)'
+        )
+
+    def uninstall(self, schema_editor, model):
+        table, column = _index_for(model)
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def index(self, model, objects):
+        table, column = _index_for(model)
+        rows = [(obj.pk, normalize_text(getattr(obj, column))) for obj in objects]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (id, normalized) VALUES (%s, %s) '
+                f'ON CONFLICT (id) DO UPDATE SET normalized = EXCLUDED.normalized',
+                rows,
+            )
+
+    def remove(self, model, pks):
+        table, column = _index_for(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s)', [list(pks)])
+
+    def candidates(self, model, normalized_query, threshold, limit, queryset=None):
+        table, column = _index_for(model)
+        restriction, restriction_params = _restriction(queryset, 'id')
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(threshold)],
+            )
+            cursor.execute(
+                f'SELECT id, word_similarity(%s, normalized) AS similarity FROM {table} '
+                f'WHERE %s <% normalized {restriction} ORDER BY similarity DESC LIMIT %s',
+                [normalized_query, normalized_query, *restriction_params, limit],
+            )
+            return [(pk, round(similarity, 4)) for pk, similarity in cursor.fetchall()]
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteTrigramIndex,
+    'postgresql': PostgresTrigramIndex,
+}
+
+
+def get_trigram_index(vendor=None):
+    """Return the configured trigram index, defaulting by database vendor."""
+    backend_path = getattr(settings, 'FUZZY_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return VENDOR_BACKENDS.get(vendor or connection.vendor, NullTrigramIndex)()
+
+
+def index_objects(objects):
+    """Add objects (all of one model) to the trigram index."""
+    objects = list(objects)
+    if objects:
+        get_trigram_index().index(type(objects[0]), objects)
+
+
+def fuzzy_search(queryset, query, threshold=None, limit=100):
+    """
+    Return up to ``limit`` rows of queryset similar to query, best first.
+
+    Each returned instance carries a ``similarity`` attribute. The
+    queryset's filters restrict the candidates in the index query itself.
+    """
+    threshold = threshold if threshold is not None else _setting('FUZZY_SEARCH_THRESHOLD', 0.6)
+    normalized = normalize_text(query)
+    if not normalized:
+        return []
+    model = queryset.model
+    scored = get_trigram_index().candidates(model, normalized, threshold, limit, queryset=queryset)
+    if not scored:
+        return []
+    objects = queryset.in_bulk([pk for pk, similarity in scored])
+    results = []
+    for pk, similarity in scored:
+        obj = objects.get(pk)
+        if obj is not None:
+            obj.similarity = similarity
+            results.append(obj)
+            if len(results) >= limit:
+                break
+    return results
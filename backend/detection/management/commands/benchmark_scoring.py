@@ -0,0 +1,74 @@
+"""
+Measure detection scoring throughput in-process and with worker pools.
+"""
+
+import time
+from collections import Counter
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.cache import get_pattern_set
+from detection.cascade import CASCADE_STAGES
+from detection.parallel import ScoringPool
+from monitoring.models import CollectedContent
+
+
+class Command(BaseCommand):
+    help = (
+        'Score a sample of collected content against the active patterns '
+        'in-process and with each given number of worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--texts', type=int, default=20000, help='Texts scored per run.')
+        parser.add_argument('--workers', type=int, nargs='+', default=[2, 4],
+                            help='Worker process counts to compare against in-process scoring.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        sample = list(
+            CollectedContent.objects.order_by('-pk').values_list('content_text', flat=True)[:options['texts']]
+        )
+        if not sample:
+            raise CommandError('No collected content to score.')
+        texts = list(islice(cycle(sample), options['texts']))
+        pattern_set = get_pattern_set()
+        self.stdout.write(
+            f'{len(texts)} texts, {len(pattern_set)} patterns '
+            f'({pattern_set.model_count} ml_model) at version {pattern_set.version}'
+        )
+
+        stats = Counter()
+        started = time.monotonic()
+        expected = pattern_set.scan_many(texts, normalize=settings.DETECTION_NORMALIZE_TEXT, stats=stats)
+        baseline = time.monotonic() - started
+        self._report('in-process', len(texts), baseline, baseline)
+        for stage in CASCADE_STAGES:
+            if stage in pattern_set.gates:
+                evaluated = stats[stage]
+                self.stdout.write(
+                    f'{stage:>12}: gate {pattern_set.gates[stage]:.2f}, '
+                    f'{evaluated} texts evaluated ({evaluated / len(texts):.1%})'
+                )
+
+        for workers in options['workers']:
+            pool = ScoringPool(workers=workers, chunk_size=options['chunk_size'], min_texts=0)
+            try:
+                # Start the workers and compile their patterns outside the timing.
+                pool.scan_many(texts[:workers], pattern_set)
+                started = time.monotonic()
+                results = pool.scan_many(texts, pattern_set)
+                elapsed = time.monotonic() - started
+            finally:
+                pool.shutdown()
+            if [hits for hits, probabilities, keywords in results] != \
+                    [[hit._replace(matches=[]) for hit in hits] for hits, probabilities in expected]:
+                raise CommandError(f'{workers} workers returned different hits than in-process scoring')
+            self._report(f'{workers} workers', len(texts), elapsed, baseline)
+
+    def _report(self, label, count, elapsed, baseline):
+        self.stdout.write(
+            f'{label:>12}: {elapsed:.2f}s ({count / elapsed:.0f} texts/s, {baseline / elapsed:.2f}x)'
+        )
@@ -0,0 +1,18 @@
+"""
+Recompute hourly detection rollups from DetectionResult.
+"""
+
+from django.core.management.base import BaseCommand
+
+from hack2drug.counter_buffer import counter_buffer
+from detection.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DetectionRollup buckets from the DetectionResult table.'
+
+    def handle(self, *args, **options):
+        # Apply pending deltas first so they are not added on top of the rebuild.
+        counter_buffer.flush()
+        buckets = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} rollup buckets'))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionpattern',
+            name='match_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='detectionpattern',
+            name='scan_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
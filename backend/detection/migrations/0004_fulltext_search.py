@@ -0,0 +1,85 @@
+# Full-text search indexes for DetectionResult and CollectedContent.
+
+from django.db import migrations
+
+
+# Frozen copy of the DDL of detection.search as of this migration, so later
+# changes to that module do not change what it creates or drops.
+
+# (table, FTS5 table / index prefix)
+INDEXES = [
+    ('detection_detectionresult', 'detection_detectionresult_fts'),
+    ('monitoring_collectedcontent', 'monitoring_collectedcontent_fts'),
+]
+
+
+def sqlite_install(table, fts_table):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"content_text, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, content_text) VALUES (new.id, new.content_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, content_text) "
+        f"VALUES ('delete', old.id, old.content_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF content_text ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, content_text) "
+        f"VALUES ('delete', old.id, old.content_text); "
+        f"INSERT INTO {fts_table}(rowid, content_text) VALUES (new.id, new.content_text); END",
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_uninstall(table, fts_table):
+    return [
+        *[f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}' for suffix in ('ai', 'ad', 'au')],
+        f'DROP TABLE IF EXISTS {fts_table}',
+    ]
+
+
+def postgresql_install(table, fts_table):
+    return [
+        f'CREATE INDEX IF NOT EXISTS {fts_table}_gin ON {table} USING GIN '
+        f"(to_tsvector('english'::regconfig, COALESCE(content_text, '')))"
+    ]
+
+
+def postgresql_uninstall(table, fts_table):
+    return [f'DROP INDEX IF EXISTS {fts_table}_gin']
+
+
+STATEMENTS = {
+    'sqlite': (sqlite_install, sqlite_uninstall),
+    'postgresql': (postgresql_install, postgresql_uninstall),
+}
+
+
+def run_statements(schema_editor, position):
+    builders = STATEMENTS.get(schema_editor.connection.vendor)
+    if builders is None:
+        # Other databases search with LIKE and need no index.
+        return
+    for table, fts_table in INDEXES:
+        for statement in builders[position](table, fts_table):
+            schema_editor.execute(statement)
+
+
+def install_indexes(apps, schema_editor):
+    run_statements(schema_editor, 0)
+
+
+def uninstall_indexes(apps, schema_editor):
+    run_statements(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0003_pattern_usage_stats'),
+        ('monitoring', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_indexes, uninstall_indexes),
+    ]
@@ -0,0 +1,107 @@
+# Trigram index over normalized CollectedContent text for fuzzy search.
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+# Frozen copies of the DDL of detection.fuzzy and of
+# detection.normalization.normalize_text as of this migration, so later
+# changes to those modules do not change what it creates or indexes.
+
+TABLE = 'monitoring_collectedcontent_trgm'
+
+LEET_TABLE = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    '@': 'a', '$': 's', '!': 'i', '|': 'l', '+': 't', '€': 'e', '£': 'l',
+})
+LEET_TOKEN_RE = re.compile(r'[@$]?\w+(?:[@$!|+€£]+\w+)*')
+SPACED_LETTERS_RE = re.compile(r'(?<!\w)(?:\w[\s.\-_*/\\]){2,}\w(?!\w)')
+NON_WORD_RE = re.compile(r'[^\w]+')
+REPEAT_RE = re.compile(r'(\w)\1{2,}')
+
+
+def translate_leet(match):
+    token = match.group()
+    if sum(char.isalpha() for char in token) < 2:
+        return token
+    return token.translate(LEET_TABLE)
+
+
+def normalize_text(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = LEET_TOKEN_RE.sub(translate_leet, text.lower())
+    text = SPACED_LETTERS_RE.sub(lambda match: ''.join(char for char in match.group() if char.isalnum()), text)
+    text = REPEAT_RE.sub(r'\1\1', text)
+    text = NON_WORD_RE.sub(' ', text).replace('_', ' ')
+    return ' '.join(text.split())
+
+
+INSTALL = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(normalized, tokenize='trigram')",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}_vocab USING fts5vocab({TABLE}, 'row')",
+    ],
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'CREATE TABLE IF NOT EXISTS {TABLE} (id bigint PRIMARY KEY, normalized text NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {TABLE}_gin ON {TABLE} USING GIN (normalized gin_trgm_ops)',
+    ],
+}
+
+UNINSTALL = {
+    'sqlite': [f'DROP TABLE IF EXISTS {TABLE}_vocab', f'DROP TABLE IF EXISTS {TABLE}'],
+    'postgresql': [f'DROP TABLE IF EXISTS {TABLE}'],
+}
+
+
+def index_rows(cursor, vendor, rows):
+    if vendor == 'sqlite':
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(pk,) for pk, text in rows])
+        cursor.executemany(f'INSERT INTO {TABLE}(rowid, normalized) VALUES (%s, %s)', rows)
+    else:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (id, normalized) VALUES (%s, %s) '
+            f'ON CONFLICT (id) DO UPDATE SET normalized = EXCLUDED.normalized',
+            rows,
+        )
+
+
+def install_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in INSTALL:
+        # Other databases scan in Python and need no index.
+        return
+    for statement in INSTALL[vendor]:
+        schema_editor.execute(statement)
+
+    CollectedContent = apps.get_model('monitoring', 'CollectedContent')
+    queryset = CollectedContent._base_manager.order_by('pk').values_list('pk', 'content_text')
+    last_pk = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:1000])
+            if not batch:
+                break
+            index_rows(cursor, vendor, [(pk, normalize_text(text)) for pk, text in batch])
+            last_pk = batch[-1][0]
+
+
+def uninstall_index(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0004_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:13
+
+from django.db import migrations, models
+import django.db.models.functions
+import django.db.models.deletion
+from datetime import timezone
+
+
+def populate_rollups(apps, schema_editor):
+    DetectionResult = apps.get_model('detection', 'DetectionResult')
+    DetectionRollup = apps.get_model('detection', 'DetectionRollup')
+    rows = DetectionResult.objects.annotate(
+        hour=models.functions.TruncHour('detected_at', tzinfo=timezone.utc)
+    ).values(
+        'hour', 'platform_id', 'detection_pattern_id', 'severity_level', 'status'
+    ).annotate(count=models.Count('id'), confidence_sum=models.Sum('confidence_score')).order_by()
+    DetectionRollup.objects.bulk_create([DetectionRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('severity_level', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending Review'), ('reviewed', 'Reviewed'), ('confirmed', 'Confirmed'), ('false_positive', 'False Positive'), ('escalated', 'Escalated'), ('resolved', 'Resolved')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('detection_pattern', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='detection.detectionpattern')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='detection.platform')),
+            ],
+            options={
+                'verbose_name': 'Detection Rollup',
+                'verbose_name_plural': 'Detection Rollups',
+                'ordering': ['-hour'],
+                'indexes': [models.Index(fields=['hour'], name='detection_d_hour_ec0423_idx')],
+                'unique_together': {('hour', 'platform', 'detection_pattern', 'severity_level', 'status')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:52
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_detection_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MLModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('version', models.PositiveIntegerField()),
+                ('artifact', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('feature_set', models.CharField(blank=True, max_length=100)),
+                ('threshold', models.FloatField(default=0.5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)])),
+                ('trained_at', models.DateTimeField()),
+                ('metrics', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'ML Model Version',
+                'verbose_name_plural': 'ML Model Versions',
+                'ordering': ['name', '-version'],
+                'unique_together': {('name', 'version')},
+            },
+        ),
+        migrations.AddField(
+            model_name='detectionpattern',
+            name='model_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='patterns', to='detection.mlmodelversion'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+"""
+MinHash signatures and LSH banding for near-duplicate text.
+
+A text is reduced to the set of character shingles of its normalized
+form and summarised by a MinHash signature: for each of
+MINHASH_PERMUTATIONS hash functions, the smallest hash over the
+shingles. The share of equal positions in two signatures estimates the
+Jaccard similarity of the shingle sets, so "same ad with a different
+price" stays close while unrelated messages do not.
+
+Locality-sensitive hashing splits a signature into MINHASH_BANDS bands
+and hashes each band to a bucket. Texts with similarity s share at
+least one bucket with probability 1 - (1 - s^r)^b (r rows per band), so
+looking up a text's b buckets finds its near duplicates without
+comparing against every stored signature. With the defaults (16 bands
+of 8 rows) the curve turns at about 0.7.
+"""
+
+import hashlib
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .normalization import normalize_text
+
+# Hash functions are (a * x + b) mod p over 32-bit shingle hashes; with
+# a < 2**31 the product fits in 64 bits before the reduction.
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def shingles(text, size=None):
+    """Return the set of character shingles of an already normalized text."""
+    size = size or _setting('MINHASH_SHINGLE_SIZE', 5)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures and LSH bucket keys.
+
+    Instances with the same parameters produce identical signatures, so
+    stored signatures stay comparable across processes and restarts.
+    """
+
+    def __init__(self, num_perm=None, bands=None, seed=1):
+        self.num_perm = num_perm or _setting('MINHASH_PERMUTATIONS', 128)
+        self.bands = bands or _setting('MINHASH_BANDS', 16)
+        if self.num_perm % self.bands:
+            raise ValueError('MINHASH_PERMUTATIONS must be a multiple of MINHASH_BANDS')
+        self.rows = self.num_perm // self.bands
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, 1 << 31, size=self.num_perm).astype(np.uint64)
+        self.b = generator.randint(0, 1 << 31, size=self.num_perm).astype(np.uint64)
+
+    def signature(self, text):
+        """Return the uint32 signature of a raw text, or None if it has no shingles."""
+        grams = shingles(normalize_text(text))
+        if not grams:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(gram.encode('utf-8')) for gram in grams),
+            dtype=np.uint64, count=len(grams),
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def buckets(self, signature):
+        """Return one signed 64-bit bucket key per band."""
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(
+                rows.tobytes(), digest_size=8, person=band.to_bytes(4, 'little'),
+            ).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(first, second):
+        """Estimated Jaccard similarity of two signatures."""
+        return float(np.count_nonzero(first == second)) / len(first)
+
+    @staticmethod
+    def to_bytes(signature):
+        return signature.astype('<u4').tobytes()
+
+    @staticmethod
+    def from_bytes(data):
+        return np.frombuffer(bytes(data), dtype='<u4').astype(np.uint32)
+
+
+_hasher = None
+
+
+def get_minhasher():
+    """Return the process-wide MinHasher for the configured parameters."""
+    global _hasher
+    num_perm = _setting('MINHASH_PERMUTATIONS', 128)
+    bands = _setting('MINHASH_BANDS', 16)
+    if _hasher is None or (_hasher.num_perm, _hasher.bands) != (num_perm, bands):
+        _hasher = MinHasher(num_perm, bands)
+    return _hasher
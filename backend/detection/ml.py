@@ -0,0 +1,188 @@
+"""
+scikit-learn text classifiers for ``ml_model`` detection patterns.
+
+Models are registered in MLModelVersion: register_model() writes the
+artifact ``<name>/<version>.joblib`` under ML_MODEL_PATH together with
+its metadata (feature set, hit threshold, training date) and an
+ml_model pattern points at a version through ``model_version``. Patterns
+without one may still name an unversioned artifact ``<name>.joblib`` in
+``pattern_data`` (``{"model": "<name>"}`` or just the name); save_model()
+writes those. An artifact is a dict with a fitted ``classifier`` with
+predict_proba, the ``vectorizer`` turning texts into its feature matrix
+and optionally the ``positive_label`` of the drug-related class
+(default 1). Registered models default to the stateless hashed features
+of detection.features: they store only the ``feature_set`` name and the
+vectorizer is rebuilt from it on load.
+
+Artifacts are loaded the first time a pattern set needs them and kept
+until the file changes. They are stored uncompressed and loaded with
+joblib's ML_MODEL_MMAP_MODE, so NumPy arrays (coefficients, weights) are
+memory-mapped from the file: every process scoring with the same
+version shares one copy through the page cache. Objects that are not
+arrays, such as a fitted vocabulary, are still unpickled per process.
+preload_models() loads them in a parent process before it forks its
+workers (Celery's ``ml`` worker, see hack2drug.celery).
+
+Texts are classified in batches of ML_BATCH_SIZE: one transform and one
+predict_proba call per batch instead of per message, which is where
+scikit-learn's vectorized code pays off.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from functools import partial
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .features import get_featurizer
+
+logger = logging.getLogger('detection')
+
+REGISTER_ATTEMPTS = 3  # register_model() retries after losing a version number to a concurrent one
+
+
+class MLModel:
+    """
+    A loaded vectorizer and classifier pair.
+    """
+
+    def __init__(self, name, vectorizer, classifier, positive_label=1):
+        self.name = name
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        classes = list(classifier.classes_)
+        if positive_label not in classes:
+            raise ValueError(f'Model {name} has no class {positive_label!r}')
+        self.positive_index = classes.index(positive_label)
+
+    def predict(self, texts, batch_size=None):
+        """Probability of the positive class for each text, as a float32 array."""
+        batch_size = batch_size or settings.ML_BATCH_SIZE
+        texts = [text or '' for text in texts]
+        probabilities = np.empty(len(texts), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            features = self.vectorizer.transform(texts[start:start + batch_size])
+            probabilities[start:start + batch_size] = self.classifier.predict_proba(features)[:, self.positive_index]
+        return probabilities
+
+
+def model_path(name):
+    """Path of an artifact given its model name or its path relative to ML_MODEL_PATH."""
+    if name.endswith('.joblib'):
+        return settings.ML_MODEL_PATH / name
+    return settings.ML_MODEL_PATH / f'{name}.joblib'
+
+
+def _dump(path, vectorizer, classifier, positive_label, **metadata):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Uncompressed, so the arrays can be memory-mapped on load.
+    joblib.dump(
+        dict(metadata, vectorizer=vectorizer, classifier=classifier, positive_label=positive_label),
+        path,
+    )
+    return path
+
+
+def save_model(name, vectorizer, classifier, positive_label=1):
+    """Persist a fitted vectorizer and classifier as ML_MODEL_PATH/<name>.joblib."""
+    return _dump(model_path(name), vectorizer, classifier, positive_label)
+
+
+def register_model(name, classifier, vectorizer=None, feature_set=None, threshold=None,
+                   trained_at=None, positive_label=1, metrics=None, description=''):
+    """
+    Store a fitted classifier as the next version of ``name``; returns the
+    MLModelVersion. Without a ``vectorizer`` the classifier must have been
+    trained on get_featurizer(feature_set) output.
+    """
+    from .models import MLModelVersion
+
+    if vectorizer is None:
+        feature_set = feature_set or settings.ML_DEFAULT_FEATURE_SET
+        get_featurizer(feature_set)
+    feature_set = feature_set or ''
+    if threshold is None:
+        threshold = settings.ML_HIT_MIN_PROBABILITY
+    trained_at = trained_at or timezone.now()
+    # Written under a temporary name first and moved into place once the
+    # version row commits, so a version number lost to a concurrent
+    # registration never overwrites the winner's artifact.
+    temporary = settings.ML_MODEL_PATH / name / f'.{uuid.uuid4().hex}.tmp'
+    _dump(
+        temporary, vectorizer, classifier, positive_label,
+        feature_set=feature_set, threshold=threshold, trained_at=trained_at.isoformat(),
+    )
+    try:
+        for attempt in range(REGISTER_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    # Concurrent registrations queue on the latest version's
+                    # row; the first version of a name relies on the
+                    # unique (name, version) constraint and retries.
+                    latest = (
+                        MLModelVersion.objects.select_for_update()
+                        .filter(name=name).order_by('-version').first()
+                    )
+                    version = latest.version + 1 if latest else 1
+                    artifact = f'{name}/{version}.joblib'
+                    model_version = MLModelVersion.objects.create(
+                        name=name,
+                        version=version,
+                        artifact=artifact,
+                        description=description,
+                        feature_set=feature_set,
+                        threshold=threshold,
+                        trained_at=trained_at,
+                        metrics=metrics or {},
+                    )
+                    transaction.on_commit(partial(os.replace, temporary, model_path(artifact)))
+                return model_version
+            except IntegrityError:
+                if attempt == REGISTER_ATTEMPTS - 1:
+                    raise
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+_models = {}  # name -> (mtime, MLModel)
+_lock = threading.Lock()
+
+
+def load_model(name):
+    """Return the MLModel stored under ``name``, loading it at most once per file version."""
+    path = model_path(name)
+    mtime = path.stat().st_mtime
+    cached = _models.get(name)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _lock:
+        cached = _models.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        artifact = joblib.load(path, mmap_mode=settings.ML_MODEL_MMAP_MODE)
+        vectorizer = artifact['vectorizer']
+        if vectorizer is None:
+            vectorizer = get_featurizer(artifact['feature_set'])
+        model = MLModel(name, vectorizer, artifact['classifier'], artifact.get('positive_label', 1))
+        _models[name] = (mtime, model)
+        logger.info('Loaded ML model %s from %s', name, path)
+        return model
+
+
+def preload_models():
+    """
+    Compile the active patterns, loading their models, in this process.
+    Call before forking workers so they start with the models in place.
+    """
+    from .cache import get_pattern_set
+
+    pattern_set = get_pattern_set()
+    logger.info('Preloaded %s ML models', pattern_set.model_count)
+    return pattern_set.model_count
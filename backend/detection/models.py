@@ -37,6 +37,40 @@ class DrugCategory(models.Model):
         return f"{self.name} ({self.get_risk_level_display()})"
 
 
+class MLModelVersion(models.Model):
+    """
+    One trained artifact of an ML detection model.
+
+    Artifacts live under ML_MODEL_PATH as ``<name>/<version>.joblib`` and
+    are never overwritten; retraining registers a new version
+    (detection.ml.register_model) and patterns are pointed at it.
+    """
+    name = models.CharField(max_length=100)
+    version = models.PositiveIntegerField()
+    artifact = models.CharField(max_length=255)  # path relative to ML_MODEL_PATH
+    description = models.TextField(blank=True)
+
+    # Training metadata
+    feature_set = models.CharField(max_length=100, blank=True)  # featurizer the model was trained on
+    threshold = models.FloatField(
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        default=0.5
+    )  # minimum probability reported as a pattern hit
+    trained_at = models.DateTimeField()
+    metrics = models.JSONField(default=dict, blank=True)  # e.g. precision/recall on the holdout set
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'ML Model Version'
+        verbose_name_plural = 'ML Model Versions'
+        ordering = ['name', '-version']
+        unique_together = ['name', 'version']
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
 class DetectionPattern(models.Model):
     """
     Patterns and keywords for drug detection.
@@ -53,6 +87,13 @@ class DetectionPattern(models.Model):
     pattern_type = models.CharField(max_length=20, choices=PATTERN_TYPES)
     pattern_data = models.TextField()  # JSON or text pattern
     description = models.TextField(blank=True)
+    model_version = models.ForeignKey(
+        MLModelVersion,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='patterns'
+    )  # artifact scored by ml_model patterns; overrides a model name in pattern_data
     
     # Detection settings
     confidence_threshold = models.FloatField(
@@ -65,10 +106,14 @@ class DetectionPattern(models.Model):
     # Categories
     drug_categories = models.ManyToManyField(DrugCategory, blank=True)
     
+    # Usage statistics (flushed in bulk by detection.usage)
+    match_count = models.PositiveBigIntegerField(default=0)
+    scan_count = models.PositiveBigIntegerField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    last_used = models.DateTimeField(null=True, blank=True)
+    last_used = models.DateTimeField(null=True, blank=True)  # last time the pattern matched
     
     class Meta:
         verbose_name = 'Detection Pattern'
@@ -77,6 +122,13 @@ class DetectionPattern(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.get_pattern_type_display()})"
+    
+    @property
+    def hit_rate(self):
+        """Fraction of scanned items this pattern matched."""
+        if self.scan_count > 0:
+            return self.match_count / self.scan_count
+        return 0.0
 
 
 class Platform(models.Model):
@@ -284,6 +336,36 @@ class DetectionAnalytics(models.Model):
         }
 
 
+class DetectionRollup(models.Model):
+    """
+    Hourly detection counts per platform, pattern, severity and status.
+
+    Maintained incrementally on insert, status change and delete, so
+    dashboard statistics read a few hundred buckets instead of scanning
+    DetectionResult. Categories are resolved through the pattern.
+    """
+    hour = models.DateTimeField()
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE, related_name='rollups')
+    detection_pattern = models.ForeignKey(DetectionPattern, on_delete=models.CASCADE, related_name='rollups')
+    severity_level = models.CharField(max_length=20, choices=DetectionResult.SEVERITY_LEVELS)
+    status = models.CharField(max_length=20, choices=DetectionResult.STATUS_CHOICES)
+
+    count = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        verbose_name = 'Detection Rollup'
+        verbose_name_plural = 'Detection Rollups'
+        ordering = ['-hour']
+        unique_together = ['hour', 'platform', 'detection_pattern', 'severity_level', 'status']
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} - {self.platform_id} - {self.status}: {self.count}"
+
+
 class DetectionRule(models.Model):
     """
     Rules for automatic detection processing.
@@ -325,12 +407,13 @@ class DetectionRule(models.Model):
     
     def should_trigger(self, detection_result):
         """Check if rule should trigger for given detection."""
-        # Implementation would check conditions against detection_result
-        # This is a placeholder for the actual logic
-        return True
+        from .rules import evaluate_rule
+        try:
+            return evaluate_rule(self, detection_result)
+        except ValueError:
+            return False
     
     def execute(self, detection_result):
-        """Execute the rule actions."""
-        # Implementation would execute actions based on rule type
-        self.last_executed = timezone.now()
-        self.save(update_fields=['last_executed'])
+        """Apply the rule to a saved detection; returns whether it triggered."""
+        from .rules import run_rule
+        return run_rule(self, detection_result)
@@ -0,0 +1,53 @@
+"""
+Text normalization for obfuscated drug slang.
+
+Folds the usual evasions back to plain lowercase text so "C0CA1NE",
+"m.d.m.a" and "weeeeed" all normalize to a searchable form. Shared by the
+trigram index, the detection engine and content deduplication.
+"""
+
+import re
+import unicodedata
+
+LEET_TABLE = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    '@': 'a', '$': 's', '!': 'i', '|': 'l', '+': 't', '€': 'e', '£': 'l',
+})
+
+# Runs of word characters and leet symbols; only runs with at least two
+# letters are translated, so quantities like "5g" and "420" survive.
+_LEET_TOKEN_RE = re.compile(r'[@$]?\w+(?:[@$!|+€£]+\w+)*')
+
+# Single characters separated by punctuation or spaces: m.d.m.a, m d m a, c-o-k-e
+_SPACED_LETTERS_RE = re.compile(r'(?<!\w)(?:\w[\s.\-_*/\\]){2,}\w(?!\w)')
+_NON_WORD_RE = re.compile(r'[^\w]+')
+_REPEAT_RE = re.compile(r'(\w)\1{2,}')
+
+
+def _translate_leet(match):
+    token = match.group()
+    if sum(char.isalpha() for char in token) < 2:
+        return token
+    return token.translate(LEET_TABLE)
+
+
+def _collapse_spaced(match):
+    return ''.join(char for char in match.group() if char.isalnum())
+
+
+def normalize_text(text):
+    """Return a lowercase, de-obfuscated version of text."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = _LEET_TOKEN_RE.sub(_translate_leet, text.lower())
+    text = _SPACED_LETTERS_RE.sub(_collapse_spaced, text)
+    text = _REPEAT_RE.sub(r'\1\1', text)
+    text = _NON_WORD_RE.sub(' ', text).replace('_', ' ')
+    return ' '.join(text.split())
+
+
+def trigrams(text):
+    """Return the set of character trigrams of an already normalized text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
@@ -0,0 +1,273 @@
+"""
+Process-pool execution of the detection engine.
+
+Keyword, regex and ml_model scoring is pure Python and scikit-learn
+work that holds the GIL, so threads do not add scoring throughput.
+With DETECTION_WORKERS > 1 score_texts() hands large batches to a pool
+of worker processes instead. Each worker compiles the active patterns
+and loads their models once (and again only when the parent's pattern
+specs change), then receives texts in chunks of DETECTION_WORKER_CHUNK_SIZE.
+Workers key their compiled set on a content hash of the specs
+(engine.spec_fingerprint), not on the version label, so a worker never
+scans with patterns that differ from the parent's; when the database has
+moved on, the chunk is scanned in the parent instead.
+Forked workers start with the models the parent has already loaded, and
+memory-mapped model arrays (detection.ml) are shared in any case.
+
+Results travel back as a few flat numpy arrays per chunk (hit offsets,
+pattern ids, confidences, classifier probabilities) plus the matched
+terms and cascade stage counts; the parent rebuilds PatternHits from its own copy of the pattern
+specs. Neither compiled patterns nor models are ever pickled.
+"""
+
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import numpy as np
+from django.conf import settings
+
+from .cascade import cascade_stats
+from .engine import PatternHit, matched_terms
+
+logger = logging.getLogger('detection')
+
+
+# Worker side
+
+_worker_pattern_set = None
+
+
+def _init_worker(version, fingerprint):
+    """Prepare a freshly started worker process and compile its patterns."""
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    # Forked workers inherit the parent's open database connections;
+    # forget them without closing so the parent's sessions stay intact.
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+    _load_pattern_set(version, fingerprint)
+
+
+def _load_pattern_set(version, fingerprint):
+    """
+    Return this worker's compiled patterns if they are the ones the parent
+    scans with (same spec fingerprint), recompiling once if not; None when
+    the stored patterns no longer match the parent's.
+    """
+    global _worker_pattern_set
+    from .engine import load_active_patterns
+
+    if _worker_pattern_set is None or _worker_pattern_set.fingerprint != fingerprint:
+        _worker_pattern_set = load_active_patterns(version=version)
+        logger.info(
+            'Scoring worker %s compiled patterns at version %s (%s)',
+            os.getpid(), version, _worker_pattern_set.fingerprint,
+        )
+    if _worker_pattern_set.fingerprint != fingerprint:
+        return None
+    return _worker_pattern_set
+
+
+def encode_results(scanned, pattern_set):
+    """
+    Pack scan_many() results for ``n`` texts into
+    (offsets, pattern_ids, confidences, keywords, model_ids, probabilities).
+
+    Hits of text ``i`` are ``pattern_ids[offsets[i]:offsets[i + 1]]``;
+    ``probabilities`` is a (models x n) float32 matrix, NaN for texts
+    the cascade did not send to the ml_model stage.
+    """
+    offsets = np.zeros(len(scanned) + 1, dtype=np.int32)
+    pattern_ids, confidences, keywords = [], [], []
+    for index, (hits, probabilities) in enumerate(scanned):
+        offsets[index + 1] = offsets[index] + len(hits)
+        pattern_ids.extend(hit.pattern_id for hit in hits)
+        confidences.extend(hit.confidence for hit in hits)
+        keywords.append(matched_terms(hits))
+    model_ids = [pattern_id for pattern_id, model in pattern_set._models]
+    probabilities = np.array(
+        [[probabilities.get(pattern_id, np.nan) for hits, probabilities in scanned] for pattern_id in model_ids],
+        dtype=np.float32,
+    )
+    return (
+        offsets,
+        np.array(pattern_ids, dtype=np.int64),
+        np.array(confidences, dtype=np.float32),
+        keywords,
+        np.array(model_ids, dtype=np.int64),
+        probabilities,
+    )
+
+
+def _scan_chunk(version, fingerprint, texts):
+    """
+    Worker entry point: scan one chunk of texts; returns (encoded results,
+    cascade counts), or (None, None) when the worker cannot compile the
+    parent's patterns.
+    """
+    pattern_set = _load_pattern_set(version, fingerprint)
+    if pattern_set is None:
+        return None, None
+    stats = Counter()
+    scanned = pattern_set.scan_many(texts, normalize=settings.DETECTION_NORMALIZE_TEXT, stats=stats)
+    return encode_results(scanned, pattern_set), stats
+
+
+# Parent side
+
+def decode_results(encoded, pattern_set):
+    """
+    Unpack encode_results() output into (hits, probabilities, keywords)
+    per text. The hits carry no individual matches.
+
+    Returns None when a pattern id is unknown to ``pattern_set``.
+    """
+    offsets, pattern_ids, confidences, keywords, model_ids, probabilities = encoded
+    specs = pattern_set.specs
+    model_ids = model_ids.tolist()
+    if not specs.keys() >= set(pattern_ids.tolist()) | set(model_ids):
+        return None
+    results = []
+    for index in range(len(offsets) - 1):
+        hits = []
+        for position in range(offsets[index], offsets[index + 1]):
+            spec = specs[int(pattern_ids[position])]
+            hits.append(PatternHit(
+                pattern_id=spec.id,
+                name=spec.name,
+                pattern_type=spec.pattern_type,
+                confidence=round(float(confidences[position]), 4),
+                threshold=spec.threshold,
+                category_ids=spec.category_ids,
+                matches=[],
+            ))
+        text_probabilities = {
+            pattern_id: float(probabilities[row, index])
+            for row, pattern_id in enumerate(model_ids)
+            if not np.isnan(probabilities[row, index])
+        }
+        results.append((hits, text_probabilities, keywords[index]))
+    return results
+
+
+class ScoringPool:
+    """
+    Lazily started pool of scoring processes shared by every thread of
+    this process.
+    """
+
+    def __init__(self, workers=None, chunk_size=None, min_texts=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_texts = min_texts
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._executor = None
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    @property
+    def worker_count(self):
+        return self._setting(self.workers, 'DETECTION_WORKERS', 1)
+
+    def enabled_for(self, count, pattern_set):
+        """Whether ``count`` texts scored against ``pattern_set`` should go to the pool."""
+        if self.worker_count <= 1 or pattern_set.version is None:
+            return False
+        if count < self._setting(self.min_texts, 'DETECTION_PARALLEL_MIN_TEXTS', 256):
+            return False
+        # Daemonic processes (e.g. multiprocessing pool workers) cannot have children.
+        return not multiprocessing.current_process().daemon
+
+    def _get_executor(self, pattern_set):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's worker processes are not ours.
+                self._pid = os.getpid()
+                self._executor = None
+            if self._executor is None:
+                start_method = getattr(settings, 'DETECTION_WORKER_START_METHOD', None)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.worker_count,
+                    mp_context=multiprocessing.get_context(start_method),
+                    initializer=_init_worker,
+                    initargs=(pattern_set.version, pattern_set.fingerprint),
+                )
+                logger.info('Started %s scoring worker processes', self.worker_count)
+            return self._executor
+
+    def chunks(self, texts):
+        """Split texts so every worker gets at least one chunk."""
+        chunk_size = self._setting(self.chunk_size, 'DETECTION_WORKER_CHUNK_SIZE', 512)
+        chunk_size = max(1, min(chunk_size, math.ceil(len(texts) / self.worker_count)))
+        return [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+
+    def scan_many(self, texts, pattern_set, stats=None):
+        """
+        Scan ``texts`` in the worker processes. Returns (hits,
+        probabilities, keywords) per text, like decode_results().
+        ``stats``, a Counter, receives the cascade counts of the batch.
+        """
+        chunks = self.chunks(list(texts))
+        executor = self._get_executor(pattern_set)
+        try:
+            scanned = []
+            chunk_args = repeat(pattern_set.version), repeat(pattern_set.fingerprint), chunks
+            for chunk_scanned in executor.map(_scan_chunk, *chunk_args):
+                scanned.append(chunk_scanned)
+        except BrokenProcessPool:
+            logger.exception('Scoring worker pool broke; scanning in-process')
+            self.shutdown()
+            scanned += [(None, None)] * (len(chunks) - len(scanned))
+
+        results = []
+        for chunk, (chunk_encoded, chunk_stats) in zip(chunks, scanned):
+            decoded = decode_results(chunk_encoded, pattern_set) if chunk_encoded is not None else None
+            if decoded is None:
+                # The stored patterns changed since this process compiled
+                # its own, so the worker could not match them, or the pool
+                # failed.
+                decoded = scan_in_process(chunk, pattern_set, stats)
+            else:
+                cascade_stats.record(chunk_stats)
+                if stats is not None:
+                    stats.update(chunk_stats)
+            results.extend(decoded)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_in_process(texts, pattern_set, stats=None):
+    """Scan ``texts`` in this process; same result shape as ScoringPool.scan_many()."""
+    counts = Counter()
+    scanned = pattern_set.scan_many(texts, normalize=settings.DETECTION_NORMALIZE_TEXT, stats=counts)
+    cascade_stats.record(counts)
+    if stats is not None:
+        stats.update(counts)
+    return [(hits, probabilities, matched_terms(hits)) for hits, probabilities in scanned]
+
+
+scoring_pool = ScoringPool()
+
+
+@atexit.register
+def _shutdown_at_exit():
+    scoring_pool.shutdown()
@@ -0,0 +1,222 @@
+"""
+Hourly detection rollups for Hack2Drug dashboards.
+
+Every DetectionResult contributes one count (and its confidence) to the
+DetectionRollup bucket for (hour, platform, pattern, severity, status).
+Inserts add to a bucket, status or severity changes move the count
+between buckets and deletes subtract it. Deltas go through the
+write-behind counter buffer like the other detection counters.
+
+QuerySet.update() and raw SQL bypass the signals; run the
+``rebuild_detection_rollups`` management command after such changes.
+
+Buckets older than ROLLUP_COMPACT_AFTER_DAYS are compacted into one
+bucket per day (stored at midnight UTC) and empty buckets are dropped;
+late deltas for those days create hourly buckets again, which the next
+compaction folds in.
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.conf import settings
+from django.utils import timezone
+
+from hack2drug.counter_buffer import counter_buffer
+from .models import DetectionResult, DetectionRollup, DetectionPattern
+
+ROLLUP_FIELDS = ['detected_at', 'platform_id', 'detection_pattern_id', 'severity_level', 'status',
+                 'confidence_score']
+
+RECENT_DAYS = 7
+
+
+def truncate_hour(value):
+    """Start of the UTC hour containing value."""
+    if timezone.is_aware(value):
+        value = value.astimezone(dt_timezone.utc)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_state(detection):
+    """
+    Return ((hour, platform, pattern, severity, status), confidence) for a
+    detection, or None if any field needed for it was not loaded.
+    """
+    loaded = detection.__dict__
+    if any(field not in loaded for field in ROLLUP_FIELDS) or loaded['detected_at'] is None:
+        return None
+    key = (
+        truncate_hour(detection.detected_at),
+        detection.platform_id,
+        detection.detection_pattern_id,
+        detection.severity_level,
+        detection.status,
+    )
+    return key, detection.confidence_score or 0.0
+
+
+def count_rollups(detections, sign=1):
+    """Aggregate {bucket key: Counter(count, confidence_sum)} for detections."""
+    deltas = defaultdict(Counter)
+    for detection in detections:
+        state = rollup_state(detection)
+        if state is not None:
+            add_state(deltas, state, sign)
+    return deltas
+
+
+def add_state(deltas, state, sign):
+    """Add (sign=1) or remove (sign=-1) one rollup_state() from deltas."""
+    key, confidence = state
+    deltas[key].update({'count': sign, 'confidence_sum': sign * confidence})
+
+
+def record_rollups(deltas):
+    """Queue rollup deltas on the counter buffer once the transaction commits."""
+    deltas = {key: dict(values) for key, values in deltas.items() if any(values.values())}
+    if not deltas:
+        return
+
+    def enqueue():
+        for (hour, platform_id, pattern_id, severity, status), values in deltas.items():
+            counter_buffer.increment(
+                DetectionRollup,
+                {
+                    'hour': hour,
+                    'platform_id': platform_id,
+                    'detection_pattern_id': pattern_id,
+                    'severity_level': severity,
+                    'status': status,
+                },
+                values,
+                create=True,
+            )
+
+    transaction.on_commit(enqueue)
+
+
+def rebuild_rollups():
+    """Recompute every rollup bucket from DetectionResult."""
+    rows = DetectionResult.objects.annotate(
+        hour=TruncHour('detected_at', tzinfo=dt_timezone.utc)
+    ).values(
+        'hour', 'platform_id', 'detection_pattern_id', 'severity_level', 'status'
+    ).annotate(count=Count('id'), confidence_sum=Sum('confidence_score')).order_by()
+    with transaction.atomic():
+        DetectionRollup.objects.all().delete()
+        DetectionRollup.objects.bulk_create(
+            [DetectionRollup(**row) for row in rows], batch_size=1000
+        )
+    return DetectionRollup.objects.count()
+
+
+def compact_rollups(now=None):
+    """
+    Merge the hourly buckets of days older than ROLLUP_COMPACT_AFTER_DAYS
+    into daily buckets. Returns (buckets before, buckets after).
+    """
+    days = max(settings.ROLLUP_COMPACT_AFTER_DAYS, RECENT_DAYS + 1)
+    cutoff = truncate_hour((now or timezone.now()) - timedelta(days=days)).replace(hour=0)
+    old = DetectionRollup.objects.filter(hour__lt=cutoff)
+    with transaction.atomic():
+        before = old.count()
+        rows = old.annotate(day=TruncDay('hour', tzinfo=dt_timezone.utc)).values(
+            'day', 'platform_id', 'detection_pattern_id', 'severity_level', 'status'
+        ).annotate(total=Sum('count'), confidence=Sum('confidence_sum')).order_by()
+        merged = [
+            DetectionRollup(
+                hour=row['day'],
+                platform_id=row['platform_id'],
+                detection_pattern_id=row['detection_pattern_id'],
+                severity_level=row['severity_level'],
+                status=row['status'],
+                count=row['total'],
+                confidence_sum=row['confidence'] or 0.0,
+            )
+            for row in rows if row['total']
+        ]
+        old.delete()
+        DetectionRollup.objects.bulk_create(merged, batch_size=1000)
+    return before, len(merged)
+
+
+def _category_names(pattern_ids):
+    names = defaultdict(list)
+    rows = DetectionPattern.drug_categories.through.objects.filter(
+        detectionpattern_id__in=pattern_ids
+    ).values_list('detectionpattern_id', 'drugcategory__name')
+    for pattern_id, name in rows:
+        names[pattern_id].append(name)
+    return names
+
+
+def rollup_stats(now=None):
+    """Dashboard statistics from the rollup table (two queries)."""
+    since = truncate_hour((now or timezone.now()) - timedelta(days=RECENT_DAYS))
+    buckets = DetectionRollup.objects.values(
+        'platform__name', 'detection_pattern_id', 'status'
+    ).annotate(
+        total=Sum('count'),
+        recent=Sum('count', filter=Q(hour__gte=since)),
+        confidence=Sum('confidence_sum'),
+    ).order_by()
+
+    by_status = Counter()
+    by_platform = Counter()
+    by_pattern = Counter()
+    recent = 0
+    confidence = 0.0
+    for bucket in buckets:
+        by_status[bucket['status']] += bucket['total']
+        by_platform[bucket['platform__name']] += bucket['total']
+        by_pattern[bucket['detection_pattern_id']] += bucket['total']
+        recent += bucket['recent'] or 0
+        confidence += bucket['confidence'] or 0.0
+
+    by_category = Counter()
+    for pattern_id, names in _category_names(list(by_pattern)).items():
+        for name in names:
+            by_category[name] += by_pattern[pattern_id]
+
+    total = sum(by_status.values())
+    return {
+        'total_detections': total,
+        'pending_review': by_status['pending'],
+        'confirmed_detections': by_status['confirmed'],
+        'false_positives': by_status['false_positive'],
+        'detections_by_category': {name: count for name, count in by_category.items() if count},
+        'detections_by_platform': {name: count for name, count in by_platform.items() if count},
+        'average_confidence': round(confidence / total, 2) if total else 0.0,
+        'recent_detections': recent,
+    }
+
+
+def live_stats(queryset, now=None):
+    """Dashboard statistics computed directly from a DetectionResult queryset."""
+    since = (now or timezone.now()) - timedelta(days=RECENT_DAYS)
+    totals = queryset.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        confirmed=Count('id', filter=Q(status='confirmed')),
+        false_positives=Count('id', filter=Q(status='false_positive')),
+        recent=Count('id', filter=Q(detected_at__gte=since)),
+        average_confidence=Avg('confidence_score'),
+    )
+    by_category = queryset.values_list('detection_pattern__drug_categories__name').annotate(
+        count=Count('id')
+    ).order_by()
+    by_platform = queryset.values_list('platform__name').annotate(count=Count('id')).order_by()
+    return {
+        'total_detections': totals['total'],
+        'pending_review': totals['pending'],
+        'confirmed_detections': totals['confirmed'],
+        'false_positives': totals['false_positives'],
+        'detections_by_category': {name: count for name, count in by_category if name},
+        'detections_by_platform': dict(by_platform),
+        'average_confidence': round(totals['average_confidence'] or 0.0, 2),
+        'recent_detections': totals['recent'],
+    }
@@ -0,0 +1,344 @@
+"""
+Compiled DetectionRule evaluation.
+
+A rule's ``conditions`` are a JSON object whose keys must all hold:
+
+    severity        level or list of levels
+    min_severity    lowest level that matches (low < medium < high < critical)
+    platform        platform id or list of ids
+    platform_type   platform type or list of types
+    category        drug category id or list; matches any category of the
+                    detection's pattern
+    pattern         detection pattern id or list of ids
+    status          status or list of statuses
+    min_confidence  lowest confidence_score that matches
+    max_confidence  highest confidence_score that matches
+    keywords        list; matches when any was detected
+
+An empty object matches every detection. Rules with unknown keys or
+malformed values are skipped (and rejected by the API), never treated as
+match-all.
+
+Active rules are compiled once per version of the shared
+``detection_rules`` counter into predicates and indexed by the fields
+they test (severity, platform, category), so a detection is checked only
+against rules that can match it. Candidates are evaluated in priority
+order. Only the first matching ``auto_assign`` and ``auto_escalate`` rule
+applies; every matching rule of the other types fires.
+
+``actions`` by rule type:
+
+    auto_assign     {"assign_to": user id or list of ids}; unassigned
+                    detections are spread round-robin over the list
+    auto_escalate   {"assign_to": user id (optional)}; status "escalated"
+    notification, blocking, reporting
+                    a ``rule.<rule_type>`` webhook event listing the
+                    detections (with the rule's ``actions`` as ``options``)
+
+apply_rules() applies assignment and escalation to DetectionResult
+instances before they are inserted, so bulk ingest writes them with the
+same INSERT and the counters and rollups see the final status.
+record_rule_executions() then sends the webhook events and stamps
+``last_executed``, one statement and one event per rule and batch.
+"""
+
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import VersionedCache
+
+logger = logging.getLogger('detection')
+
+SEVERITY_ORDER = ['low', 'medium', 'high', 'critical']
+
+# Rule types of which only the highest priority match applies.
+EXCLUSIVE_RULE_TYPES = ('auto_assign', 'auto_escalate')
+
+# Fields rules are indexed by; ``category`` may have several values.
+INDEXED_FIELDS = ('severity', 'platform', 'category')
+
+
+class CompiledRule:
+    """
+    A DetectionRule detached from the ORM: the values it accepts for
+    each indexed field and predicates for its other conditions.
+    """
+
+    def __init__(self, id, name, rule_type, priority, index_values, predicates, actions):
+        self.id = id
+        self.name = name
+        self.rule_type = rule_type
+        self.priority = priority
+        self.index_values = index_values
+        self.predicates = predicates
+        self.actions = actions
+
+    def __repr__(self):
+        return f'<CompiledRule {self.id} {self.name!r} ({self.rule_type})>'
+
+
+def _as_list(value, cast=None):
+    values = value if isinstance(value, list) else [value]
+    if cast is not None:
+        values = [cast(item) for item in values]
+    return values
+
+
+def compile_conditions(conditions):
+    """
+    Turn a conditions object into ({indexed field: set of values},
+    [predicate(detection, category_ids)]). Raises ValueError when the
+    conditions are malformed.
+    """
+    if not isinstance(conditions, dict):
+        raise ValueError('conditions must be an object')
+    index_values = {}
+    predicates = []
+    try:
+        for key, value in conditions.items():
+            if key == 'severity':
+                levels = set(_as_list(value, str))
+                if not levels <= set(SEVERITY_ORDER):
+                    raise ValueError(f'unknown severity in {value!r}')
+                index_values['severity'] = levels & index_values.get('severity', levels)
+            elif key == 'min_severity':
+                if value not in SEVERITY_ORDER:
+                    raise ValueError(f'unknown severity {value!r}')
+                levels = set(SEVERITY_ORDER[SEVERITY_ORDER.index(value):])
+                index_values['severity'] = levels & index_values.get('severity', levels)
+            elif key == 'platform':
+                index_values['platform'] = set(_as_list(value, int))
+            elif key == 'category':
+                index_values['category'] = set(_as_list(value, int))
+            elif key == 'platform_type':
+                types = frozenset(_as_list(value, str))
+                predicates.append(lambda detection, categories, types=types: detection.platform.platform_type in types)
+            elif key == 'pattern':
+                pattern_ids = frozenset(_as_list(value, int))
+                predicates.append(
+                    lambda detection, categories, ids=pattern_ids: detection.detection_pattern_id in ids
+                )
+            elif key == 'status':
+                statuses = frozenset(_as_list(value, str))
+                predicates.append(lambda detection, categories, statuses=statuses: detection.status in statuses)
+            elif key == 'min_confidence':
+                minimum = float(value)
+                predicates.append(
+                    lambda detection, categories, minimum=minimum: (detection.confidence_score or 0.0) >= minimum
+                )
+            elif key == 'max_confidence':
+                maximum = float(value)
+                predicates.append(
+                    lambda detection, categories, maximum=maximum: (detection.confidence_score or 0.0) <= maximum
+                )
+            elif key == 'keywords':
+                keywords = frozenset(str(keyword).lower() for keyword in _as_list(value))
+                predicates.append(
+                    lambda detection, categories, keywords=keywords: not keywords.isdisjoint(
+                        str(keyword).lower() for keyword in detection.detected_keywords or ()
+                    )
+                )
+            else:
+                raise ValueError(f'unknown condition {key!r}')
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f'Invalid conditions: {exc}') from exc
+    return index_values, predicates
+
+
+def _assignees(actions):
+    assign_to = actions.get('assign_to') if isinstance(actions, dict) else None
+    if assign_to in (None, '', []):
+        return []
+    return _as_list(assign_to, int)
+
+
+def compile_rule(rule, users=None):
+    """Build a CompiledRule from a DetectionRule; raises ValueError when it cannot apply."""
+    index_values, predicates = compile_conditions(rule.conditions)
+    actions = rule.actions if isinstance(rule.actions, dict) else {}
+    try:
+        assignees = _assignees(actions)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid actions: assign_to must be user ids')
+    if rule.rule_type == 'auto_assign' and not assignees:
+        raise ValueError('auto_assign rules need actions.assign_to')
+    if users is not None and not set(assignees) <= users:
+        raise ValueError(f'unknown or inactive users in assign_to {assignees}')
+    return CompiledRule(
+        id=rule.id,
+        name=rule.name,
+        rule_type=rule.rule_type,
+        priority=rule.priority,
+        index_values=index_values,
+        predicates=predicates,
+        actions=dict(actions, assign_to=assignees),
+    )
+
+
+class CompiledRuleSet:
+    """
+    Active rules in priority order with per-field indexes of the values
+    each rule accepts.
+    """
+
+    def __init__(self, rules, pattern_categories, version=None):
+        self.version = version
+        self.rules = list(rules)
+        self.pattern_categories = pattern_categories  # pattern id -> frozenset of category ids
+        self._index = {field: {} for field in INDEXED_FIELDS}
+        self._any = {field: set() for field in INDEXED_FIELDS}  # rules not testing the field
+        for position, rule in enumerate(self.rules):
+            for field in INDEXED_FIELDS:
+                values = rule.index_values.get(field)
+                if values is None:
+                    self._any[field].add(position)
+                    continue
+                for value in values:
+                    self._index[field].setdefault(value, set()).add(position)
+        self._tested = [field for field in INDEXED_FIELDS if self._index[field]]
+        self._assign_cursors = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, detection, categories):
+        """Positions of the rules whose indexed conditions the detection meets, in priority order."""
+        values = {
+            'severity': (detection.severity_level,),
+            'platform': (detection.platform_id,),
+            'category': categories,
+        }
+        positions = None
+        for field in self._tested:
+            matched = set(self._any[field])
+            for value in values[field]:
+                matched |= self._index[field].get(value, set())
+            positions = matched if positions is None else positions & matched
+            if not positions:
+                return []
+        if positions is None:
+            return range(len(self.rules))
+        return sorted(positions)
+
+    def matching(self, detection):
+        """Rules that trigger for ``detection``, highest priority first."""
+        categories = self.pattern_categories.get(detection.detection_pattern_id, frozenset())
+        matched = []
+        applied = set()
+        for position in self.candidates(detection, categories):
+            rule = self.rules[position]
+            if rule.rule_type in applied:
+                continue
+            if all(predicate(detection, categories) for predicate in rule.predicates):
+                matched.append(rule)
+                if rule.rule_type in EXCLUSIVE_RULE_TYPES:
+                    applied.add(rule.rule_type)
+        return matched
+
+    def next_assignee(self, rule):
+        """Round-robin over an auto_assign rule's users."""
+        assignees = rule.actions['assign_to']
+        cursor = self._assign_cursors.get(rule.id, 0)
+        self._assign_cursors[rule.id] = cursor + 1
+        return assignees[cursor % len(assignees)]
+
+
+def load_active_rules(version=None):
+    """Compile every active DetectionRule that can be applied."""
+    from django.contrib.auth import get_user_model
+    from .models import DetectionPattern, DetectionRule
+
+    rules = list(DetectionRule.objects.filter(is_active=True).order_by('-priority', 'name', 'pk'))
+    referenced = set()
+    for rule in rules:
+        try:
+            referenced.update(_assignees(rule.actions))
+        except (TypeError, ValueError):
+            pass
+    users = set(get_user_model().objects.filter(pk__in=referenced, is_active=True).values_list('pk', flat=True))
+
+    compiled = []
+    for rule in rules:
+        try:
+            compiled.append(compile_rule(rule, users))
+        except ValueError as exc:
+            logger.warning('Skipping detection rule %s (%s): %s', rule.pk, rule.name, exc)
+
+    pattern_categories = {}
+    through = DetectionPattern.drug_categories.through
+    for pattern_id, category_id in through.objects.values_list('detectionpattern_id', 'drugcategory_id'):
+        pattern_categories.setdefault(pattern_id, set()).add(category_id)
+    pattern_categories = {pattern_id: frozenset(ids) for pattern_id, ids in pattern_categories.items()}
+    return CompiledRuleSet(compiled, pattern_categories, version=version)
+
+
+rule_cache = VersionedCache('detection_rules', load_active_rules)
+
+
+def get_rule_set():
+    """Return the compiled set of active detection rules."""
+    return rule_cache.get()
+
+
+def apply_rules(detections, rule_set=None):
+    """
+    Evaluate ``detections`` (saved or not) against the active rules and
+    apply assignment and escalation to the instances in memory; the
+    caller saves them. Returns {CompiledRule: [detections]} of the rules
+    that triggered, for record_rule_executions().
+    """
+    rule_set = rule_set or get_rule_set()
+    triggered = {}
+    if not len(rule_set):
+        return triggered
+    for detection in detections:
+        for rule in rule_set.matching(detection):
+            triggered.setdefault(rule, []).append(detection)
+            if rule.rule_type == 'auto_assign':
+                if detection.assigned_to_id is None:
+                    detection.assigned_to_id = rule_set.next_assignee(rule)
+            elif rule.rule_type == 'auto_escalate':
+                detection.status = 'escalated'
+                if rule.actions['assign_to']:
+                    detection.assigned_to_id = rule.actions['assign_to'][0]
+    return triggered
+
+
+def record_rule_executions(triggered):
+    """Stamp last_executed and send the webhook events of triggered rules once saved."""
+    from api.webhooks import notify_webhooks
+    from .models import DetectionRule
+
+    if not triggered:
+        return
+    DetectionRule.objects.filter(pk__in=[rule.id for rule in triggered]).update(last_executed=timezone.now())
+    for rule, detections in triggered.items():
+        if rule.rule_type in EXCLUSIVE_RULE_TYPES:
+            continue
+        options = {key: value for key, value in rule.actions.items() if key != 'assign_to'}
+        notify_webhooks(f'rule.{rule.rule_type}', {
+            'rule_id': rule.id,
+            'rule_name': rule.name,
+            'options': options,
+            'detection_ids': [detection.pk for detection in detections],
+        })
+
+
+def evaluate_rule(rule, detection):
+    """Whether one DetectionRule, active or not, triggers for ``detection``."""
+    compiled = compile_rule(rule)
+    rule_set = CompiledRuleSet([compiled], get_rule_set().pattern_categories)
+    return bool(rule_set.matching(detection))
+
+
+def run_rule(rule, detection):
+    """Apply one DetectionRule to a saved detection and save the changes."""
+    rule_set = CompiledRuleSet([compile_rule(rule)], get_rule_set().pattern_categories)
+    with transaction.atomic():
+        triggered = apply_rules([detection], rule_set)
+        if triggered:
+            detection.save(update_fields=['status', 'assigned_to'])
+            record_rule_executions(triggered)
+    return bool(triggered)
@@ -0,0 +1,170 @@
+"""
+Full-text search over detection and collected content.
+
+The search backend is pluggable. SQLite uses FTS5 external-content tables
+kept current by triggers (so bulk_create is indexed too), PostgreSQL uses a
+GIN index on to_tsvector(content_text), and any other database falls back
+to a LIKE scan. Every backend returns the queryset it was given, filtered
+to matching rows, annotated with ``search_rank`` and ordered best first,
+so the result composes with further filters and pagination.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.utils.module_loading import import_string
+
+# Model label -> (FTS5 table, indexed column)
+SEARCH_INDEXES = {
+    'detection.DetectionResult': ('detection_detectionresult_fts', 'content_text'),
+    'monitoring.CollectedContent': ('monitoring_collectedcontent_fts', 'content_text'),
+}
+
+_TOKEN_RE = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def _index_for(model):
+    return SEARCH_INDEXES[model._meta.label]
+
+
+class BaseSearchBackend:
+    """
+    Interface for full-text search backends.
+    """
+
+    def filter_queryset(self, queryset, query):
+        """Return queryset restricted to rows matching query, ranked."""
+        raise NotImplementedError
+
+    def install(self, schema_editor, model):
+        """Create the index for model (called from migrations)."""
+
+    def uninstall(self, schema_editor, model):
+        """Drop the index for model (called from migrations)."""
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    Fallback for databases without full-text support.
+    """
+
+    def filter_queryset(self, queryset, query):
+        table, column = _index_for(queryset.model)
+        condition = Q()
+        for token in _TOKEN_RE.findall(query):
+            condition &= Q(**{f'{column}__icontains': token.rstrip('*')})
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 external-content index ranked by bm25.
+    """
+
+    def to_match_expression(self, query):
+        """Quote each token so user input cannot inject FTS5 syntax."""
+        terms = []
+        for token in _TOKEN_RE.findall(query):
+            prefix = token.endswith('*')
+            token = token.rstrip('*')
+            if token:
+                terms.append(f'"{token}"*' if prefix else f'"{token}"')
+        return ' '.join(terms)
+
+    def filter_queryset(self, queryset, query):
+        expression = self.to_match_expression(query)
+        if not expression:
+            return queryset.none()
+        fts_table, column = _index_for(queryset.model)
+        table = queryset.model._meta.db_table
+        pk = queryset.model._meta.pk.column
+        return queryset.extra(
+            tables=[fts_table],
+            where=[f'{fts_table}.rowid = {table}.{pk}', f'{fts_table} MATCH %s'],
+            params=[expression],
+            select={'search_rank': f'-{fts_table}.rank'},
+            order_by=[f'{fts_table}.rank'],
+        )
+
+    def install(self, schema_editor, model):
+        fts_table, column = _index_for(model)
+        table = model._meta.db_table
+        pk = model._meta.pk.column
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{column}, content='{table}', content_rowid='{pk}', "
+            f"tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.{pk}, new.{column}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+            f"VALUES ('delete', old.{pk}, old.{column}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+            f"VALUES ('delete', old.{pk}, old.{column}); "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.{pk}, new.{column}); END",
+            f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+        ]
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    def uninstall(self, schema_editor, model):
+        fts_table, column = _index_for(model)
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fts_table}')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL tsvector search backed by a GIN expression index.
+    """
+
+    config = 'english'
+
+    def filter_queryset(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        fts_table, column = _index_for(queryset.model)
+        vector = SearchVector(column, config=self.config)
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return queryset.annotate(
+            search_vector=vector,
+            search_rank=SearchRank(vector, search_query),
+        ).filter(search_vector=search_query).order_by('-search_rank')
+
+    def install(self, schema_editor, model):
+        fts_table, column = _index_for(model)
+        table = model._meta.db_table
+        # Must match the expression SearchVector() generates so the planner uses it.
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {fts_table}_gin ON {table} USING GIN '
+            f"(to_tsvector('{self.config}'::regconfig, COALESCE({column}, '')))"
+        )
+
+    def uninstall(self, schema_editor, model):
+        fts_table, column = _index_for(model)
+        schema_editor.execute(f'DROP INDEX IF EXISTS {fts_table}_gin')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor=None):
+    """Return the configured search backend, defaulting by database vendor."""
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return VENDOR_BACKENDS.get(vendor or connection.vendor, LikeSearchBackend)()
+
+
+def search(queryset, query):
+    """Rank queryset rows against a free-text query."""
+    return get_search_backend().filter_queryset(queryset, query)
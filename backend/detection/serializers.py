@@ -3,6 +3,7 @@ from .models import (
     DrugCategory, DetectionPattern, Platform, DetectionResult,
     DetectionAnalytics, DetectionRule
 )
+from .rules import compile_rule
 
 
 class DrugCategorySerializer(serializers.ModelSerializer):
@@ -17,6 +18,7 @@ class DetectionPatternSerializer(serializers.ModelSerializer):
     class Meta:
         model = DetectionPattern
         fields = '__all__'
+        read_only_fields = ['match_count', 'scan_count', 'last_used']
 
 
 class PlatformSerializer(serializers.ModelSerializer):
@@ -62,6 +64,19 @@ class DetectionRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = DetectionRule
         fields = '__all__'
+    
+    def validate(self, attrs):
+        """Reject conditions or actions the rule evaluator cannot compile."""
+        rule = self.instance or DetectionRule()
+        rule = DetectionRule(**{
+            field: attrs.get(field, getattr(rule, field))
+            for field in ['rule_type', 'conditions', 'actions']
+        })
+        try:
+            compile_rule(rule)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return attrs
 
 
 class DetectionStatsSerializer(serializers.Serializer):
@@ -75,10 +90,68 @@ class DetectionStatsSerializer(serializers.Serializer):
     recent_detections = serializers.IntegerField()
 
 
+class BulkDetectionItemSerializer(serializers.Serializer):
+    """
+    Plain (non-model) serializer so validating thousands of items does not
+    issue a query per related field; pattern ids are checked in bulk.
+    """
+    detection_pattern_id = serializers.IntegerField()
+    content_text = serializers.CharField()
+    content_url = serializers.URLField(required=False, allow_blank=True)
+    content_id = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    user_id = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    username = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    user_metadata = serializers.JSONField(required=False)
+    confidence_score = serializers.FloatField(min_value=0.0, max_value=1.0)
+    severity_level = serializers.ChoiceField(choices=DetectionResult.SEVERITY_LEVELS)
+    status = serializers.ChoiceField(choices=DetectionResult.STATUS_CHOICES, required=False)
+    detected_keywords = serializers.ListField(required=False)
+    ml_predictions = serializers.DictField(required=False)
+    location_data = serializers.DictField(required=False)
+    device_info = serializers.DictField(required=False)
+    ip_addresses = serializers.ListField(required=False)
+
+
 class BulkDetectionSerializer(serializers.Serializer):
-    detections = DetectionResultCreateSerializer(many=True)
+    detections = BulkDetectionItemSerializer(many=True)
     platform_id = serializers.IntegerField()
     batch_id = serializers.CharField(required=False)
+    batch_size = serializers.IntegerField(required=False, min_value=1, max_value=10000)
+    
+    def validate_detections(self, value):
+        pattern_ids = {item['detection_pattern_id'] for item in value}
+        existing = set(
+            DetectionPattern.objects.filter(id__in=pattern_ids).values_list('id', flat=True)
+        )
+        missing = pattern_ids - existing
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown detection patterns: {sorted(missing)}"
+            )
+        return value
+
+
+class RuleTestSerializer(serializers.Serializer):
+    """
+    Input of the rule test action: a stored detection's id or the fields
+    of an unsaved detection to evaluate the rule against.
+    """
+    DETECTION_FIELDS = [
+        'platform', 'detection_pattern', 'severity_level', 'confidence_score', 'detected_keywords', 'status',
+    ]
+
+    detection_id = serializers.IntegerField(required=False)
+    platform = serializers.IntegerField(required=False)
+    detection_pattern = serializers.IntegerField(required=False)
+    severity_level = serializers.ChoiceField(choices=DetectionResult.SEVERITY_LEVELS, required=False)
+    confidence_score = serializers.FloatField(min_value=0.0, max_value=1.0, required=False)
+    detected_keywords = serializers.ListField(child=serializers.CharField(), required=False)
+    status = serializers.ChoiceField(choices=DetectionResult.STATUS_CHOICES, required=False)
+
+    def validate(self, attrs):
+        if 'detection_id' not in attrs and not any(field in attrs for field in self.DETECTION_FIELDS):
+            raise serializers.ValidationError('detection_id or detection fields required')
+        return attrs
 
 
 class DetectionSearchSerializer(serializers.Serializer):
@@ -0,0 +1,260 @@
+"""
+Detection services for Hack2Drug system.
+"""
+
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import get_pattern_set
+from .counters import count_detections, record_detection_counts
+from .rollups import count_rollups, record_rollups
+from .rules import apply_rules, get_rule_set, record_rule_executions
+from .models import DetectionResult
+from .parallel import scan_in_process, scoring_pool
+from .usage import usage_tracker
+
+SCORED_CONTENT_FIELDS = [
+    'is_suspicious', 'confidence_score', 'detected_keywords', 'ml_analysis', 'processed'
+]
+
+SCORED_CLUSTER_FIELDS = ['is_suspicious', 'confidence_score', 'detected_keywords', 'analysis']
+
+# (minimum confidence, severity) for detections raised from collected content
+SEVERITY_THRESHOLDS = [(0.9, 'critical'), (0.75, 'high'), (0.5, 'medium')]
+
+
+def score_texts(texts, pattern_set=None):
+    """
+    Score a batch of texts against the compiled pattern set.
+
+    Returns one dict per text with ``is_suspicious``,
+    ``confidence_score``, ``detected_keywords``, the pattern ``hits`` that
+    produced them and the ml_model ``probabilities``. A text is
+    suspicious when any hit reaches its pattern's confidence threshold.
+    ML classifiers run once per batch, so pass as many texts as are at hand.
+    Batches of DETECTION_PARALLEL_MIN_TEXTS or more are scanned by the
+    worker processes when DETECTION_WORKERS > 1 (detection.parallel);
+    their hits then carry no individual matches.
+    """
+    pattern_set = pattern_set or get_pattern_set()
+    texts = [text or '' for text in texts]
+    stats = Counter()
+    if scoring_pool.enabled_for(len(texts), pattern_set):
+        scanned = scoring_pool.scan_many(texts, pattern_set, stats)
+    else:
+        scanned = scan_in_process(texts, pattern_set, stats)
+    usage_tracker.record(pattern_set, [hits for hits, probabilities, keywords in scanned], stats)
+    results = []
+    for hits, probabilities, keywords in scanned:
+        results.append({
+            'is_suspicious': any(hit.confidence >= hit.threshold for hit in hits),
+            'confidence_score': hits[0].confidence if hits else 0.0,
+            'detected_keywords': keywords,
+            'hits': hits,
+            'probabilities': probabilities,
+        })
+    return results
+
+
+def score_text(text, pattern_set=None):
+    """Score a single text; see score_texts()."""
+    return score_texts([text], pattern_set)[0]
+
+
+def apply_score(content, result, pattern_set):
+    """Copy a score_text() result onto a CollectedContent instance."""
+    content.is_suspicious = result['is_suspicious']
+    content.confidence_score = result['confidence_score']
+    content.detected_keywords = result['detected_keywords']
+    content.ml_analysis = dict(
+        content.ml_analysis or {},
+        pattern_version=pattern_set.version,
+        pattern_hits=[
+            {'pattern_id': hit.pattern_id, 'name': hit.name, 'confidence': hit.confidence}
+            for hit in result['hits']
+        ],
+        ml_probabilities={
+            str(pattern_id): round(probability, 4)
+            for pattern_id, probability in result['probabilities'].items()
+        },
+    )
+    content.processed = True
+
+
+def store_cluster_score(cluster, content):
+    """Keep a scored member's result on its near-duplicate cluster."""
+    cluster.is_suspicious = content.is_suspicious
+    cluster.confidence_score = content.confidence_score
+    cluster.detected_keywords = content.detected_keywords
+    cluster.analysis = {
+        'pattern_version': content.ml_analysis['pattern_version'],
+        'pattern_hits': content.ml_analysis['pattern_hits'],
+        'ml_probabilities': content.ml_analysis.get('ml_probabilities', {}),
+        'scored_content_id': content.pk,
+    }
+
+
+def apply_cluster_score(content, cluster):
+    """Copy a cluster's stored score onto one of its members."""
+    content.is_suspicious = cluster.is_suspicious
+    content.confidence_score = cluster.confidence_score
+    content.detected_keywords = list(cluster.detected_keywords)
+    content.ml_analysis = dict(content.ml_analysis or {}, cluster_id=content.cluster_id, **cluster.analysis)
+    content.processed = True
+
+
+def score_contents(contents, clusters, pattern_set):
+    """
+    Score CollectedContent instances in memory.
+
+    ``clusters`` maps the contents' ``cluster_id`` to ContentCluster,
+    including unsaved clusters under placeholder ids
+    (monitoring.clusters.match_clusters). A member of a cluster whose
+    stored score matches the pattern set version gets that score;
+    otherwise one member per cluster is scanned, all scans of the batch
+    in one score_texts() call, and the result stored on the cluster and
+    copied to the other members.
+    Returns ({cluster id: changed cluster}, number of propagated scores).
+    """
+    changed = {}
+    scan, pending = [], []
+    queued_clusters = set()
+    for content in contents:
+        cluster = clusters.get(content.cluster_id)
+        if cluster is None:
+            scan.append(content)
+        elif cluster.analysis.get('pattern_version') == pattern_set.version or content.cluster_id in queued_clusters:
+            pending.append((content, cluster))
+        else:
+            queued_clusters.add(content.cluster_id)
+            scan.append(content)
+
+    results = score_texts([content.content_text for content in scan], pattern_set) if scan else []
+    for content, result in zip(scan, results):
+        apply_score(content, result, pattern_set)
+        cluster = clusters.get(content.cluster_id)
+        if cluster is not None:
+            store_cluster_score(cluster, content)
+            changed[content.cluster_id] = cluster
+    for content, cluster in pending:
+        apply_cluster_score(content, cluster)
+    return changed, len(pending)
+
+
+def severity_for(confidence):
+    """Map a detection confidence onto DetectionResult.SEVERITY_LEVELS."""
+    for minimum, level in SEVERITY_THRESHOLDS:
+        if confidence >= minimum:
+            return level
+    return 'low'
+
+
+def detection_fields(content):
+    """DetectionResult fields for a scored, suspicious CollectedContent."""
+    hits = content.ml_analysis.get('pattern_hits') or []
+    return {
+        'detection_pattern_id': hits[0]['pattern_id'],
+        'content_text': content.content_text,
+        'content_url': content.content_url,
+        'content_id': content.content_id,
+        'user_id': content.user_id,
+        'username': content.username,
+        'user_metadata': content.user_metadata,
+        'confidence_score': content.confidence_score,
+        'severity_level': severity_for(content.confidence_score),
+        'detected_keywords': content.detected_keywords,
+        'ml_predictions': {
+            'pattern_hits': hits,
+            'probabilities': content.ml_analysis.get('ml_probabilities', {}),
+            'collected_content_id': content.pk,
+        },
+        'location_data': content.location_data,
+    }
+
+
+def score_collected_content(queryset, batch_size=None):
+    """
+    Score CollectedContent rows in batches and persist the results.
+
+    Rows are read in primary-key order, scanned once against the cached
+    pattern set and written back with one ``bulk_update`` per batch instead
+    of one UPDATE per row. Only one member of each near-duplicate cluster
+    is scanned per pattern version; the others get its stored result.
+    Returns a summary of the work done.
+    """
+    batch_size = batch_size or settings.DETECTION_SCORING_BATCH_SIZE
+    pattern_set = get_pattern_set()
+    queryset = queryset.only('id', 'content_text', 'ml_analysis', 'cluster_id').order_by('pk')
+    model = queryset.model
+    cluster_model = model._meta.get_field('cluster').related_model
+
+    scored = suspicious = propagated = 0
+    last_pk = None
+    while True:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch_qs[:batch_size])
+        if not batch:
+            break
+        clusters = cluster_model.objects.only('id', *SCORED_CLUSTER_FIELDS).in_bulk(
+            {content.cluster_id for content in batch if content.cluster_id}
+        )
+        changed, batch_propagated = score_contents(batch, clusters, pattern_set)
+        propagated += batch_propagated
+        suspicious += sum(content.is_suspicious for content in batch)
+        model.objects.bulk_update(batch, SCORED_CONTENT_FIELDS)
+        if changed:
+            cluster_model.objects.bulk_update(list(changed.values()), SCORED_CLUSTER_FIELDS)
+        scored += len(batch)
+        last_pk = batch[-1].pk
+
+    return {
+        'scored': scored,
+        'suspicious': suspicious,
+        'propagated': propagated,
+        'pattern_version': pattern_set.version,
+    }
+
+
+def bulk_create_detections(platform, items, batch_size=None):
+    """
+    Insert DetectionResult rows for one platform in chunks.
+
+    ``items`` are validated field dicts. Rows are written with
+    ``bulk_create`` after the detection rules have assigned or escalated
+    them (detection.rules), and the platform, daily analytics and hourly
+    rollup counter deltas, rule events and one ``detection.created``
+    webhook event are recorded for the whole batch when the transaction
+    commits.
+    Returns the list of created primary keys.
+    """
+    from api.webhooks import notify_detections_created
+
+    batch_size = batch_size or settings.DETECTION_BULK_CREATE_BATCH_SIZE
+    platform_types = {platform.id: platform.platform_type}
+    platform_deltas, analytics_deltas = Counter(), Counter()
+    rollup_deltas = defaultdict(Counter)
+    triggered = defaultdict(list)
+    rule_set = get_rule_set()
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            detections = [
+                DetectionResult(platform=platform, **item)
+                for item in items[start:start + batch_size]
+            ]
+            for rule, matched in apply_rules(detections, rule_set).items():
+                triggered[rule].extend(matched)
+            DetectionResult.objects.bulk_create(detections, batch_size=batch_size)
+            created.extend(detections)
+            chunk_platform, chunk_analytics = count_detections(detections, platform_types)
+            platform_deltas.update(chunk_platform)
+            analytics_deltas.update(chunk_analytics)
+            for key, values in count_rollups(detections).items():
+                rollup_deltas[key].update(values)
+        record_detection_counts(platform_deltas, analytics_deltas)
+        record_rollups(rollup_deltas)
+        record_rule_executions(triggered)
+        notify_detections_created(created)
+    return [detection.pk for detection in created]
@@ -2,84 +2,134 @@
 Signals for detection app.
 """
 
-from django.db.models.signals import post_save, post_delete
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import DetectionResult, DetectionPattern, Platform, DetectionAnalytics
+from .models import DetectionResult, DetectionPattern, DetectionRule, DrugCategory, MLModelVersion, Platform
+from .cache import bump_version_on_commit
+from .counters import count_detections, record_detection_counts
+from .rollups import rollup_state, add_state, record_rollups
+from .rules import apply_rules, record_rule_executions
 
 
 @receiver(post_save, sender=DetectionResult)
 def update_detection_analytics(sender, instance, created, **kwargs):
-    """Update detection analytics when detection result is created/updated."""
+    """Update detection analytics when detection result is created."""
     if created:
-        # Update platform statistics
-        platform = instance.platform
-        platform.total_detections += 1
-        platform.save()
-        
-        # Update daily analytics
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        analytics, created = DetectionAnalytics.objects.get_or_create(
-            date=today,
-            defaults={
-                'telegram_detections': 0,
-                'instagram_detections': 0,
-                'whatsapp_detections': 0,
-                'twitter_detections': 0,
-                'other_detections': 0,
-                'low_severity': 0,
-                'medium_severity': 0,
-                'high_severity': 0,
-                'critical_severity': 0,
-                'pending_review': 0,
-                'confirmed': 0,
-                'false_positives': 0,
-                'escalated': 0,
-            }
+        # Buffered F() increments: safe under concurrent workers and keep
+        # today's analytics row out of the insert hot path.
+        platform_deltas, analytics_deltas = count_detections(
+            [instance], {instance.platform_id: instance.platform.platform_type}
         )
-        
-        # Update platform-specific counts
-        if platform.platform_type == 'telegram':
-            analytics.telegram_detections += 1
-        elif platform.platform_type == 'instagram':
-            analytics.instagram_detections += 1
-        elif platform.platform_type == 'whatsapp':
-            analytics.whatsapp_detections += 1
-        elif platform.platform_type == 'twitter':
-            analytics.twitter_detections += 1
-        else:
-            analytics.other_detections += 1
-        
-        # Update severity counts
-        if instance.severity_level == 'low':
-            analytics.low_severity += 1
-        elif instance.severity_level == 'medium':
-            analytics.medium_severity += 1
-        elif instance.severity_level == 'high':
-            analytics.high_severity += 1
-        elif instance.severity_level == 'critical':
-            analytics.critical_severity += 1
-        
-        # Update status counts
-        if instance.status == 'pending':
-            analytics.pending_review += 1
-        elif instance.status == 'confirmed':
-            analytics.confirmed += 1
-        elif instance.status == 'false_positive':
-            analytics.false_positives += 1
-        elif instance.status == 'escalated':
-            analytics.escalated += 1
-        
-        analytics.save()
+        record_detection_counts(platform_deltas, analytics_deltas)
+
+
+@receiver(post_init, sender=DetectionResult)
+def remember_rollup_state(sender, instance, **kwargs):
+    """Remember the loaded rollup bucket so saves can move the count."""
+    instance._rollup_state = rollup_state(instance)
+
+
+@receiver(post_save, sender=DetectionResult)
+def update_detection_rollups(sender, instance, created, **kwargs):
+    """Add new detections to their hourly bucket and move changed ones."""
+    previous = None if created else getattr(instance, '_rollup_state', None)
+    current = rollup_state(instance)
+    if current == previous or (not created and previous is None):
+        # Unchanged, or loaded with deferred fields so the old bucket is unknown.
+        instance._rollup_state = current
+        return
+    deltas = defaultdict(Counter)
+    if previous is not None:
+        add_state(deltas, previous, -1)
+    if current is not None:
+        add_state(deltas, current, 1)
+    record_rollups(deltas)
+    instance._rollup_state = current
+
+
+@receiver(post_delete, sender=DetectionResult)
+def remove_detection_rollup(sender, instance, **kwargs):
+    """Subtract deleted detections from their bucket."""
+    state = getattr(instance, '_rollup_state', None) or rollup_state(instance)
+    if state is not None:
+        deltas = defaultdict(Counter)
+        add_state(deltas, state, -1)
+        record_rollups(deltas)
 
 
 @receiver(post_save, sender=DetectionPattern)
-def update_pattern_usage(sender, instance, **kwargs):
-    """Update pattern usage timestamp."""
-    from django.utils import timezone
-    instance.last_used = timezone.now()
-    instance.save(update_fields=['last_used'])
+@receiver(post_delete, sender=DetectionPattern)
+@receiver(post_save, sender=MLModelVersion)
+@receiver(post_save, sender=DrugCategory)
+@receiver(post_delete, sender=DrugCategory)
+@receiver(m2m_changed, sender=DetectionPattern.drug_categories.through)
+def invalidate_pattern_cache(sender, **kwargs):
+    """Bump the compiled pattern version so workers rebuild their automaton."""
+    bump_version_on_commit('detection_patterns')
+
+
+@receiver(post_save, sender=DetectionRule)
+@receiver(post_delete, sender=DetectionRule)
+@receiver(post_delete, sender=DetectionPattern)
+@receiver(m2m_changed, sender=DetectionPattern.drug_categories.through)
+def invalidate_rule_cache(sender, **kwargs):
+    """Bump the compiled rule version when rules or pattern categories change."""
+    bump_version_on_commit('detection_rules')
+
+
+# User fields compiled rules depend on: they only assign to active users.
+RULE_ASSIGNEE_FIELDS = ('is_active', 'role')
+
+
+def assignee_state(user):
+    """(is_active, role) of a user, or None if either was not loaded."""
+    if any(field in user.get_deferred_fields() for field in RULE_ASSIGNEE_FIELDS):
+        return None
+    return tuple(getattr(user, field) for field in RULE_ASSIGNEE_FIELDS)
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_assignee_state(sender, instance, **kwargs):
+    """Remember the loaded assignee state so saves can tell whether it changed."""
+    instance._assignee_state = assignee_state(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_changed_assignee(sender, instance, created, update_fields=None, **kwargs):
+    """Recheck rule assignees when a user is added or activated, deactivated or given another role."""
+    previous = getattr(instance, '_assignee_state', None)
+    current = assignee_state(instance)
+    instance._assignee_state = current
+    if not created:
+        if update_fields is not None and not set(update_fields) & set(RULE_ASSIGNEE_FIELDS):
+            return
+        if previous is not None and previous == current:
+            return
+    bump_version_on_commit('detection_rules')
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_deleted_assignee(sender, **kwargs):
+    """Rules only assign to existing users; recheck them when one is deleted."""
+    bump_version_on_commit('detection_rules')
+
+
+@receiver(pre_save, sender=DetectionResult)
+def apply_detection_rules(sender, instance, raw=False, **kwargs):
+    """Apply assignment and escalation rules to a detection before it is inserted."""
+    if instance._state.adding and not raw:
+        instance._triggered_rules = apply_rules([instance])
+
+
+@receiver(post_save, sender=DetectionResult)
+def record_detection_rules(sender, instance, created, **kwargs):
+    """Send the rule events of a newly inserted detection."""
+    if created:
+        record_rule_executions(getattr(instance, '_triggered_rules', None))
+        instance._triggered_rules = None
 
 
 @receiver(post_save, sender=Platform)
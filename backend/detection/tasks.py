@@ -0,0 +1,106 @@
+"""
+Celery tasks for the detection app.
+
+Scoring is CPU-bound and runs on the ``ml`` queue; rollup maintenance is
+one long transaction and runs on ``bulk`` (see CELERY_TASK_ROUTES).
+"""
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from hack2drug.counter_buffer import counter_buffer
+from .rollups import compact_rollups, rebuild_rollups
+from .services import score_collected_content
+
+logger = logging.getLogger('detection')
+
+SCORING_LOCK_KEY = 'hack2drug:scoring:lock'
+
+
+@shared_task(acks_late=True)
+def score_content_batch(content_ids, unprocessed_only=True):
+    """Score the given CollectedContent rows (those not scored yet by default); returns the scoring summary."""
+    from monitoring.models import CollectedContent
+
+    queryset = CollectedContent.objects.filter(pk__in=content_ids)
+    if unprocessed_only:
+        queryset = queryset.filter(processed=False)
+    summary = score_collected_content(queryset)
+    logger.info('Scored %(scored)s items (%(suspicious)s suspicious)', summary)
+    return summary
+
+
+def queue_content_scoring(content_ids, batch_size=None, unprocessed_only=True):
+    """
+    Queue score_content_batch tasks for ``content_ids`` in batches of
+    ``batch_size`` once the current transaction commits, stamping the
+    rows' scoring_queued_at. Returns the number of batches.
+    """
+    from monitoring.models import CollectedContent
+
+    batch_size = batch_size or settings.DETECTION_SCORING_BATCH_SIZE
+    batches = [content_ids[start:start + batch_size] for start in range(0, len(content_ids), batch_size)]
+    now = timezone.now()
+    for batch in batches:
+        CollectedContent.objects.filter(pk__in=batch).update(scoring_queued_at=now)
+
+    def enqueue():
+        for batch in batches:
+            score_content_batch.delay(batch, unprocessed_only)
+
+    if batches:
+        transaction.on_commit(enqueue)
+    return len(batches)
+
+
+@shared_task(acks_late=True)
+def score_unprocessed_content(batch_size=None, max_batches=None):
+    """
+    Queue score_content_batch tasks for unprocessed content that is not
+    queued already, at most DETECTION_SCORING_MAX_BATCHES per run.
+
+    Queued rows are stamped with scoring_queued_at, so runs while their
+    batch still waits in the queue skip them. Rows still unprocessed
+    DETECTION_SCORING_REQUEUE_AFTER seconds after they were queued (a
+    lost or failed batch) are queued again; other queued rows are not.
+    """
+    from monitoring.models import CollectedContent
+
+    batch_size = batch_size or settings.DETECTION_SCORING_BATCH_SIZE
+    max_batches = max_batches or settings.DETECTION_SCORING_MAX_BATCHES
+    if not cache.add(SCORING_LOCK_KEY, 1, timeout=60):
+        return 0
+    try:
+        stale = timezone.now() - timedelta(seconds=settings.DETECTION_SCORING_REQUEUE_AFTER)
+        with transaction.atomic():
+            content_ids = list(
+                CollectedContent.objects.filter(processed=False)
+                .filter(Q(scoring_queued_at__isnull=True) | Q(scoring_queued_at__lt=stale))
+                .order_by('pk').values_list('pk', flat=True)[:batch_size * max_batches]
+            )
+            queue_content_scoring(content_ids, batch_size)
+    finally:
+        cache.delete(SCORING_LOCK_KEY)
+    return len(content_ids)
+
+
+@shared_task(acks_late=True)
+def rebuild_detection_rollups():
+    """Recompute hourly detection rollups from DetectionResult."""
+    counter_buffer.flush()
+    return rebuild_rollups()
+
+
+@shared_task(acks_late=True)
+def compact_detection_rollups():
+    """Fold old hourly rollup buckets into daily ones."""
+    before, after = compact_rollups()
+    logger.info('Compacted %s rollup buckets into %s', before, after)
+    return after
@@ -1,3 +1,799 @@
-from django.test import TestCase
+"""
+Tests for the detection engine, rules and bulk ingest bookkeeping.
+"""
 
-# Create your tests here.
+import random
+import re
+from collections import Counter
+import shutil
+import tempfile
+from datetime import timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from hack2drug.counter_buffer import counter_buffer
+from hack2drug.testing import IsolatedTestCase
+from monitoring.models import CollectedContent, MonitoringSession
+from users.models import User
+from .cache import VersionedCache, bump_version, get_version, pattern_cache
+from .cascade import CASCADE_STAGES, STATS_KEY_PREFIX, CascadeStats
+from .counters import rebuild_daily_analytics
+from .features import FEATURE_SETS, get_featurizer, transform_batches
+from .fuzzy import fuzzy_search
+from .ml import MLModel, load_model, register_model, save_model
+from . import parallel
+from .engine import AhoCorasick, CompiledPatternSet, PatternSpec, _is_word_char, load_active_patterns
+from .models import (
+    DetectionAnalytics, DetectionPattern, DetectionResult, DetectionRollup, DetectionRule,
+    DrugCategory, MLModelVersion, Platform,
+)
+from .rollups import compact_rollups, live_stats, rebuild_rollups, rollup_stats
+from .search import search
+from .rules import CompiledRuleSet, SEVERITY_ORDER, compile_conditions, compile_rule, rule_cache
+from .services import bulk_create_detections, score_texts
+from .usage import usage_tracker
+from .views import DetectionRuleViewSet
+
+def naive_occurrences(terms, text):
+    """Every (term_index, start, end) of terms in text, by brute force."""
+    found = []
+    for index, term in enumerate(terms):
+        start = text.find(term)
+        while start != -1:
+            found.append((index, start, start + len(term)))
+            start = text.find(term, start + 1)
+    return sorted(found)
+
+
+def spec(id, pattern_type, terms, priority=1):
+    weight = 0.7 if pattern_type == 'keyword' else 0.8
+    return PatternSpec(id, f'pattern {id}', pattern_type, tuple(terms), weight, 0.7, priority, ())
+
+
+class AhoCorasickTests(SimpleTestCase):
+
+    def test_overlapping_terms(self):
+        terms = ['he', 'she', 'his', 'hers']
+        automaton = AhoCorasick(terms)
+        self.assertEqual(
+            sorted(automaton.iter('ushers')),
+            [(0, 2, 4), (1, 1, 4), (3, 2, 6)],
+        )
+
+    def test_matches_naive_search(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            terms = list({
+                ''.join(rng.choice('abc') for _ in range(rng.randint(1, 4)))
+                for _ in range(rng.randint(1, 8))
+            })
+            text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 40)))
+            self.assertEqual(
+                sorted(AhoCorasick(terms).iter(text)), naive_occurrences(terms, text),
+                msg=f'terms={terms!r} text={text!r}',
+            )
+
+
+class CompiledPatternSetTests(SimpleTestCase):
+
+    def naive_keywords(self, specs, text):
+        lowered = text.lower()
+        found = {}
+        for pattern in specs:
+            for term in pattern.terms:
+                for match in re.finditer(re.escape(term), lowered):
+                    start, end = match.span()
+                    if start > 0 and _is_word_char(lowered[start - 1]):
+                        continue
+                    if end < len(lowered) and _is_word_char(lowered[end]):
+                        continue
+                    found.setdefault(pattern.id, set()).add((term, start, end))
+        return found
+
+    def naive_regex(self, specs, text):
+        found = {}
+        for pattern in specs:
+            for expression in pattern.terms:
+                for match in re.finditer(expression, text, re.IGNORECASE):
+                    found.setdefault(pattern.id, set()).add((match.group(), match.start(), match.end()))
+        return found
+
+    def as_sets(self, found):
+        return {
+            pattern_id: {(match.term, match.start, match.end) for match in matches}
+            for pattern_id, matches in found.items()
+        }
+
+    def test_keywords_match_naive_word_search(self):
+        specs = [
+            spec(1, 'keyword', ['coke', 'cocaine', 'snow']),
+            spec(2, 'keyword', ['coke', 'pills']),
+            spec(3, 'keyword', ['molly', 'mdma', 'ice']),
+        ]
+        pattern_set = CompiledPatternSet(specs)
+        texts = [
+            'Buy COKE and pills', 'cokehead snowfall', 'ice, ice; molly!', 'nice price',
+            'coke coke coke', '', 'mdma_ok mdma-ok',
+        ]
+        for text in texts:
+            self.assertEqual(
+                self.as_sets(pattern_set.scan_keywords(text)), self.naive_keywords(specs, text),
+                msg=text,
+            )
+
+    def test_regex_matches_naive_search(self):
+        specs = [
+            spec(1, 'regex', [r'coke|cocaine'], priority=3),
+            spec(2, 'regex', [r'cocaine'], priority=2),
+            spec(3, 'regex', [r'\bbuy\b', r'\d+\s*g\b']),
+            spec(4, 'regex', [r'(mdma|xtc)\s+pills']),
+            spec(5, 'regex', [r'(?i)WICKR']),
+        ]
+        pattern_set = CompiledPatternSet(specs)
+        self.assertEqual(pattern_set.regex_count, 6)
+        texts = [
+            'buy cocaine now', 'BUY coke, 5 g or 10g', 'mdma pills on wickr', 'nothing here',
+            'cocaine cocaine', 'xtc   pills', '',
+        ]
+        for text in texts:
+            self.assertEqual(
+                self.as_sets(pattern_set.scan_regex(text)), self.naive_regex(specs, text),
+                msg=text,
+            )
+
+    def test_invalid_regex_is_skipped(self):
+        pattern_set = CompiledPatternSet([spec(1, 'regex', ['(unclosed', 'fine'])])
+        self.assertEqual(pattern_set.regex_count, 1)
+        self.assertEqual(list(pattern_set.scan_regex('fine')), [1])
+
+    def test_single_keyword_reaches_default_threshold(self):
+        pattern_set = CompiledPatternSet([spec(1, 'keyword', ['cocaine', 'coke'])])
+        hit, = pattern_set.scan('selling cocaine')
+        self.assertGreaterEqual(hit.confidence, hit.threshold)
+        hit, = pattern_set.scan('cocaine and coke')
+        self.assertAlmostEqual(hit.confidence, 0.91)
+
+
+def rule(id, rule_type, conditions, actions=None, priority=1):
+    return DetectionRule(
+        id=id, name=f'rule {id}', rule_type=rule_type, conditions=conditions,
+        actions=actions or {}, priority=priority,
+    )
+
+
+def detection(severity='high', platform_id=1, pattern_id=10, status='pending', confidence=0.9,
+              keywords=()):
+    return DetectionResult(
+        platform_id=platform_id, detection_pattern_id=pattern_id, severity_level=severity,
+        status=status, confidence_score=confidence, detected_keywords=list(keywords),
+    )
+
+
+class RuleCompilationTests(SimpleTestCase):
+
+    def test_rejects_malformed_conditions(self):
+        for conditions in (
+            [], {'severity': 'urgent'}, {'min_severity': 'huge'}, {'platform': 'telegram'},
+            {'min_confidence': 'high'}, {'colour': 'red'},
+        ):
+            with self.assertRaises(ValueError, msg=conditions):
+                compile_conditions(conditions)
+
+    def test_severity_conditions_intersect(self):
+        index_values, predicates = compile_conditions({'severity': ['medium', 'critical'],
+                                                       'min_severity': 'high'})
+        self.assertEqual(index_values, {'severity': {'critical'}})
+        self.assertEqual(predicates, [])
+
+    def test_rejects_unusable_actions(self):
+        with self.assertRaises(ValueError):
+            compile_rule(rule(1, 'auto_assign', {}))
+        with self.assertRaises(ValueError):
+            compile_rule(rule(1, 'auto_assign', {}, {'assign_to': 'bob'}))
+        with self.assertRaises(ValueError):
+            compile_rule(rule(1, 'auto_assign', {}, {'assign_to': [1, 2]}), users={1})
+        compiled = compile_rule(rule(1, 'auto_assign', {}, {'assign_to': 2}), users={2})
+        self.assertEqual(compiled.actions['assign_to'], [2])
+
+
+class CompiledRuleSetTests(SimpleTestCase):
+
+    def naive_matches(self, conditions, item, categories):
+        """Evaluate the indexed and scalar conditions without any index."""
+        for key, value in conditions.items():
+            values = value if isinstance(value, list) else [value]
+            if key == 'severity' and item.severity_level not in values:
+                return False
+            if key == 'min_severity' and (
+                SEVERITY_ORDER.index(item.severity_level) < SEVERITY_ORDER.index(value)
+            ):
+                return False
+            if key == 'platform' and item.platform_id not in values:
+                return False
+            if key == 'category' and categories.isdisjoint(values):
+                return False
+            if key == 'status' and item.status not in values:
+                return False
+            if key == 'min_confidence' and item.confidence_score < value:
+                return False
+        return True
+
+    def test_index_matches_naive_evaluation(self):
+        conditions = [
+            {}, {'severity': 'high'}, {'min_severity': 'medium'}, {'platform': [1, 3]},
+            {'category': 5}, {'category': [5, 6], 'severity': ['low', 'critical']},
+            {'platform': 2, 'min_confidence': 0.8}, {'status': 'pending', 'category': 7},
+        ]
+        rules = [rule(index, 'notification', value) for index, value in enumerate(conditions)]
+        pattern_categories = {10: frozenset({5}), 11: frozenset({6, 7}), 12: frozenset()}
+        rule_set = CompiledRuleSet([compile_rule(item) for item in rules], pattern_categories)
+
+        rng = random.Random(3)
+        for _ in range(300):
+            item = detection(
+                severity=rng.choice(SEVERITY_ORDER), platform_id=rng.randint(1, 3),
+                pattern_id=rng.choice([10, 11, 12, 13]), status=rng.choice(['pending', 'confirmed']),
+                confidence=rng.random(),
+            )
+            categories = pattern_categories.get(item.detection_pattern_id, frozenset())
+            expected = [
+                rules[index].id for index, value in enumerate(conditions)
+                if self.naive_matches(value, item, categories)
+            ]
+            self.assertEqual([matched.id for matched in rule_set.matching(item)], expected)
+
+    def test_exclusive_rule_types_apply_once(self):
+        rule_set = CompiledRuleSet([
+            compile_rule(rule(1, 'auto_escalate', {'min_severity': 'high'}, priority=3)),
+            compile_rule(rule(2, 'auto_escalate', {}, priority=2)),
+            compile_rule(rule(3, 'notification', {}, priority=1)),
+            compile_rule(rule(4, 'notification', {'keywords': ['Coke']}, priority=1)),
+        ], {})
+        self.assertEqual([matched.id for matched in rule_set.matching(detection('critical'))], [1, 3])
+        self.assertEqual(
+            [matched.id for matched in rule_set.matching(detection('low', keywords=['coke']))],
+            [2, 3, 4],
+        )
+
+    def test_round_robin_assignment(self):
+        compiled = compile_rule(rule(1, 'auto_assign', {}, {'assign_to': [4, 5]}))
+        rule_set = CompiledRuleSet([compiled], {})
+        self.assertEqual([rule_set.next_assignee(compiled) for _ in range(5)], [4, 5, 4, 5, 4])
+
+
+class BulkIngestCountersTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        self.category = DrugCategory.objects.create(name='Stimulants')
+        self.pattern = DetectionPattern.objects.create(
+            name='cocaine', pattern_type='keyword', pattern_data='cocaine,coke'
+        )
+        self.pattern.drug_categories.add(self.category)
+        DetectionRule.objects.create(
+            name='escalate critical', rule_type='auto_escalate',
+            conditions={'min_severity': 'critical', 'category': self.category.pk},
+        )
+        rule_cache.invalidate()
+        pattern_cache.invalidate()
+
+    def items(self, severities):
+        return [
+            {
+                'detection_pattern_id': self.pattern.pk,
+                'content_text': f'message {index}',
+                'content_id': str(index),
+                'confidence_score': 0.95 if severity == 'critical' else 0.5,
+                'severity_level': severity,
+            }
+            for index, severity in enumerate(severities)
+        ]
+
+    def test_counters_and_rollups_after_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = bulk_create_detections(self.platform, self.items(['critical', 'critical', 'low']),
+                                             batch_size=2)
+        self.assertEqual(len(created), 3)
+        self.assertEqual(
+            sorted(DetectionResult.objects.values_list('status', flat=True)),
+            ['escalated', 'escalated', 'pending'],
+        )
+        # Buffered until flushed.
+        self.platform.refresh_from_db()
+        self.assertEqual(self.platform.total_detections, 0)
+        self.assertFalse(DetectionRollup.objects.exists())
+
+        counter_buffer.flush()
+        self.platform.refresh_from_db()
+        self.assertEqual(self.platform.total_detections, 3)
+        analytics = DetectionAnalytics.objects.get(date=timezone.now().date())
+        self.assertEqual(analytics.telegram_detections, 3)
+        self.assertEqual(analytics.critical_severity, 2)
+        self.assertEqual(analytics.low_severity, 1)
+        self.assertEqual(analytics.escalated, 2)
+        self.assertEqual(analytics.pending_review, 1)
+
+        incremental = {
+            (row.hour.astimezone(dt_timezone.utc), row.severity_level, row.status): (
+                row.count, round(row.confidence_sum, 4)
+            )
+            for row in DetectionRollup.objects.all()
+        }
+        self.assertEqual(
+            {(severity, status): counts for (hour, severity, status), counts in incremental.items()},
+            {('critical', 'escalated'): (2, 1.9), ('low', 'pending'): (1, 0.5)},
+        )
+        rebuild_rollups()
+        rebuilt = {
+            (row.hour.astimezone(dt_timezone.utc), row.severity_level, row.status): (
+                row.count, round(row.confidence_sum, 4)
+            )
+            for row in DetectionRollup.objects.all()
+        }
+        self.assertEqual(incremental, rebuilt)
+
+    def test_incremental_analytics_match_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_detections(self.platform, self.items(['medium', 'critical', 'high', 'low']))
+        counter_buffer.flush()
+        fields = ['telegram_detections', 'low_severity', 'medium_severity', 'high_severity',
+                  'critical_severity', 'pending_review', 'escalated']
+        today = timezone.now().date()
+        incremental = DetectionAnalytics.objects.values(*fields).get(date=today)
+        rebuild_daily_analytics(today)
+        self.assertEqual(DetectionAnalytics.objects.values(*fields).get(date=today), incremental)
+
+    def test_single_saves_are_added_to_concurrent_increments(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for item in self.items(['high', 'low']):
+                DetectionResult.objects.create(platform=self.platform, **item)
+        # Another worker's increments land before this process flushes.
+        Platform.objects.filter(pk=self.platform.pk).update(total_detections=10)
+        DetectionAnalytics.objects.create(date=timezone.now().date(), telegram_detections=10)
+        counter_buffer.flush()
+        self.platform.refresh_from_db()
+        self.assertEqual(self.platform.total_detections, 12)
+        analytics = DetectionAnalytics.objects.get(date=timezone.now().date())
+        self.assertEqual((analytics.telegram_detections, analytics.high_severity, analytics.low_severity), (12, 1, 1))
+
+    def test_nothing_is_counted_when_the_transaction_rolls_back(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                bulk_create_detections(self.platform, self.items(['high']))
+                raise RuntimeError('rolled back')
+        self.assertEqual(callbacks, [])
+        counter_buffer.flush()
+        self.platform.refresh_from_db()
+        self.assertEqual(self.platform.total_detections, 0)
+        self.assertFalse(DetectionResult.objects.exists())
+
+
+class RollupStatsTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        platforms = [
+            Platform.objects.create(name=name, platform_type=name.lower()) for name in ('Telegram', 'Twitter')
+        ]
+        category = DrugCategory.objects.create(name='Stimulants')
+        pattern = DetectionPattern.objects.create(name='cocaine', pattern_type='keyword', pattern_data='cocaine')
+        pattern.drug_categories.add(category)
+        other = DetectionPattern.objects.create(name='other', pattern_type='keyword', pattern_data='pills')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.detections = [
+                DetectionResult.objects.create(
+                    platform=platforms[index % 2], detection_pattern=(pattern, other)[index % 3 == 0],
+                    content_text=f'message {index}', confidence_score=0.5 + index / 25,
+                    severity_level='high',
+                )
+                for index in range(8)
+            ]
+
+    def assertMatchesLive(self):
+        counter_buffer.flush()
+        with self.assertNumQueries(2):
+            stats = rollup_stats()
+        self.assertEqual(stats, live_stats(DetectionResult.objects.all()))
+        return stats
+
+    def test_stats_follow_status_changes_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.detections[1].status = 'confirmed'
+            self.detections[1].save()
+            self.detections[2].status = 'false_positive'
+            self.detections[2].save(update_fields=['status'])
+            self.detections[3].delete()
+        stats = self.assertMatchesLive()
+        self.assertEqual(
+            (stats['total_detections'], stats['confirmed_detections'], stats['false_positives']), (7, 1, 1),
+        )
+
+    def test_compacted_buckets_give_the_same_stats(self):
+        counter_buffer.flush()
+        old = timezone.now() - timedelta(days=settings.ROLLUP_COMPACT_AFTER_DAYS + 5)
+        for index, detection in enumerate(self.detections[:5]):
+            DetectionResult.objects.filter(pk=detection.pk).update(detected_at=old + timedelta(hours=index))
+        rebuild_rollups()
+        before, after = compact_rollups()
+        self.assertLess(after, before)
+        stats = self.assertMatchesLive()
+        self.assertEqual(stats['recent_detections'], 3)
+
+
+class CascadeGateTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.keyword = DetectionPattern.objects.create(
+            name='cocaine', pattern_type='keyword', pattern_data='cocaine,coke'
+        )
+        self.regex = DetectionPattern.objects.create(
+            name='quantities', pattern_type='regex', pattern_data=r'\b\d+\s*g\b'
+        )
+        pattern_cache.invalidate()
+        self.addCleanup(pattern_cache.invalidate)
+
+    def test_regex_only_match_is_suspicious(self):
+        result, = score_texts(['10g left, same day'])
+        self.assertTrue(result['is_suspicious'])
+        self.assertEqual([hit.pattern_id for hit in result['hits']], [self.regex.pk])
+
+    @override_settings(DETECTION_CASCADE_GATES={'regex': 1.0})
+    def test_scan_count_only_counts_evaluated_items(self):
+        pattern_cache.invalidate()
+        results = score_texts(['cocaine and coke, 10g', '10g left', 'hello'])
+        self.assertEqual([result['is_suspicious'] for result in results], [True, False, False])
+        counter_buffer.flush()
+        self.keyword.refresh_from_db()
+        self.regex.refresh_from_db()
+        self.assertEqual(self.keyword.scan_count, 3)
+        self.assertEqual(self.regex.scan_count, 1)
+        self.assertEqual(self.regex.match_count, 1)
+
+
+class ModelRegistryTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model_path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.model_path)
+        settings_override = override_settings(ML_MODEL_PATH=self.model_path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def classifier(self):
+        from sklearn.linear_model import LogisticRegression
+
+        texts = ['selling cocaine', 'mdma pills cheap', 'nice weather today', 'see you at lunch']
+        return LogisticRegression().fit(get_featurizer().transform(texts), [1, 1, 0, 0])
+
+    def files(self):
+        return sorted(path.name for path in (self.model_path / 'drugs').iterdir())
+
+    def test_versions_are_stored_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = register_model('drugs', self.classifier())
+        with self.captureOnCommitCallbacks(execute=True):
+            second = register_model('drugs', self.classifier())
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.assertEqual(self.files(), ['1.joblib', '2.joblib'])
+        probability, = load_model(second.artifact).predict(['cheap cocaine'])
+        self.assertGreater(probability, 0.5)
+
+    def test_failed_insert_leaves_no_artifact(self):
+        with mock.patch.object(MLModelVersion.objects, 'create', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                register_model('drugs', self.classifier())
+        self.assertEqual(self.files(), [])
+
+
+class FeaturizerTests(SimpleTestCase):
+
+    def test_featurizer_is_shared_and_fixed_width(self):
+        featurizer = get_featurizer()
+        self.assertIs(get_featurizer(settings.ML_DEFAULT_FEATURE_SET), featurizer)
+        features = featurizer.transform(['cocaine', 'a much longer message about the weather'])
+        self.assertEqual(features.shape, (2, FEATURE_SETS[settings.ML_DEFAULT_FEATURE_SET]['n_features']))
+        with self.assertRaises(ValueError):
+            get_featurizer('bag-of-words-v0')
+
+    def test_obfuscated_spellings_and_emoji_produce_features(self):
+        featurizer = get_featurizer()
+        plain, leet, emoji = featurizer.transform(['cocaine', 'C0CA1NE', '🍁🍁'])
+        self.assertEqual((plain != leet).nnz, 0)
+        self.assertGreater(emoji.nnz, 0)
+
+    def test_transform_batches_matches_one_transform(self):
+        texts = [f'message {index}' for index in range(5)] + [None]
+        batches = list(transform_batches(iter(texts), batch_size=4))
+        self.assertEqual([batch.shape[0] for batch in batches], [4, 2])
+        expected = get_featurizer().transform([text or '' for text in texts])
+        self.assertEqual((sparse.vstack(batches) != expected).nnz, 0)
+
+
+class MLModelTests(SimpleTestCase):
+
+    TEXTS = ['selling cocaine', 'mdma pills cheap', 'nice weather today', 'see you at lunch']
+
+    def setUp(self):
+        from sklearn.linear_model import LogisticRegression
+
+        self.model_path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.model_path)
+        self.vectorizer = get_featurizer()
+        self.classifier = LogisticRegression().fit(self.vectorizer.transform(self.TEXTS), [1, 1, 0, 0])
+
+    def test_predict_transforms_once_per_batch(self):
+        vectorizer = mock.Mock(wraps=self.vectorizer)
+        model = MLModel('drugs', vectorizer, self.classifier)
+        texts = self.TEXTS * 2 + [None]
+        probabilities = model.predict(texts, batch_size=4)
+        self.assertEqual(vectorizer.transform.call_count, 3)
+        self.assertEqual(probabilities.dtype, np.float32)
+        expected = self.classifier.predict_proba(self.vectorizer.transform([text or '' for text in texts]))[:, 1]
+        np.testing.assert_allclose(probabilities, expected, rtol=1e-6)
+
+    def test_missing_positive_label_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MLModel('drugs', self.vectorizer, self.classifier, positive_label='drug')
+
+    def test_artifact_arrays_are_memory_mapped_and_cached(self):
+        with override_settings(ML_MODEL_PATH=self.model_path, ML_MODEL_MMAP_MODE='r'), \
+                mock.patch.dict('detection.ml._models'):
+            save_model('drugs', self.vectorizer, self.classifier)
+            model = load_model('drugs')
+            self.assertIsInstance(model.classifier.coef_, np.memmap)
+            self.assertIs(load_model('drugs'), model)
+            self.assertGreater(model.predict(['cheap cocaine'])[0], 0.5)
+
+
+class FullTextSearchTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        pattern = DetectionPattern.objects.create(name='p', pattern_type='keyword', pattern_data='coke')
+        texts = ['Cocaine and more cocaine, DM me', 'Fresh cocaine delivered', 'Weather is nice', 'Cocáine sale']
+        self.detections = [
+            DetectionResult.objects.create(
+                platform=platform, detection_pattern=pattern, content_text=text,
+                confidence_score=0.9, severity_level='high',
+            )
+            for text in texts
+        ]
+
+    def test_ranks_matches_best_first(self):
+        results = list(search(DetectionResult.objects.all(), 'cocaine'))
+        self.assertEqual(
+            {result.pk for result in results},
+            {self.detections[index].pk for index in (0, 1, 3)},
+        )
+        ranks = [result.search_rank for result in results]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_index_follows_updates_and_deletes(self):
+        self.detections[2].content_text = 'cocaine weather'
+        self.detections[2].save(update_fields=['content_text'])
+        self.detections[0].delete()
+        self.assertEqual(
+            {result.pk for result in search(DetectionResult.objects.all(), 'cocaine weather')},
+            {self.detections[2].pk},
+        )
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(list(search(DetectionResult.objects.all(), '" OR NEAR(')), [])
+        self.assertEqual(len(search(DetectionResult.objects.all(), 'deliv*')), 1)
+
+
+class FuzzySearchTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user(username='analyst', password='secret')
+        platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        self.sessions = [
+            MonitoringSession.objects.create(platform=platform, user=user, name=name, target_channels=[])
+            for name in ('Markets', 'Forums')
+        ]
+        self.model = CollectedContent
+        self.contents = [
+            CollectedContent.objects.create(
+                monitoring_session=session, platform=platform, content_type='message',
+                content_id=str(index), content_text=text, channel_id='channel-1', timestamp=timezone.now(),
+            )
+            for index, (session, text) in enumerate([
+                (self.sessions[0], 'Pure C0CA1NE, same day'),
+                (self.sessions[0], 'm.d.m.a pills for the weekend'),
+                (self.sessions[1], 'cocaine by the gram'),
+                (self.sessions[1], 'Lovely weather today'),
+            ])
+        ]
+
+    def pks(self, results):
+        return [result.pk for result in results]
+
+    def test_obfuscated_text_is_found(self):
+        results = fuzzy_search(self.model.objects.all(), 'cocaine')
+        self.assertEqual(set(self.pks(results)), {self.contents[0].pk, self.contents[2].pk})
+        self.assertTrue(all(result.similarity == 1.0 for result in results))
+        self.assertEqual(self.pks(fuzzy_search(self.model.objects.all(), 'MDMA')), [self.contents[1].pk])
+
+    def test_queryset_filters_restrict_candidates(self):
+        queryset = self.model.objects.filter(monitoring_session=self.sessions[1])
+        self.assertEqual(self.pks(fuzzy_search(queryset, 'c0caine')), [self.contents[2].pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.contents[3].content_text = 'k3tamine and c0ke'
+        self.contents[3].save()
+        self.contents[0].delete()
+        self.assertEqual(self.pks(fuzzy_search(self.model.objects.all(), 'ketamine')), [self.contents[3].pk])
+        self.assertEqual(self.pks(fuzzy_search(self.model.objects.all(), 'pure cocaine')), [])
+
+
+class RuleTestActionTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='analyst', email='analyst@example.org', password='x')
+        self.user.role = 'USER'
+        self.user.save(update_fields=['role'])
+        self.rule = DetectionRule.objects.create(
+            name='critical only', rule_type='auto_escalate', conditions={'min_severity': 'critical'},
+        )
+        self.view = DetectionRuleViewSet.as_view({'post': 'test_rule'})
+
+    def post(self, data):
+        request = APIRequestFactory().post(f'/detection/rules/{self.rule.pk}/test/', data, format='json')
+        force_authenticate(request, self.user)
+        return self.view(request, pk=self.rule.pk)
+
+    def test_unsaved_detection_fields_are_validated(self):
+        self.assertEqual(self.post({'confidence_score': 'high'}).status_code, 400)
+        self.assertEqual(self.post({'severity_level': 'extreme'}).status_code, 400)
+        self.assertEqual(self.post({}).status_code, 400)
+        response = self.post({'severity_level': 'critical', 'confidence_score': '0.95'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['matches'])
+
+    def test_stored_detection_must_be_visible_to_the_user(self):
+        other = User.objects.create_user(username='other', email='other@example.org', password='x')
+        platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        pattern = DetectionPattern.objects.create(name='p', pattern_type='keyword', pattern_data='coke')
+        own, hidden = [
+            DetectionResult.objects.create(
+                platform=platform, detection_pattern=pattern, content_text='coke',
+                confidence_score=0.95, severity_level='critical', assigned_to=assignee,
+            )
+            for assignee in (self.user, other)
+        ]
+        self.assertEqual(self.post({'detection_id': hidden.pk}).status_code, 404)
+        response = self.post({'detection_id': own.pk})
+        self.assertEqual((response.status_code, response.data['detection_id']), (200, own.pk))
+
+
+class InProcessExecutor:
+    """Stands in for the ProcessPoolExecutor, running chunks in this process."""
+
+    def map(self, function, *iterables):
+        return map(function, *iterables)
+
+
+class ScoringWorkerTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pattern = DetectionPattern.objects.create(name='cocaine', pattern_type='keyword', pattern_data='cocaine')
+        self.addCleanup(setattr, parallel, '_worker_pattern_set', None)
+
+    def test_worker_recompiles_when_specs_change_under_the_same_version(self):
+        parent = load_active_patterns(version=1)
+        self.assertEqual(parallel._load_pattern_set(1, parent.fingerprint).fingerprint, parent.fingerprint)
+
+        self.pattern.pattern_data = 'heroin'
+        self.pattern.save()
+        changed = load_active_patterns(version=1)
+        self.assertNotEqual(changed.fingerprint, parent.fingerprint)
+        # A worker that still has the parent's patterns keeps using them...
+        self.assertEqual(parallel._scan_chunk(1, parent.fingerprint, ['cocaine'])[1]['keyword'], 1)
+        # ...but one compiling now cannot reproduce them.
+        parallel._worker_pattern_set = None
+        self.assertEqual(parallel._scan_chunk(1, parent.fingerprint, ['cocaine']), (None, None))
+        self.assertEqual(parallel._load_pattern_set(1, changed.fingerprint).fingerprint, changed.fingerprint)
+
+    def test_parent_rescans_chunks_the_workers_cannot_match(self):
+        parent = load_active_patterns(version=1)
+        self.pattern.pattern_data = 'heroin'
+        self.pattern.save()
+        pool = parallel.ScoringPool(workers=2, chunk_size=1)
+        stats = Counter()
+        with mock.patch.object(pool, '_get_executor', return_value=InProcessExecutor()):
+            scanned = pool.scan_many(['cocaine', 'heroin'], parent, stats)
+        self.assertEqual([keywords for hits, probabilities, keywords in scanned], [['cocaine'], []])
+        self.assertEqual(stats['items'], 2)
+
+
+class PatternUsageTests(IsolatedTestCase):
+
+    def test_counts_survive_a_failed_flush(self):
+        pattern = DetectionPattern.objects.create(name='cocaine', pattern_type='keyword', pattern_data='cocaine')
+        pattern_cache.invalidate()
+        self.addCleanup(pattern_cache.invalidate)
+        score_texts(['cocaine', 'nothing'])
+        with mock.patch.object(usage_tracker, '_write', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                usage_tracker.flush()
+        score_texts(['more cocaine'])
+        usage_tracker.flush()
+        pattern.refresh_from_db()
+        self.assertEqual((pattern.match_count, pattern.scan_count), (2, 3))
+        self.assertIsNotNone(pattern.last_used)
+
+
+class CascadeStatsTests(IsolatedTestCase):
+
+    def test_unwritten_counts_survive_a_failed_flush(self):
+        cache.delete_many([STATS_KEY_PREFIX + name for name in ('items',) + CASCADE_STAGES])
+        stats = CascadeStats()
+        stats.record(Counter({'items': 10, 'keyword': 10, 'regex': 4}))
+        incr, calls = cache.incr, []
+
+        def flaky_incr(key, delta=1):
+            calls.append(key)
+            if len(calls) == 2:
+                raise ConnectionError('cache went away')
+            return incr(key, delta)
+
+        with mock.patch.object(cache, 'incr', flaky_incr):
+            with self.assertRaises(ConnectionError):
+                stats.flush()
+        self.assertEqual(stats.snapshot(), {'keyword': 10, 'regex': 4})
+        stats.flush()
+        totals = stats.totals()
+        self.assertEqual(totals['items'], 10)
+        self.assertEqual([stage['evaluated'] for stage in totals['stages']], [10, 4, 0])
+
+
+class RuleCacheInvalidationTests(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='analyst', email='analyst@example.org', password='x')
+
+    def bumps(self, change):
+        before = get_version('detection_rules')
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return get_version('detection_rules') != before
+
+    def test_only_assignee_changes_bump_the_rule_version(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Ana'
+        self.assertFalse(self.bumps(user.save))
+        self.assertFalse(self.bumps(lambda: user.save(update_fields=['last_login'])))
+        user.role = 'investigator'
+        self.assertTrue(self.bumps(user.save))
+        user.is_active = False
+        self.assertTrue(self.bumps(lambda: user.save(update_fields=['is_active'])))
+        self.assertTrue(self.bumps(user.delete))
+
+    def test_unreachable_cache_keeps_the_compiled_object(self):
+        builds = []
+        versioned = VersionedCache('test_unreachable', builds.append, check_interval=0)
+        versioned.get()
+        with mock.patch.object(cache, 'get', side_effect=ConnectionError('cache went away')), \
+                mock.patch.object(cache, 'incr', side_effect=ConnectionError('cache went away')):
+            self.assertIsNone(bump_version('test_unreachable'))
+            self.assertIsNone(get_version('test_unreachable'))
+            versioned.get()
+        self.assertEqual(len(builds), 1)
@@ -29,6 +29,8 @@ urlpatterns = [
     
     # Pattern testing endpoint
     path('patterns/<int:pk>/test/', views.DetectionPatternViewSet.as_view({'post': 'test_pattern'}), name='test_pattern'),
+    path('patterns/usage/', views.DetectionPatternViewSet.as_view({'get': 'usage'}), name='pattern_usage'),
+    path('patterns/cascade/', views.DetectionPatternViewSet.as_view({'get': 'cascade'}), name='pattern_cascade'),
     
     # Platform connection testing endpoint
     path('platforms/<int:pk>/test-connection/', views.PlatformViewSet.as_view({'post': 'test_connection'}), name='test_connection'),
@@ -0,0 +1,117 @@
+"""
+In-memory usage tracking for detection patterns.
+
+The scoring path records which patterns matched; counts are aggregated
+per process and written back by the counter buffer's periodic flush as
+two bulk UPDATE statements, so matching never writes to the database.
+"""
+
+import threading
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.utils import timezone
+
+from hack2drug.counter_buffer import counter_buffer
+
+
+class PatternUsageTracker:
+    """
+    Per-process match and scan counters for DetectionPattern rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matches = Counter()
+        self._last_matched = {}
+        self._scans = Counter()  # tuple of pattern ids of one stage -> items scanned
+
+    def record(self, pattern_set, hits_per_item, stats=None):
+        """
+        Record one match per pattern hit and one scan per item a pattern
+        evaluated. ``stats`` holds the scan_many() cascade counts; items
+        that never reached a pattern's stage are not scans of it. Without
+        it every item counts as scanned by every pattern.
+        """
+        if not pattern_set.specs:
+            return
+        now = timezone.now()
+        matches = Counter()
+        items = 0
+        for hits in hits_per_item:
+            items += 1
+            matches.update(hit.pattern_id for hit in hits)
+        by_stage = {}
+        for pattern_id, spec in pattern_set.specs.items():
+            by_stage.setdefault(spec.pattern_type, []).append(pattern_id)
+        with self._lock:
+            for stage, pattern_ids in by_stage.items():
+                scanned = items if stats is None else stats.get(stage, 0)
+                if scanned:
+                    self._scans[tuple(sorted(pattern_ids))] += scanned
+            self._matches.update(matches)
+            for pattern_id in matches:
+                self._last_matched[pattern_id] = now
+        if counter_buffer.is_enabled():
+            counter_buffer.start()
+        else:
+            self.flush()
+
+    def snapshot(self):
+        """Return pending (unflushed) match counts."""
+        with self._lock:
+            return dict(self._matches)
+
+    def flush(self):
+        """Write pending counts to DetectionPattern in bulk."""
+        with self._lock:
+            matches, last_matched, scans = self._matches, self._last_matched, self._scans
+            self._matches, self._last_matched, self._scans = Counter(), {}, Counter()
+
+        try:
+            with transaction.atomic():
+                self._write(matches, last_matched, scans)
+        except Exception:
+            # Put the counts back so they are retried on the next flush.
+            with self._lock:
+                self._matches.update(matches)
+                self._scans.update(scans)
+                for pattern_id, when in last_matched.items():
+                    if pattern_id not in self._last_matched:
+                        self._last_matched[pattern_id] = when
+            raise
+
+    def _write(self, matches, last_matched, scans):
+        from .models import DetectionPattern
+
+        if matches:
+            DetectionPattern.objects.filter(pk__in=list(matches)).update(
+                match_count=F('match_count') + Case(
+                    *[When(pk=pk, then=Value(count)) for pk, count in matches.items()],
+                    default=Value(0),
+                    output_field=BigIntegerField(),
+                ),
+                last_used=Case(
+                    *[When(pk=pk, then=Value(when)) for pk, when in last_matched.items()],
+                    default=F('last_used'),
+                ),
+            )
+
+        # Patterns compiled into the same set were scanned the same number
+        # of times, so group by increment to keep this to a few statements.
+        by_count = Counter()
+        for pattern_ids, count in scans.items():
+            for pattern_id in pattern_ids:
+                by_count[pattern_id] += count
+        increments = {}
+        for pattern_id, count in by_count.items():
+            increments.setdefault(count, []).append(pattern_id)
+        for count, pattern_ids in increments.items():
+            DetectionPattern.objects.filter(pk__in=pattern_ids).update(
+                scan_count=F('scan_count') + count
+            )
+
+
+usage_tracker = PatternUsageTracker()
+counter_buffer.add_flusher(usage_tracker.flush)
@@ -2,7 +2,8 @@ from rest_framework import viewsets, status, generics, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from django.db.models import Count, Avg, Q
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
@@ -13,8 +14,18 @@ from .serializers import (
     DrugCategorySerializer, DetectionPatternSerializer, PlatformSerializer,
     DetectionResultSerializer, DetectionResultCreateSerializer, DetectionResultUpdateSerializer,
     DetectionAnalyticsSerializer, DetectionRuleSerializer, DetectionStatsSerializer,
-    BulkDetectionSerializer, DetectionSearchSerializer
+    BulkDetectionSerializer, DetectionSearchSerializer, RuleTestSerializer
 )
+from .cache import get_pattern_set
+from .cascade import cascade_stats
+from .engine import compile_patterns
+from .services import bulk_create_detections
+from .usage import usage_tracker
+from .search import search
+from .rollups import rollup_stats, live_stats
+from .rules import compile_rule
+from monitoring.connectors import check_platform_connection, platform_spec
+from monitoring.models import PlatformConnection
 
 
 class DrugCategoryViewSet(viewsets.ModelViewSet):
@@ -49,20 +60,40 @@ class DetectionPatternViewSet(viewsets.ModelViewSet):
         if not test_content:
             return Response({'error': 'Test content required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Simple pattern matching (can be enhanced with ML models)
-        confidence = 0.0
-        if pattern.keywords:
-            keywords = pattern.keywords.lower().split(',')
-            content_lower = test_content.lower()
-            matches = sum(1 for keyword in keywords if keyword.strip() in content_lower)
-            confidence = min(1.0, matches / len(keywords)) if keywords else 0.0
+        hits = compile_patterns([pattern]).scan(test_content, normalize=settings.DETECTION_NORMALIZE_TEXT)
+        hit = hits[0] if hits else None
+        confidence = hit.confidence if hit else 0.0
         
         return Response({
             'pattern': DetectionPatternSerializer(pattern).data,
             'test_content': test_content,
             'confidence_score': confidence,
-            'matched': confidence > 0.5
+            'matches': [match._asdict() for match in hit.matches] if hit else [],
+            'matched': confidence >= pattern.confidence_threshold
         })
+    
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        pending = usage_tracker.snapshot()
+        patterns = self.get_queryset().order_by('-match_count', 'name').values(
+            'id', 'name', 'pattern_type', 'is_active', 'match_count', 'scan_count', 'last_used'
+        )
+        results = []
+        for pattern in patterns:
+            scan_count = pattern['scan_count']
+            pattern['pending_matches'] = pending.get(pattern['id'], 0)
+            pattern['hit_rate'] = round(pattern['match_count'] / scan_count, 6) if scan_count else 0.0
+            results.append(pattern)
+        return Response(results)
+    
+    @action(detail=False, methods=['get'])
+    def cascade(self, request):
+        """Items evaluated by each scoring stage, with the current stage gates."""
+        totals = cascade_stats.totals()
+        gates = get_pattern_set().gates
+        for stage in totals['stages']:
+            stage['gate'] = gates.get(stage['stage'])
+        return Response(totals)
 
 
 class PlatformViewSet(viewsets.ModelViewSet):
@@ -73,21 +104,37 @@ class PlatformViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def test_connection(self, request, pk=None):
         platform = self.get_object()
+        connection, created = PlatformConnection.objects.get_or_create(platform=platform)
         
         try:
-            # Test platform connection (placeholder for actual implementation)
-            # This would typically involve testing API keys, connectivity, etc.
-            return Response({
-                'platform': PlatformSerializer(platform).data,
-                'status': 'connected',
-                'message': 'Platform connection test successful'
-            })
+            result = async_to_sync(check_platform_connection)(platform_spec(platform))
         except Exception as e:
+            connection.record_error()
             return Response({
                 'platform': PlatformSerializer(platform).data,
                 'status': 'failed',
                 'message': f'Connection test failed: {str(e)}'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        connection.response_time = result['response_time']
+        connection.api_version = result['api_version']
+        connection.save(update_fields=['response_time', 'api_version'])
+        connection.connect()
+        return Response({
+            'platform': PlatformSerializer(platform).data,
+            'status': 'connected',
+            'response_time': result['response_time'],
+            'message': 'Platform connection test successful'
+        })
+
+
+def scope_detections(queryset, user):
+    """Restrict a DetectionResult queryset to what the user's role may see."""
+    if user.role == 'USER':
+        return queryset.filter(assigned_to=user)
+    if user.role == 'MANAGER':
+        return queryset.filter(assigned_to__organization=user.organization)
+    return queryset
 
 
 class DetectionResultViewSet(viewsets.ModelViewSet):
@@ -97,16 +144,15 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         queryset = DetectionResult.objects.select_related(
-            'category', 'pattern', 'platform', 'assigned_to'
+            'detection_pattern', 'platform', 'assigned_to'
         ).all()
         
         # Filter by user role
-        if self.request.user.role == 'USER':
-            queryset = queryset.filter(assigned_to=self.request.user)
-        elif self.request.user.role == 'MANAGER':
-            queryset = queryset.filter(assigned_to__organization=self.request.user.organization)
-        
-        return queryset
+        return scope_detections(queryset, self.request.user)
+    
+    def is_scoped(self):
+        """Whether the user's role restricts which detections they see."""
+        return self.request.user.role in ('USER', 'MANAGER')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -201,15 +247,17 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
         except Platform.DoesNotExist:
             return Response({'error': 'Platform not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        created_detections = []
-        for detection_data in detections_data:
-            detection_data['platform'] = platform
-            detection = DetectionResult.objects.create(**detection_data)
-            created_detections.append(detection)
+        created_ids = bulk_create_detections(
+            platform,
+            detections_data,
+            batch_size=serializer.validated_data.get('batch_size'),
+        )
         
         return Response({
-            'message': f'{len(created_detections)} detections created successfully',
-            'detections': DetectionResultSerializer(created_detections, many=True).data
+            'message': f'{len(created_ids)} detections created successfully',
+            'batch_id': serializer.validated_data.get('batch_id'),
+            'created': len(created_ids),
+            'ids': created_ids,
         }, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['get'])
@@ -220,14 +268,8 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
         data = serializer.validated_data
         
-        if data.get('query'):
-            queryset = queryset.filter(
-                Q(content__icontains=data['query']) |
-                Q(location__icontains=data['query'])
-            )
-        
         if data.get('category'):
-            queryset = queryset.filter(category_id=data['category'])
+            queryset = queryset.filter(detection_pattern__drug_categories=data['category'])
         
         if data.get('platform'):
             queryset = queryset.filter(platform_id=data['platform'])
@@ -236,10 +278,10 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(status=data['status'])
         
         if data.get('date_from'):
-            queryset = queryset.filter(created_at__gte=data['date_from'])
+            queryset = queryset.filter(detected_at__date__gte=data['date_from'])
         
         if data.get('date_to'):
-            queryset = queryset.filter(created_at__lte=data['date_to'])
+            queryset = queryset.filter(detected_at__date__lte=data['date_to'])
         
         if data.get('confidence_min'):
             queryset = queryset.filter(confidence_score__gte=data['confidence_min'])
@@ -247,6 +289,10 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
         if data.get('confidence_max'):
             queryset = queryset.filter(confidence_score__lte=data['confidence_max'])
         
+        # Ranked full-text match last so its ordering is kept
+        if data.get('query'):
+            queryset = search(queryset, data['query'])
+        
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -257,37 +303,11 @@ class DetectionResultViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        queryset = self.get_queryset()
-        
-        total_detections = queryset.count()
-        pending_review = queryset.filter(status='PENDING').count()
-        confirmed_detections = queryset.filter(status='CONFIRMED').count()
-        false_positives = queryset.filter(status='FALSE_POSITIVE').count()
-        
-        detections_by_category = dict(
-            queryset.values('category__name').annotate(count=Count('id'))
-        )
-        
-        detections_by_platform = dict(
-            queryset.values('platform__name').annotate(count=Count('id'))
-        )
-        
-        average_confidence = queryset.aggregate(avg_confidence=Avg('confidence_score'))['avg_confidence'] or 0.0
-        
-        recent_detections = queryset.filter(
-            created_at__gte=timezone.now() - timedelta(days=7)
-        ).count()
-        
-        data = {
-            'total_detections': total_detections,
-            'pending_review': pending_review,
-            'confirmed_detections': confirmed_detections,
-            'false_positives': false_positives,
-            'detections_by_category': detections_by_category,
-            'detections_by_platform': detections_by_platform,
-            'average_confidence': round(average_confidence, 2),
-            'recent_detections': recent_detections
-        }
+        if self.is_scoped():
+            # Per-user views cannot be answered from the global rollups.
+            data = live_stats(self.get_queryset())
+        else:
+            data = rollup_stats()
         
         serializer = DetectionStatsSerializer(data)
         return Response(serializer.data)
@@ -320,17 +340,33 @@ class DetectionRuleViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def test_rule(self, request, pk=None):
         rule = self.get_object()
-        test_content = request.data.get('content', '')
+        serializer = RuleTestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
         
-        if not test_content:
-            return Response({'error': 'Test content required'}, status=status.HTTP_400_BAD_REQUEST)
+        if 'detection_id' in data:
+            detections = scope_detections(DetectionResult.objects.all(), request.user)
+            detection = detections.filter(pk=data['detection_id']).first()
+            if detection is None:
+                return Response({'error': 'Detection not found'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            # Evaluate an unsaved detection built from the posted fields
+            detection = DetectionResult(
+                platform_id=data.get('platform'),
+                detection_pattern_id=data.get('detection_pattern'),
+                severity_level=data.get('severity_level', 'low'),
+                confidence_score=data.get('confidence_score', 0.0),
+                detected_keywords=data.get('detected_keywords', []),
+                status=data.get('status', 'pending'),
+            )
         
-        # Test rule against content (placeholder for actual implementation)
-        # This would typically involve applying the rule's logic
-        matches = rule.test_content(test_content)
+        try:
+            compile_rule(rule)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'rule': DetectionRuleSerializer(rule).data,
-            'test_content': test_content,
-            'matches': matches
+            'detection_id': detection.pk,
+            'matches': rule.should_trigger(detection)
         })
@@ -4,6 +4,7 @@ Celery configuration for hack2drug project.
 
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hack2drug.settings')
@@ -20,3 +21,23 @@ app.autodiscover_tasks()
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+@worker_process_shutdown.connect
+def drain_counter_buffer(**kwargs):
+    """Flush buffered counter deltas before a worker process exits."""
+    from hack2drug.counter_buffer import counter_buffer
+    counter_buffer.flush()
+
+
+@worker_init.connect
+def preload_detection_models(sender=None, **kwargs):
+    """
+    Load the ML detection models in the main process of a worker that
+    consumes the ``ml`` queue, before it forks its pool processes.
+    """
+    if sender is not None and 'ml' in sender.app.amqp.queues.consume_from:
+        from detection.ml import preload_models
+        from django.db import connections
+        preload_models()
+        connections.close_all()  # not to be shared with the forked children
@@ -0,0 +1,162 @@
+"""
+Write-behind buffer for hot counter columns.
+
+Signal handlers record counter deltas here instead of updating rows on
+every insert. Deltas are aggregated in memory per row (e.g. today's
+DetectionAnalytics row, one MonitoringSession) and flushed in a single
+transaction every COUNTER_FLUSH_INTERVAL seconds or COUNTER_FLUSH_EVENTS
+increments, whichever comes first, and once more at interpreter or
+Celery worker shutdown.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    In-process accumulator of F() increments keyed by model row.
+    """
+
+    def __init__(self, flush_interval=None, flush_events=None, enabled=None):
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushers = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._deltas = {}
+        self._assign = {}
+        self._events = 0
+        self._thread = None
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    def is_enabled(self):
+        return self._setting(self.enabled, 'COUNTER_BUFFER_ENABLED', True)
+
+    def increment(self, model, lookup, deltas, create=False, assign=None):
+        """
+        Queue ``deltas`` ({field: amount}) for the row matching ``lookup``.
+
+        When ``create`` is true a missing row is created from ``lookup``
+        at flush time. ``assign`` holds plain values (e.g. timestamps)
+        written alongside the increments; the latest value wins.
+        """
+        key = (model, tuple(sorted(lookup.items())), create)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: drop the parent's pending deltas and thread.
+                self._reset()
+            self._deltas.setdefault(key, Counter()).update(deltas)
+            if assign:
+                self._assign.setdefault(key, {}).update(assign)
+            self._events += 1
+            events = self._events
+
+        if not self.is_enabled():
+            self.flush()
+            return
+        self._ensure_thread()
+        if events >= self._setting(self.flush_events, 'COUNTER_FLUSH_EVENTS', 1000):
+            self._wakeup.set()
+
+    def add_flusher(self, flusher):
+        """Run ``flusher()`` on every flush, e.g. for other in-memory stats."""
+        if flusher not in self._flushers:
+            self._flushers.append(flusher)
+
+    def start(self):
+        """Start the background flush thread if it is not running."""
+        if self.is_enabled():
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='counter-buffer', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        interval = self._setting(self.flush_interval, 'COUNTER_FLUSH_INTERVAL', 5)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Counter buffer flush failed')
+            finally:
+                connection.close()
+
+    def flush(self):
+        """Write all pending deltas in one transaction."""
+        for flusher in self._flushers:
+            try:
+                flusher()
+            except Exception:
+                logger.exception('Counter buffer flusher %r failed', flusher)
+        with self._lock:
+            deltas, assign = self._deltas, self._assign
+            self._deltas, self._assign, self._events = {}, {}, 0
+        if not deltas:
+            return 0
+
+        try:
+            with transaction.atomic():
+                for key, counts in deltas.items():
+                    self._apply(key, counts, assign.get(key, {}))
+        except Exception:
+            # Put the deltas back so they are retried on the next flush.
+            with self._lock:
+                for key, counts in deltas.items():
+                    self._deltas.setdefault(key, Counter()).update(counts)
+                for key, values in assign.items():
+                    self._assign.setdefault(key, {}).update(values)
+            raise
+        return len(deltas)
+
+    def _apply(self, key, counts, values):
+        model, lookup, create = key
+        lookup = dict(lookup)
+        updates = {field: F(field) + amount for field, amount in counts.items() if amount}
+        updates.update(values)
+        if not updates:
+            return
+        if model.objects.filter(**lookup).update(**updates) or not create:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup)
+        except IntegrityError:
+            pass
+        model.objects.filter(**lookup).update(**updates)
+
+
+counter_buffer = CounterBuffer()
+
+
+@atexit.register
+def _drain_on_exit():
+    try:
+        counter_buffer.flush()
+    except Exception:
+        logger.exception('Failed to drain counter buffer at exit')
@@ -0,0 +1,25 @@
+"""
+Chunked deletes for the retention purge tasks.
+
+Deleting a large backlog in one statement holds a long write lock (the
+whole database on SQLite) and, for models with delete signals, loads
+every row at once. delete_in_chunks() removes RETENTION_DELETE_CHUNK
+rows per transaction instead.
+"""
+
+from django.conf import settings
+from django.db import transaction
+
+
+def delete_in_chunks(queryset, chunk_size=None):
+    """Delete every row of ``queryset``; returns the number of rows deleted."""
+    chunk_size = chunk_size or settings.RETENTION_DELETE_CHUNK
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
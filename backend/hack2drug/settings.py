@@ -6,6 +6,8 @@ import os
 from pathlib import Path
 from datetime import timedelta
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,6 +33,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'django_filters',
     'django_extensions',
+    'django_celery_beat',
     
     # Local apps
     'users',
@@ -162,6 +165,22 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Monitoring settings
+MONITORING_INTERVAL = 300  # 5 minutes
+MAX_MONITORING_SESSIONS = 10
+
+# Periodic maintenance (CELERY_BEAT_SCHEDULE)
+HEALTH_CHECK_INTERVAL = 60  # seconds between SystemHealth probes
+HEALTH_CHECK_TIMEOUT = 5  # seconds per probe that opens a connection
+HEALTH_DISK_WARNING_PERCENT = 15  # free space on the media volume
+HEALTH_DISK_CRITICAL_PERCENT = 5
+ROLLUP_COMPACT_AFTER_DAYS = 30  # hourly rollup buckets older than this become daily buckets
+TREND_WINDOW_DAYS = 30  # days per TrendAnalysis series
+CONTENT_RETENTION_DAYS = 90  # non-suspicious collected content and idle clusters
+API_LOG_RETENTION_DAYS = 30
+HEALTH_RETENTION_DAYS = 14
+RETENTION_DELETE_CHUNK = 5000  # rows deleted per transaction by the purge tasks
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -170,9 +189,89 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# One queue per workload, so long jobs cannot starve latency-sensitive ones.
+# Start one worker per queue: manage.py run_worker <queue>
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'detection.tasks.rebuild_detection_rollups': {'queue': 'bulk'},
+    'detection.tasks.compact_detection_rollups': {'queue': 'bulk'},
+    'detection.tasks.*': {'queue': 'ml'},  # CPU-bound scoring
+    'analytics.tasks.*': {'queue': 'bulk'},  # long aggregate queries and report files
+    'monitoring.tasks.*': {'queue': 'bulk'},
+    'api.tasks.run_data_export': {'queue': 'bulk'},
+    'api.tasks.purge_expired_records': {'queue': 'bulk'},
+    'api.tasks.deliver_webhook': {'queue': 'webhooks'},  # I/O-bound, latency-sensitive
+}
+
+# Periodic jobs, run by `celery -A hack2drug beat`. The database scheduler
+# stores these entries in django_celery_beat's tables at startup, where
+# they can be paused or rescheduled from the admin. Expensive aggregation
+# runs off-peak instead of in request handlers.
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'score-unprocessed-content': {
+        'task': 'detection.tasks.score_unprocessed_content',
+        'schedule': timedelta(seconds=MONITORING_INTERVAL),
+    },
+    'probe-system-health': {
+        'task': 'api.tasks.probe_system_health',
+        'schedule': timedelta(seconds=HEALTH_CHECK_INTERVAL),
+    },
+    'recompute-daily-analytics': {
+        'task': 'analytics.tasks.recompute_daily_analytics',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'compact-detection-rollups': {
+        'task': 'detection.tasks.compact_detection_rollups',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'recompute-trend-analysis': {
+        'task': 'analytics.tasks.recompute_trend_analysis',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'purge-expired-content': {
+        'task': 'monitoring.tasks.purge_expired_content',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'purge-expired-records': {
+        'task': 'api.tasks.purge_expired_records',
+        'schedule': crontab(hour=4, minute=30),
+    },
+}
+
+# Worker options per queue (manage.py run_worker). Long tasks prefetch one
+# message per process so queued work is not held by a busy process.
+WORKER_QUEUE_OPTIONS = {
+    'default': {'concurrency': 2, 'prefetch_multiplier': 4},
+    'ml': {'concurrency': os.cpu_count() or 1, 'prefetch_multiplier': 1},  # use 1 when DETECTION_WORKERS > 1
+    'bulk': {'concurrency': 2, 'prefetch_multiplier': 1},  # few concurrent long transactions
+    'webhooks': {'concurrency': 50, 'prefetch_multiplier': 4, 'pool': 'threads'},  # mostly waiting on HTTP
+}
+
 # Redis settings
 REDIS_URL = 'redis://localhost:6379/0'
 
+# Cache settings
+# The default cache holds the version counters of compiled detection caches,
+# so deployments with several web, Celery and collector processes must set
+# CACHE_REDIS_URL (e.g. to REDIS_URL) to share it. Unset, the cache is
+# process-local, only suitable when a single process serves and edits
+# patterns and rules.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Channels (WebSocket) settings
 CHANNEL_LAYERS = {
     'default': {
@@ -255,6 +354,10 @@ TWITTER_API_SECRET = os.environ.get('TWITTER_API_SECRET', '')
 # ML Model settings
 ML_MODEL_PATH = BASE_DIR / 'ml_models'
 ML_MODEL_PATH.mkdir(exist_ok=True)
+ML_BATCH_SIZE = 512  # texts per vectorizer.transform / predict_proba call
+ML_HIT_MIN_PROBABILITY = 0.5  # lower ml_model probabilities are stored but not reported as hits; default for registered versions
+ML_DEFAULT_FEATURE_SET = 'hashed-char-v1'  # detection.features.FEATURE_SETS entry for registered models
+ML_MODEL_MMAP_MODE = 'r'  # joblib mmap_mode for model arrays, shared between processes; None loads them into memory
 
 # Detection settings
 DETECTION_CONFIDENCE_THRESHOLD = 0.7
@@ -263,7 +366,78 @@ SUSPICIOUS_KEYWORDS = [
     'weed', 'marijuana', 'drugs', 'pills', 'tablets', 'powder',
     'dealer', 'supplier', 'wholesale', 'bulk', 'shipment'
 ]
-
-# Monitoring settings
-MONITORING_INTERVAL = 300  # 5 minutes
-MAX_MONITORING_SESSIONS = 10
+DETECTION_SCORING_BATCH_SIZE = 1000  # rows per bulk_update when scoring collected content
+DETECTION_SCORING_MAX_BATCHES = 20  # scoring batches queued per run of score_unprocessed_content
+DETECTION_SCORING_REQUEUE_AFTER = 3600  # seconds after CollectedContent.scoring_queued_at before unprocessed rows are queued again
+DETECTION_BULK_CREATE_BATCH_SIZE = 1000  # rows per INSERT in the bulk detection ingest endpoint
+DETECTION_NORMALIZE_TEXT = True  # also match keywords against de-obfuscated text (c0ca1ne, m.d.m.a)
+
+# Scoring cascade (detection.cascade): an item reaches the regex and ml_model stages only when the
+# cheaper stages gave it this fraction of the stage's lowest pattern threshold; 0 evaluates every item.
+# Regexes are cheap and often the only evidence, so only the ml_model stage is gated by default.
+DETECTION_CASCADE_GATES = {'regex': 0.0, 'ml_model': 0.5}
+
+# Process-pool scoring (detection.parallel); 1 scores in the calling process
+DETECTION_WORKERS = int(os.environ.get('DETECTION_WORKERS', 1))  # e.g. one per core on dedicated scoring hosts
+DETECTION_WORKER_CHUNK_SIZE = 512  # texts per task sent to a worker process
+DETECTION_PARALLEL_MIN_TEXTS = 256  # smaller batches are scored in-process
+DETECTION_WORKER_START_METHOD = None  # multiprocessing start method; None uses the platform default
+
+# Full-text search backend (dotted path); None picks one for the database vendor
+SEARCH_BACKEND = None
+
+# Trigram fuzzy search over normalized content (dotted path); None picks one for the database vendor
+FUZZY_SEARCH_BACKEND = None
+FUZZY_SEARCH_THRESHOLD = 0.6  # fraction of query trigrams a match must contain
+FUZZY_SEARCH_CANDIDATE_LIMIT = 5000  # index rows verified per query
+FUZZY_SEARCH_MAX_RESULTS = 500
+
+# Background reports, exports and webhooks (analytics.tasks, api.tasks)
+REPORTS_DIR = MEDIA_ROOT / 'reports'
+EXPORTS_DIR = BASE_DIR / 'exports'  # outside MEDIA_ROOT: exports are only served through the API
+EXPORT_CHUNK_SIZE = 2000  # rows read and written between progress updates
+WEBHOOK_RETRY_BACKOFF = 30  # seconds before the first retry; doubles per attempt
+
+
+# Asyncio collector daemon (manage.py run_collectors)
+COLLECTOR_MAX_CONNECTIONS = 100  # shared aiohttp connection pool size
+COLLECTOR_CHANNEL_CONCURRENCY = 5  # concurrent channel fetches per session
+COLLECTOR_REQUEST_TIMEOUT = 30  # seconds
+COLLECTOR_REFRESH_INTERVAL = 30  # seconds between reloads of the active session list
+COLLECTOR_MAX_PAGES_PER_POLL = 10  # pages fetched per channel and poll while the platform has more
+
+# Staged ingest pipeline between collectors and the database (monitoring.pipeline)
+PIPELINE_BATCH_SIZE = 500  # messages per dedup/score/persist batch
+PIPELINE_FLUSH_INTERVAL = 2.0  # seconds a partial batch waits before moving on
+PIPELINE_QUEUE_SIZE = 50  # items (pages, then batches) buffered per stage before it blocks
+PIPELINE_NORMALIZE_WORKERS = 2
+PIPELINE_SCORE_WORKERS = 2
+PIPELINE_PERSIST_WORKERS = 1  # concurrent write transactions; keep at 1 on SQLite
+
+# Collected content deduplication (monitoring.dedup)
+DEDUP_BLOOM_CAPACITY = 1000000  # keys per Bloom filter generation (~1.8 MB each)
+DEDUP_BLOOM_ERROR_RATE = 0.001  # false positive rate; hits are confirmed in the database
+DEDUP_SEED_DAYS = 2  # days of collected content loaded into the filter at startup
+DEDUP_MIN_TEXT_LENGTH = 20  # shorter normalized texts are not deduplicated by hash
+DEDUP_RECENT_KEYS = 100000  # exact keys remembered, covering content still in the pipeline
+
+# Near-duplicate clustering of collected content (detection.minhash, monitoring.clusters)
+CONTENT_CLUSTERING_ENABLED = True
+MINHASH_PERMUTATIONS = 128  # signature length; must be a multiple of MINHASH_BANDS
+MINHASH_BANDS = 16  # LSH bands; more bands find less similar candidates
+MINHASH_SHINGLE_SIZE = 5  # characters per shingle of the normalized text
+NEAR_DUPLICATE_THRESHOLD = 0.7  # estimated Jaccard similarity to join a cluster
+
+# Per-platform request scheduling; the budget is Platform.rate_limit (requests/minute)
+RATE_LIMIT_BURST = 5  # requests that may go out back to back before pacing starts
+RATE_LIMIT_429_BACKOFF = 60  # seconds to hold a platform after a 429 without Retry-After
+RATE_LIMIT_MAX_RETRIES = 2  # retries of a request answered with 429
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', '')  # share limiters across processes
+
+# Write-behind counter buffer for analytics and monitoring counters
+COUNTER_BUFFER_ENABLED = True  # False applies every increment immediately
+COUNTER_FLUSH_INTERVAL = 5  # seconds
+COUNTER_FLUSH_EVENTS = 1000  # flush early after this many increments
+
+# Seconds between checks of the shared version counter for compiled detection caches
+DETECTION_CACHE_CHECK_INTERVAL = 1.0
@@ -0,0 +1,30 @@
+"""
+Shared helpers for the apps' test suites.
+"""
+
+from django.test import TestCase, override_settings
+
+from .counter_buffer import counter_buffer
+
+# Version counters in a process-local cache, so tests run without Redis,
+# and a counter buffer that only writes when a test calls flush().
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'COUNTER_BUFFER_ENABLED': True,
+    'COUNTER_FLUSH_INTERVAL': 3600,
+    'COUNTER_FLUSH_EVENTS': 10 ** 6,
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class IsolatedTestCase(TestCase):
+    """
+    TestCase run with TEST_SETTINGS. The counter buffer is drained before
+    and after each test, so no deltas leak between tests or are flushed
+    at exit once the settings are restored.
+    """
+
+    def setUp(self):
+        super().setUp()
+        counter_buffer.flush()
+        self.addCleanup(counter_buffer.flush)
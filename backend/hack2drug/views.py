@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -42,14 +43,36 @@ def api_info(request):
 
 @api_view(['GET'])
 def health_check(request):
-    """System health check endpoint"""
+    """
+    System health check endpoint; reports the latest periodic probes.
+    Without recent probe results (right after a deploy, or with beat
+    stopped) the status is 'unknown', or 'degraded' when only some
+    components have them.
+    """
+    from api.health import PROBES, latest_health
+
+    latest = latest_health()
+    statuses = [row.status for row in latest.values()]
+    missing = sorted(set(PROBES) - set(latest))
+    if 'offline' in statuses or 'critical' in statuses:
+        overall = 'unhealthy'
+    elif not latest:
+        overall = 'unknown'
+    elif 'warning' in statuses or missing:
+        overall = 'degraded'
+    else:
+        overall = 'healthy'
     return Response({
-        'status': 'healthy',
-        'timestamp': '2024-01-01T00:00:00Z',
+        'status': overall,
+        'unprobed': missing,
+        'timestamp': timezone.now().isoformat(),
         'version': '1.0.0',
         'services': {
-            'database': 'connected',
-            'cache': 'connected',
-            'celery': 'running'
+            component: {
+                'status': row.status,
+                'response_time': row.response_time,
+                'checked_at': row.checked_at.isoformat(),
+            }
+            for component, row in latest.items()
         }
     })
@@ -6,7 +6,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from .models import (
-    MonitoringSession, CollectedContent, MonitoringRule, 
+    MonitoringSession, CollectedContent, ContentCluster, CollectionCursor, MonitoringRule,
     MonitoringMetrics, PlatformConnection
 )
 
@@ -178,6 +178,43 @@ class CollectedContentAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('monitoring_session')
 
 
+@admin.register(ContentCluster)
+class ContentClusterAdmin(admin.ModelAdmin):
+    """
+    Admin for ContentCluster model.
+    """
+    list_display = [
+        'id', 'size', 'is_suspicious', 'confidence_score', 'first_seen', 'last_seen'
+    ]
+    list_filter = ['is_suspicious', 'last_seen']
+    search_fields = ['representative__content_text']
+    ordering = ['-size']
+    exclude = ['signature']
+    readonly_fields = [
+        'representative', 'size', 'is_suspicious', 'confidence_score',
+        'detected_keywords', 'analysis', 'first_seen', 'last_seen'
+    ]
+
+
+@admin.register(CollectionCursor)
+class CollectionCursorAdmin(admin.ModelAdmin):
+    """
+    Admin for CollectionCursor model.
+    """
+    list_display = [
+        'monitoring_session', 'channel_id', 'cursor', 'last_message_id',
+        'last_timestamp', 'updated_at'
+    ]
+    list_filter = ['updated_at']
+    search_fields = ['monitoring_session__name', 'channel_id']
+    ordering = ['-updated_at']
+    readonly_fields = ['updated_at']
+
+    def get_queryset(self, request):
+        """Optimize queryset with select_related."""
+        return super().get_queryset(request).select_related('monitoring_session')
+
+
 @admin.register(MonitoringRule)
 class MonitoringRuleAdmin(admin.ModelAdmin):
     """
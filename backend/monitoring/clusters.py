@@ -0,0 +1,165 @@
+"""
+Near-duplicate clustering of collected content.
+
+Every stored message is assigned to a ContentCluster. Its MinHash
+signature's LSH buckets (detection.minhash) are looked up in
+ContentClusterBand; the candidate cluster whose representative is most
+similar joins the message if the estimated similarity reaches
+NEAR_DUPLICATE_THRESHOLD, otherwise the message starts a new cluster and
+becomes its representative. Only representatives are banded, so the
+index grows with distinct ads, not with reposts.
+
+The ingest pipeline matches clusters in memory before scoring
+(match_clusters), then inserts the new clusters (create_clusters) and
+records members (record_members) in the transaction that stores the
+messages, so a batch that fails leaves no clusters behind. Scoring
+evaluates one member per cluster and copies the result to the rest
+(detection.services.score_contents).
+"""
+
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from hack2drug.counter_buffer import counter_buffer
+from detection.minhash import get_minhasher
+from .models import CollectedContent, ContentCluster, ContentClusterBand
+
+# Bucket keys per query; keeps IN lists under SQLite's variable limit.
+_LOOKUP_CHUNK = 5000
+
+# A cluster started by match_clusters(): the unsaved ContentCluster, the
+# content that becomes its representative and its LSH bucket keys.
+NewCluster = namedtuple('NewCluster', ['cluster', 'representative', 'buckets'])
+
+
+def _candidate_clusters(buckets):
+    """Return ({bucket: {cluster_id}}, {cluster_id: signature}) for bucket keys."""
+    hasher = get_minhasher()
+    by_bucket = {}
+    buckets = list(buckets)
+    for start in range(0, len(buckets), _LOOKUP_CHUNK):
+        rows = ContentClusterBand.objects.filter(
+            bucket__in=buckets[start:start + _LOOKUP_CHUNK]
+        ).values_list('bucket', 'cluster_id')
+        for bucket, cluster_id in rows:
+            by_bucket.setdefault(bucket, set()).add(cluster_id)
+    cluster_ids = set().union(*by_bucket.values()) if by_bucket else set()
+    signatures = {
+        cluster_id: hasher.from_bytes(signature)
+        for cluster_id, signature in ContentCluster.objects.filter(
+            pk__in=cluster_ids
+        ).values_list('pk', 'signature')
+    }
+    return by_bucket, signatures
+
+
+def match_clusters(contents):
+    """
+    Assign CollectedContent instances (saved or not) to clusters in
+    memory. Members of known clusters get their ``cluster_id``; a message
+    unlike any known one starts a new cluster, which is not inserted yet:
+    it gets a negative placeholder ``cluster_id`` that later messages of
+    the batch joining it share. Returns {placeholder: NewCluster}; pass it
+    to create_clusters() to insert them.
+    """
+    hasher = get_minhasher()
+    threshold = getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.7)
+    now = timezone.now()
+
+    signed = []
+    for content in contents:
+        signature = hasher.signature(content.content_text)
+        if signature is not None:
+            signed.append((content, signature, hasher.buckets(signature)))
+    if not signed:
+        return {}
+
+    by_bucket, signatures = _candidate_clusters(
+        {bucket for content, signature, buckets in signed for bucket in buckets}
+    )
+
+    new_clusters = {}
+    for content, signature, buckets in signed:
+        candidates = set().union(*(by_bucket.get(bucket, ()) for bucket in buckets))
+        best, best_similarity = None, threshold
+        for cluster_id in candidates:
+            similarity = hasher.similarity(signature, signatures[cluster_id])
+            if similarity >= best_similarity:
+                best, best_similarity = cluster_id, similarity
+        if best is None:
+            best = -(len(new_clusters) + 1)
+            cluster = ContentCluster(
+                representative=content if content.pk else None,
+                signature=hasher.to_bytes(signature),
+                last_seen=now,
+            )
+            new_clusters[best] = NewCluster(cluster, content, buckets)
+            signatures[best] = signature
+            for bucket in buckets:
+                by_bucket.setdefault(bucket, set()).add(best)
+        content.cluster_id = best
+    return new_clusters
+
+
+def create_clusters(contents, new_clusters):
+    """
+    Insert the clusters match_clusters() started, with their LSH bands,
+    and replace the placeholder ids on ``contents``. Returns
+    {cluster id: content that should become its representative}; pass
+    it to record_members() once the contents are saved.
+    """
+    if not new_clusters:
+        return {}
+    ContentCluster.objects.bulk_create([new.cluster for new in new_clusters.values()])
+    ContentClusterBand.objects.bulk_create([
+        ContentClusterBand(cluster_id=new.cluster.pk, bucket=bucket)
+        for new in new_clusters.values()
+        for bucket in new.buckets
+    ])
+    for content in contents:
+        new = new_clusters.get(content.cluster_id)
+        if new is None:
+            continue
+        if content.ml_analysis and content.ml_analysis.get('cluster_id') == content.cluster_id:
+            content.ml_analysis['cluster_id'] = new.cluster.pk
+        content.cluster_id = new.cluster.pk
+    return {new.cluster.pk: new.representative for new in new_clusters.values()}
+
+
+def record_members(contents, representatives):
+    """
+    After the contents are saved: link new clusters to their
+    representative and count the members once the transaction commits.
+    Returns {cluster_id: number of contents added}.
+    """
+    now = timezone.now()
+    clusters = [
+        ContentCluster(pk=cluster_id, representative_id=content.pk)
+        for cluster_id, content in representatives.items() if content.pk
+    ]
+    if clusters:
+        ContentCluster.objects.bulk_update(clusters, ['representative'])
+    added = Counter(content.cluster_id for content in contents if content.cluster_id)
+
+    def enqueue():
+        for cluster_id, count in added.items():
+            counter_buffer.increment(
+                ContentCluster, {'pk': cluster_id}, {'size': count}, assign={'last_seen': now}
+            )
+
+    transaction.on_commit(enqueue)
+    return dict(added)
+
+
+def assign_clusters(contents):
+    """Cluster saved CollectedContent instances and store the assignment."""
+    with transaction.atomic():
+        create_clusters(contents, match_clusters(contents))
+        CollectedContent.objects.bulk_update(
+            [content for content in contents if content.cluster_id], ['cluster']
+        )
+        # Saved contents already became the representative of their new clusters.
+        return record_members(contents, {})
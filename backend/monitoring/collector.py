@@ -0,0 +1,310 @@
+"""
+Asyncio collector runtime for Hack2Drug monitoring sessions.
+
+A single event loop polls every active MonitoringSession: each session
+is one task that fetches its target channels concurrently every
+``monitoring_interval`` seconds over a shared aiohttp connection pool.
+Fetched pages are handed to the staged ingest pipeline
+(monitoring.pipeline), which normalizes, deduplicates, scores and
+stores them in batches behind bounded queues, so one process can serve
+hundreds of sessions without a thread per session and a slow database
+throttles fetching.
+
+Every page carries a CursorUpdate for its channel, stored in the same
+transaction as the page's messages. A channel's cursor only moves past a
+page once the pipeline reports the page stored; a page the pipeline
+failed on is fetched again on the next poll. Sessions load their cursors
+from CollectionCursor on start, so a paused session or a restarted
+process picks up after the last stored message without fetching it
+again.
+
+Platforms are reached through monitoring.connectors, one connector per
+platform type, and requests to each platform are paced by its limiter in
+monitoring.ratelimit.
+
+Run it with ``python manage.py run_collectors``.
+"""
+
+import asyncio
+import logging
+import random
+import signal
+import time
+from collections import namedtuple
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from hack2drug.counter_buffer import counter_buffer
+from .models import MonitoringSession, CollectedContent, CollectionCursor
+from .pipeline import CursorUpdate, IngestPipeline
+from .connectors import get_connector, platform_spec
+from .ratelimit import rate_limiters, load_rate_limit_holds, save_rate_limit_reports
+
+logger = logging.getLogger('monitoring')
+
+# Immutable snapshot of the session fields the collector needs, so the
+# event loop never touches the ORM outside sync_to_async.
+SessionSpec = namedtuple('SessionSpec', [
+    'id', 'name', 'platform', 'channels', 'keywords', 'interval', 'limit',
+])
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def load_active_sessions(session_ids=None):
+    """Return SessionSpecs for every active session on an enabled platform."""
+    queryset = MonitoringSession.objects.filter(
+        status='active',
+        platform__is_active=True,
+        platform__monitoring_enabled=True,
+    ).select_related('platform')
+    if session_ids:
+        queryset = queryset.filter(pk__in=session_ids)
+    return [
+        SessionSpec(
+            id=session.id,
+            name=session.name,
+            platform=platform_spec(session.platform),
+            channels=tuple(str(channel) for channel in session.target_channels or ()),
+            keywords=tuple(session.keywords or ()),
+            interval=max(session.monitoring_interval, 1),
+            limit=session.max_content_per_session,
+        )
+        for session in queryset
+    ]
+
+
+def load_cursors(session_ids):
+    """Return {session_id: {channel: cursor}} of the stored collection cursors."""
+    cursors = {session_id: {} for session_id in session_ids}
+    rows = CollectionCursor.objects.filter(
+        monitoring_session_id__in=session_ids
+    ).values_list('monitoring_session_id', 'channel_id', 'cursor')
+    for session_id, channel, cursor in rows:
+        cursors[session_id][channel] = cursor
+    return cursors
+
+
+def build_content(spec, channel, message):
+    """Map one connector Message onto an unsaved CollectedContent."""
+    content_type = message.content_type
+    if content_type not in dict(CollectedContent.CONTENT_TYPES):
+        content_type = 'message'
+    return CollectedContent(
+        monitoring_session_id=spec.id,
+        platform_id=spec.platform.id,
+        content_type=content_type,
+        content_id=message.id,
+        content_text=message.text,
+        content_url=message.url,
+        user_id=message.user_id,
+        username=message.username,
+        channel_id=channel,
+        channel_name=message.channel_name or channel,
+        platform_metadata=message.metadata,
+        timestamp=message.timestamp,
+    )
+
+
+def record_session_error(session_id):
+    """Count a failed channel fetch against the session."""
+    counter_buffer.increment(MonitoringSession, {'pk': session_id}, {'errors_encountered': 1})
+
+
+class SessionCollector:
+    """
+    Polls the channels of one monitoring session on its interval.
+    """
+
+    def __init__(self, spec, http, pipeline, cursors=None, channel_concurrency=None):
+        self.spec = spec
+        self.http = http
+        self.pipeline = pipeline
+        self.connector = get_connector(spec.platform, http)
+        self.cursors = cursors if cursors is not None else {}
+        self.semaphore = asyncio.Semaphore(
+            channel_concurrency or _setting('COLLECTOR_CHANNEL_CONCURRENCY', 5)
+        )
+
+    async def run(self, once=False):
+        """Poll forever (or once), sleeping out the rest of each interval."""
+        if not once:
+            # Spread first polls so hundreds of sessions do not fire together.
+            await asyncio.sleep(random.uniform(0, min(self.spec.interval, 30)))
+        while True:
+            started = time.monotonic()
+            await self.poll()
+            if once:
+                return
+            await asyncio.sleep(max(0.0, self.spec.interval - (time.monotonic() - started)))
+
+    async def poll(self):
+        """Fetch every channel concurrently and queue the new messages."""
+        results = await asyncio.gather(
+            *(self.collect_channel(channel) for channel in self.spec.channels),
+            return_exceptions=True,
+        )
+        for channel, result in zip(self.spec.channels, results):
+            if isinstance(result, Exception):
+                logger.warning('Session %s channel %s failed: %s', self.spec.id, channel, result)
+                await sync_to_async(record_session_error)(self.spec.id)
+
+    async def collect_channel(self, channel):
+        """
+        Fetch the new messages of a channel page by page while the
+        platform reports more, up to COLLECTOR_MAX_PAGES_PER_POLL pages.
+        Returns the number of messages queued.
+        """
+        max_pages = max(_setting('COLLECTOR_MAX_PAGES_PER_POLL', 10), 1)
+        collected = 0
+        for _ in range(max_pages):
+            count, has_more = await self.collect_page(channel)
+            collected += count
+            if not has_more:
+                break
+        else:
+            logger.info('Session %s channel %s has more than %d pages; continuing next poll',
+                        self.spec.id, channel, max_pages)
+        return collected
+
+    async def collect_page(self, channel):
+        """Fetch, queue and wait for one page; returns (messages queued, more available)."""
+        async with self.semaphore:
+            batch = await self.connector.fetch_since(
+                channel, self.cursors.get(channel),
+                limit=self.spec.limit, keywords=self.spec.keywords,
+            )
+        if batch.cursor is None:
+            return 0, False
+        if not batch.messages and str(batch.cursor) == str(self.cursors.get(channel)):
+            return 0, False
+        last = batch.messages[-1] if batch.messages else None
+        stored = await self.pipeline.submit(
+            [build_content(self.spec, channel, message) for message in batch.messages],
+            CursorUpdate(
+                self.spec.id, channel, batch.cursor,
+                last.id if last else '', last.timestamp if last else None,
+                time.time_ns(),
+            ),
+        )
+        if not await stored:
+            raise RuntimeError(f'page after cursor {self.cursors.get(channel)!r} was not stored')
+        self.cursors[channel] = batch.cursor
+        return len(batch.messages), batch.has_more
+
+
+class Collector:
+    """
+    Runs one SessionCollector task per active session on a shared loop.
+
+    The set of active sessions is reloaded every
+    COLLECTOR_REFRESH_INTERVAL seconds: new sessions are started, stopped
+    or reconfigured ones are cancelled and restarted.
+    """
+
+    def __init__(self, session_ids=None, refresh_interval=None):
+        self.session_ids = session_ids
+        self.refresh_interval = refresh_interval or _setting('COLLECTOR_REFRESH_INTERVAL', 30)
+        self.tasks = {}
+        self.specs = {}
+        # Channel cursors per session, loaded from CollectionCursor once and
+        # then kept current across restarts of a session task.
+        self.cursors = {}
+        self.seeded_platforms = set()
+        self.stopping = asyncio.Event()
+
+    def _http_session(self):
+        connector = aiohttp.TCPConnector(limit=_setting('COLLECTOR_MAX_CONNECTIONS', 100))
+        timeout = aiohttp.ClientTimeout(total=_setting('COLLECTOR_REQUEST_TIMEOUT', 30))
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def run(self, once=False):
+        """Collect until stop() is called, or run a single poll of every session."""
+        pipeline = IngestPipeline()
+        pipeline_task = asyncio.create_task(pipeline.run())
+        try:
+            async with self._http_session() as http:
+                if once:
+                    specs = await sync_to_async(load_active_sessions)(self.session_ids)
+                    await self._sync_rate_limits(specs)
+                    await self._load_cursors(specs)
+                    await asyncio.gather(*(
+                        SessionCollector(spec, http, pipeline, cursors=self.cursors[spec.id]).run(once=True)
+                        for spec in specs
+                    ))
+                else:
+                    await self._supervise(http, pipeline)
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+            await pipeline.close()
+            await pipeline_task
+            await self._sync_rate_limits([])
+            await sync_to_async(counter_buffer.flush)()
+        logger.info('Collector stored %d items; pipeline %s', pipeline.stored, pipeline.stats())
+        return pipeline.stored
+
+    async def _supervise(self, http, pipeline):
+        while not self.stopping.is_set():
+            try:
+                specs = await sync_to_async(load_active_sessions)(self.session_ids)
+                await self._sync_rate_limits(specs)
+                await self._load_cursors(specs)
+                self._reconcile({spec.id: spec for spec in specs}, http, pipeline)
+            except Exception:
+                logger.exception('Failed to refresh monitoring sessions')
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sync_rate_limits(self, specs):
+        """Seed limiters of newly seen platforms and persist header state."""
+        new = {spec.platform.id: spec.platform.rate_limit for spec in specs
+               if spec.platform.id not in self.seeded_platforms}
+        if new:
+            holds = await sync_to_async(load_rate_limit_holds)(list(new))
+            for platform_id, reset_at in holds.items():
+                await rate_limiters.get(platform_id, new[platform_id]).hold_until(reset_at)
+            self.seeded_platforms.update(new)
+        reports = rate_limiters.take_reports()
+        if reports:
+            await sync_to_async(save_rate_limit_reports)(reports)
+
+    async def _load_cursors(self, specs):
+        """Load stored cursors for sessions seen for the first time."""
+        new = [spec.id for spec in specs if spec.id not in self.cursors]
+        if new:
+            self.cursors.update(await sync_to_async(load_cursors)(new))
+
+    def _reconcile(self, specs, http, pipeline):
+        for session_id in list(self.tasks):
+            task = self.tasks[session_id]
+            if specs.get(session_id) != self.specs.get(session_id) or task.done():
+                task.cancel()
+                del self.tasks[session_id]
+                del self.specs[session_id]
+        for session_id, spec in specs.items():
+            if session_id not in self.tasks:
+                collector = SessionCollector(
+                    spec, http, pipeline, cursors=self.cursors[session_id]
+                )
+                self.tasks[session_id] = asyncio.create_task(collector.run())
+                self.specs[session_id] = spec
+        logger.debug('Collector running %d sessions', len(self.tasks))
+
+    def stop(self):
+        self.stopping.set()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
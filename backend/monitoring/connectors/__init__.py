@@ -0,0 +1,44 @@
+"""
+Platform connectors for Hack2Drug monitoring.
+
+``get_connector(platform, http)`` picks the connector class for a
+platform type. Defaults can be overridden per type with the
+PLATFORM_CONNECTORS setting ({platform_type: dotted path}).
+"""
+
+import aiohttp
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import (
+    BaseConnector, Batch, ConnectorError, Message, PlatformSpec, parse_timestamp, platform_spec,
+)
+from .http import HTTPConnector
+
+DEFAULT_CONNECTORS = {platform_type: HTTPConnector for platform_type in HTTPConnector.platform_types}
+
+
+def get_connector_class(platform_type):
+    """Return the connector class configured for a platform type."""
+    overrides = getattr(settings, 'PLATFORM_CONNECTORS', {})
+    if platform_type in overrides:
+        return import_string(overrides[platform_type])
+    try:
+        return DEFAULT_CONNECTORS[platform_type]
+    except KeyError:
+        raise ConnectorError(f'No connector for platform type {platform_type!r}')
+
+
+def get_connector(platform, http):
+    """Build a connector for a PlatformSpec (or Platform instance)."""
+    if not isinstance(platform, PlatformSpec):
+        platform = platform_spec(platform)
+    return get_connector_class(platform.platform_type)(platform, http)
+
+
+
+async def check_platform_connection(platform):
+    """Run a connector's test_connection() with a short-lived HTTP session."""
+    timeout = aiohttp.ClientTimeout(total=getattr(settings, 'COLLECTOR_REQUEST_TIMEOUT', 30))
+    async with aiohttp.ClientSession(timeout=timeout) as http:
+        return await get_connector(platform, http).test_connection()
@@ -0,0 +1,83 @@
+"""
+Connector interface for monitored platforms.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Immutable snapshot of a Platform row, safe to use from the event loop.
+PlatformSpec = namedtuple('PlatformSpec', [
+    'id', 'name', 'platform_type', 'api_endpoint', 'api_key', 'api_secret', 'rate_limit',
+])
+
+# One platform message, normalized across connectors.
+Message = namedtuple('Message', [
+    'id', 'text', 'user_id', 'username', 'timestamp', 'url', 'channel_name',
+    'content_type', 'metadata',
+])
+
+# A page of messages and the cursor to pass to the next fetch_since().
+Batch = namedtuple('Batch', ['messages', 'cursor', 'has_more'])
+
+
+def platform_spec(platform):
+    """Snapshot a Platform instance."""
+    return PlatformSpec(
+        id=platform.id,
+        name=platform.name,
+        platform_type=platform.platform_type,
+        api_endpoint=platform.api_endpoint.rstrip('/'),
+        api_key=platform.api_key,
+        api_secret=platform.api_secret,
+        rate_limit=platform.rate_limit,
+    )
+
+
+def parse_timestamp(value):
+    """Accept ISO 8601 strings or epoch seconds; default to now."""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        return timezone.now()
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+class ConnectorError(Exception):
+    """
+    A platform request failed in a way the connector could not recover from.
+    """
+
+
+class BaseConnector:
+    """
+    Fetches messages from one platform.
+
+    Subclasses implement fetch_since(); the collector owns the cursors
+    and calls it repeatedly per channel. Connectors are created per
+    collector run and share its aiohttp session.
+    """
+
+    platform_types = ()
+
+    def __init__(self, platform, http):
+        self.platform = platform
+        self.http = http
+
+    async def fetch_since(self, channel, cursor, limit=100, keywords=()):
+        """
+        Return the Batch of messages in ``channel`` after ``cursor``.
+
+        ``cursor`` is None on the first call and afterwards whatever the
+        previous Batch returned; it is opaque to the caller.
+        """
+        raise NotImplementedError
+
+    async def test_connection(self):
+        """Check credentials and reachability; return a dict of details."""
+        raise NotImplementedError
@@ -0,0 +1,222 @@
+"""
+Content deduplication for Hack2Drug collectors.
+
+The same post is routinely collected by several sessions, and spam
+floods repeat one text under many message ids. Before a batch is
+written, the collector drops rows whose (platform, channel, content_id)
+or (platform, normalized text hash) has been seen before. Message ids
+are only unique per channel on several platforms (Telegram among them),
+hence the channel in the key.
+
+Membership is first checked against an exact set of the most recent
+keys, which also covers rows still on their way through the ingest
+pipeline, then against in-memory Bloom filters, so the common case, new
+content, costs no query. Only Bloom hits are confirmed against the
+database (the filters have false positives), and the unique
+(platform, channel, content_id) constraint stays the final authority:
+insert_contents() re-checks and retries a batch when another process
+stored the same id meanwhile.
+"""
+
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from detection.normalization import normalize_text
+
+logger = logging.getLogger('monitoring')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def content_hash(text):
+    """
+    SHA-1 of the normalized text, or '' for texts too short to tell
+    a repost from a coincidence ("hi", "ok", media without caption).
+    """
+    normalized = normalize_text(text)
+    if len(normalized) < _setting('DEDUP_MIN_TEXT_LENGTH', 20):
+        return ''
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+def content_keys(content):
+    """Return the dedup keys of one CollectedContent."""
+    keys = [f'id:{content.platform_id}:{content.channel_id}:{content.content_id}']
+    if content.content_hash:
+        keys.append(f'hash:{content.platform_id}:{content.content_hash}')
+    return keys
+
+
+def stored_keys(contents):
+    """Keys of contents that are already in the database, in two queries."""
+    from .models import CollectedContent
+
+    if not contents:
+        return set()
+    platform_ids = {content.platform_id for content in contents}
+    content_ids = {content.content_id for content in contents}
+    hashes = {content.content_hash for content in contents if content.content_hash}
+    existing = {
+        f'id:{platform_id}:{channel_id}:{content_id}'
+        for platform_id, channel_id, content_id in CollectedContent.objects.filter(
+            platform_id__in=platform_ids, content_id__in=content_ids
+        ).values_list('platform_id', 'channel_id', 'content_id').order_by()
+    }
+    if hashes:
+        existing.update(
+            f'hash:{platform_id}:{text_hash}'
+            for platform_id, text_hash in CollectedContent.objects.filter(
+                platform_id__in=platform_ids, content_hash__in=hashes
+            ).values_list('platform_id', 'content_hash').order_by()
+        )
+    return existing
+
+
+def insert_contents(contents):
+    """
+    Bulk insert deduplicated contents inside the caller's transaction and
+    return the rows actually inserted.
+    """
+    from .models import CollectedContent
+
+    try:
+        with transaction.atomic():
+            CollectedContent.objects.bulk_create(contents)
+    except IntegrityError:
+        # Stored by another process, or older than the seeded window.
+        logger.debug('Duplicate content slipped past deduplication, re-checking batch')
+        existing = stored_keys(contents)
+        contents = [content for content in contents if existing.isdisjoint(content_keys(content))]
+        for content in contents:
+            # Ids handed out by the rolled back insert are gone.
+            content.pk = None
+            content._state.adding = True
+        CollectedContent.objects.bulk_create(contents)
+    return contents
+
+
+class ContentDeduplicator:
+    """
+    Drops already-seen CollectedContent before it is inserted.
+
+    Two generations of Bloom filters are kept: when the current one
+    reaches DEDUP_BLOOM_CAPACITY it becomes the previous one and a fresh
+    filter starts, so memory stays bounded and the oldest keys age out
+    (they are still caught by the database on insert). Not thread-safe;
+    the pipeline runs a single dedup worker.
+    """
+
+    def __init__(self, capacity=None, error_rate=None, seed_days=None):
+        self.capacity = capacity or _setting('DEDUP_BLOOM_CAPACITY', 1000000)
+        self.error_rate = error_rate or _setting('DEDUP_BLOOM_ERROR_RATE', 0.001)
+        self.seed_days = seed_days if seed_days is not None else _setting('DEDUP_SEED_DAYS', 2)
+        self.current = BloomFilter(self.capacity, self.error_rate)
+        self.previous = None
+        self.recent = OrderedDict()
+        self.recent_size = _setting('DEDUP_RECENT_KEYS', 100000)
+        self.seeded = False
+        self.dropped = 0
+
+    def _add(self, key):
+        self.recent[key] = None
+        if len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+        if self.current.full:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+        self.current.add(key)
+
+    def _maybe_seen(self, key):
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+    def seed(self):
+        """Load the keys of recently collected content into the filter."""
+        from .models import CollectedContent
+
+        since = timezone.now() - timedelta(days=self.seed_days)
+        rows = CollectedContent.objects.filter(collected_at__gte=since).values_list(
+            'platform_id', 'channel_id', 'content_id', 'content_hash'
+        ).order_by().iterator(chunk_size=5000)
+        for platform_id, channel_id, content_id, text_hash in rows:
+            self._add(f'id:{platform_id}:{channel_id}:{content_id}')
+            if text_hash:
+                self._add(f'hash:{platform_id}:{text_hash}')
+        self.seeded = True
+
+    def filter(self, contents):
+        """
+        Return the contents not seen before, also dropping repeats within
+        the batch.
+        """
+        if not self.seeded:
+            self.seed()
+        unique = []
+        batch_keys = set()
+        for content in contents:
+            keys = content_keys(content)
+            if batch_keys.isdisjoint(keys) and not any(key in self.recent for key in keys):
+                batch_keys.update(keys)
+                unique.append(content)
+
+        suspects = [
+            content for content in unique
+            if any(self._maybe_seen(key) for key in content_keys(content))
+        ]
+        existing = stored_keys(suspects)
+        kept = [content for content in unique if existing.isdisjoint(content_keys(content))]
+        for content in kept:
+            for key in content_keys(content):
+                self._add(key)
+        self.dropped += len(contents) - len(kept)
+        return kept
+
+    def forget(self, contents):
+        """
+        Drop the exact keys of contents filter() let through but that were
+        not stored, so they pass again when fetched again. Their Bloom
+        filter bits stay set; those hits are confirmed in the database.
+        """
+        for content in contents:
+            for key in content_keys(content):
+                self.recent.pop(key, None)
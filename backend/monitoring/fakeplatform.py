@@ -0,0 +1,142 @@
+"""
+Fake platform HTTP server for offline collection benchmarks.
+
+Speaks the HTTPConnector contract and generates an endless, deterministic
+message stream per channel at a configurable rate, with optional latency,
+random server errors and a fixed-window rate limit that answers 429 with
+the usual X-RateLimit headers. A share of the messages contain (often
+obfuscated) drug slang so the detection path has something to find.
+
+    python manage.py run_fake_platform --port 8900 --message-rate 50
+    python manage.py benchmark_collection --sessions 200 --duration 30
+"""
+
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+FILLER_WORDS = [
+    'hello', 'anyone', 'around', 'tonight', 'party', 'weekend', 'price', 'today',
+    'meet', 'near', 'station', 'good', 'quality', 'send', 'message', 'cash',
+    'delivery', 'available', 'new', 'stock', 'check', 'channel', 'later', 'thanks',
+]
+
+SLANG_TERMS = [
+    'mdma', 'm.d.m.a', 'molly', 'c0ca1ne', 'cocaine', 'coke', 'weed', 'w33d', '420',
+    'lsd', 'acid', 'meth', 'ice', 'speed', 'mephedrone', 'pills', 'xanax',
+]
+
+
+class FakePlatform:
+    """
+    Deterministic message source plus the aiohttp application serving it.
+    """
+
+    def __init__(self, message_rate=10.0, backlog=100, latency=0.0, jitter=0.5,
+                 error_rate=0.0, rate_limit=0, suspicious_ratio=0.1, seed=0):
+        self.message_rate = message_rate
+        self.backlog = backlog
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.suspicious_ratio = suspicious_ratio
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.started = time.time()
+        self.window_start = self.started
+        self.window_requests = 0
+        self.stats = {'requests': 0, 'messages': 0, 'errors': 0, 'throttled': 0}
+
+    def available(self, now=None):
+        """Number of messages each channel has published so far."""
+        elapsed = (now or time.time()) - self.started
+        return self.backlog + int(elapsed * self.message_rate)
+
+    def message(self, channel, number):
+        """Build message ``number`` of ``channel``; the same inputs give the same message."""
+        rng = random.Random(f'{self.seed}:{channel}:{number}')
+        words = rng.sample(FILLER_WORDS, rng.randint(3, 8))
+        if rng.random() < self.suspicious_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(SLANG_TERMS))
+        published = self.started + max(number - self.backlog, 0) / max(self.message_rate, 1e-9)
+        user = rng.randint(1, 5000)
+        return {
+            'id': number,
+            'text': ' '.join(words),
+            'user_id': str(user),
+            'username': f'user{user}',
+            'timestamp': published,
+            'url': f'https://fake.example/{channel}/{number}',
+            'channel_name': channel,
+            'type': 'message',
+        }
+
+    def _rate_limit_headers(self, now):
+        if not self.rate_limit:
+            return {}
+        if now - self.window_start >= 60:
+            self.window_start, self.window_requests = now, 0
+        remaining = max(self.rate_limit - self.window_requests, 0)
+        return {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': f'{self.window_start + 60:.3f}',
+        }
+
+    async def _delay(self):
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self.random.uniform(self.latency - spread, self.latency + spread)))
+
+    async def handle_messages(self, request):
+        self.stats['requests'] += 1
+        await self._delay()
+        now = time.time()
+        headers = self._rate_limit_headers(now)
+        if self.rate_limit and self.window_requests >= self.rate_limit:
+            self.stats['throttled'] += 1
+            return web.json_response({'error': 'rate limited'}, status=429, headers=headers)
+        if self.rate_limit:
+            self.window_requests += 1
+            headers['X-RateLimit-Remaining'] = str(self.rate_limit - self.window_requests)
+        if self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response({'error': 'internal error'}, status=500, headers=headers)
+
+        channel = request.match_info['channel']
+        try:
+            since = int(request.query.get('since', 0))
+            limit = max(1, min(int(request.query.get('limit', 100)), 1000))
+        except ValueError:
+            return web.json_response({'error': 'bad cursor'}, status=400)
+        last = min(self.available(now), since + limit)
+        messages = [self.message(channel, number) for number in range(since + 1, last + 1)]
+        self.stats['messages'] += len(messages)
+        return web.json_response({
+            'messages': messages,
+            'cursor': last if messages else since,
+            'has_more': last < self.available(now),
+        }, headers=headers)
+
+    async def handle_status(self, request):
+        return web.json_response({
+            'version': 'fake-1',
+            'uptime': round(time.time() - self.started, 3),
+            **self.stats,
+        })
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get('/channels/{channel}/messages', self.handle_messages)
+        app.router.add_get('/status', self.handle_status)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8900):
+        """Serve in the running event loop; returns the runner to clean up."""
+        runner = web.AppRunner(self.application(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
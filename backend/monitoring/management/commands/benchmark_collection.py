@@ -0,0 +1,98 @@
+"""
+Measure end-to-end collection throughput against the fake platform.
+"""
+
+import asyncio
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from detection.models import DetectionResult, Platform
+from hack2drug.counter_buffer import counter_buffer
+from monitoring.collector import Collector
+from monitoring.models import MonitoringSession
+from .run_fake_platform import add_fake_platform_arguments, fake_platform_from_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Start a fake platform, poll it with N temporary monitoring sessions '
+        'for a fixed time and report collection throughput.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=50)
+        parser.add_argument('--channels', type=int, default=2, help='Channels per session.')
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds to collect.')
+        parser.add_argument('--interval', type=int, default=1, help='Session monitoring_interval.')
+        parser.add_argument('--batch-limit', type=int, default=500,
+                            help='Messages requested per fetch (max_content_per_session).')
+        parser.add_argument('--rate-limit', type=int, default=6000,
+                            help='Platform.rate_limit (requests per minute) for the collector.')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark platform, sessions and content.')
+        add_fake_platform_arguments(parser)
+
+    def handle(self, *args, **options):
+        fake = fake_platform_from_options(options)
+        platform, session_ids = self._create_sessions(options)
+        try:
+            started = time.monotonic()
+            written = asyncio.run(self._run(fake, session_ids, options))
+            elapsed = time.monotonic() - started
+        finally:
+            if not options['keep']:
+                # Detections first: their rollup deltas must be applied
+                # while the platform's rollup rows still exist.
+                DetectionResult.objects.filter(platform=platform).delete()
+                counter_buffer.flush()
+                # Cascades to the sessions and their collected content.
+                platform.delete()
+            counter_buffer.flush()
+
+        stats = fake.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} items stored in {elapsed:.1f}s ({written / elapsed:.0f} items/s)'
+        ))
+        self.stdout.write(
+            f"requests={stats['requests']} served={stats['messages']} "
+            f"errors={stats['errors']} throttled={stats['throttled']}"
+        )
+
+    def _create_sessions(self, options):
+        user = get_user_model().objects.filter(is_superuser=True).first() or \
+            get_user_model().objects.first()
+        if user is None:
+            raise SystemExit('Create a user before running the benchmark.')
+        platform = Platform.objects.create(
+            name='fake-benchmark',
+            platform_type='other',
+            api_endpoint=f"http://127.0.0.1:{options['port']}",
+            rate_limit=options['rate_limit'],
+        )
+        channels = [f'channel{number}' for number in range(options['channels'])]
+        sessions = MonitoringSession.objects.bulk_create([
+            MonitoringSession(
+                platform=platform,
+                user=user,
+                name=f'benchmark {number}',
+                target_channels=channels,
+                monitoring_interval=options['interval'],
+                max_content_per_session=options['batch_limit'],
+            )
+            for number in range(options['sessions'])
+        ])
+        return platform, [session.pk for session in sessions]
+
+    async def _run(self, fake, session_ids, options):
+        runner = await fake.start('127.0.0.1', options['port'])
+        try:
+            collector = Collector(session_ids=session_ids)
+            task = asyncio.create_task(collector.run())
+            await asyncio.sleep(options['duration'])
+            collector.stop()
+            return await task
+        finally:
+            await runner.cleanup()
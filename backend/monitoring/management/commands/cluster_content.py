@@ -0,0 +1,37 @@
+"""
+Assign collected content that has no near-duplicate cluster yet.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hack2drug.counter_buffer import counter_buffer
+from monitoring.clusters import assign_clusters
+from monitoring.models import CollectedContent
+
+
+class Command(BaseCommand):
+    help = 'Cluster CollectedContent rows collected before clustering was enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = CollectedContent.objects.filter(cluster__isnull=True).only(
+            'id', 'content_text'
+        ).order_by('pk')
+        assigned = clusters = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                added = assign_clusters(batch)
+            assigned += sum(added.values())
+            clusters += len(added)
+            last_pk = batch[-1].pk
+        counter_buffer.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Assigned {assigned} items to {clusters} clusters'
+        ))
@@ -0,0 +1,32 @@
+"""
+Run the asyncio collector for active monitoring sessions.
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from monitoring.collector import Collector
+
+
+class Command(BaseCommand):
+    help = 'Poll every active monitoring session on one event loop and store collected content.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session', type=int, action='append', dest='sessions',
+            help='Only collect for this session id (repeatable).',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Poll each session once and exit instead of running as a daemon.',
+        )
+
+    def handle(self, *args, **options):
+        written = asyncio.run(self._run(options['sessions'], options['once']))
+        self.stdout.write(self.style.SUCCESS(f'Collector stopped; stored {written} items'))
+
+    async def _run(self, sessions, once):
+        collector = Collector(session_ids=sessions)
+        collector.install_signal_handlers()
+        return await collector.run(once=once)
@@ -0,0 +1,65 @@
+"""
+Serve a fake platform for collector load tests.
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from monitoring.fakeplatform import FakePlatform
+
+
+def add_fake_platform_arguments(parser):
+    parser.add_argument('--message-rate', type=float, default=10.0,
+                        help='Messages published per second per channel.')
+    parser.add_argument('--backlog', type=int, default=100,
+                        help='Messages each channel already has at startup.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Mean response latency in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.5,
+                        help='Latency spread as a fraction of --latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of requests answered with HTTP 500.')
+    parser.add_argument('--server-rate-limit', type=int, default=0,
+                        help='Requests per minute before answering 429 (0 = unlimited).')
+    parser.add_argument('--suspicious-ratio', type=float, default=0.1,
+                        help='Share of messages containing drug slang.')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def fake_platform_from_options(options):
+    return FakePlatform(
+        message_rate=options['message_rate'],
+        backlog=options['backlog'],
+        latency=options['latency'],
+        jitter=options['jitter'],
+        error_rate=options['error_rate'],
+        rate_limit=options['server_rate_limit'],
+        suspicious_ratio=options['suspicious_ratio'],
+        seed=options['seed'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Run a fake platform HTTP server that emits synthetic messages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        add_fake_platform_arguments(parser)
+
+    def handle(self, *args, **options):
+        platform = fake_platform_from_options(options)
+        self.stdout.write(f"Fake platform on http://{options['host']}:{options['port']}")
+        try:
+            asyncio.run(self._serve(platform, options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(str(platform.stats))
+
+    async def _serve(self, platform, host, port):
+        runner = await platform.start(host, port)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel_id', models.CharField(max_length=255)),
+                ('cursor', models.CharField(max_length=255)),
+                ('last_message_id', models.CharField(blank=True, max_length=255)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('monitoring_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cursors', to='monitoring.monitoringsession')),
+            ],
+            options={
+                'verbose_name': 'Collection Cursor',
+                'verbose_name_plural': 'Collection Cursors',
+                'unique_together': {('monitoring_session', 'channel_id')},
+            },
+        ),
+    ]
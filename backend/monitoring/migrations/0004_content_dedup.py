@@ -0,0 +1,124 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:29
+
+import hashlib
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copies of detection.normalization.normalize_text and
+# monitoring.dedup.content_hash as of this migration, so later changes to
+# those modules do not change what it computes.
+
+LEET_TABLE = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    '@': 'a', '$': 's', '!': 'i', '|': 'l', '+': 't', '€': 'e', '£': 'l',
+})
+LEET_TOKEN_RE = re.compile(r'[@$]?\w+(?:[@$!|+€£]+\w+)*')
+SPACED_LETTERS_RE = re.compile(r'(?<!\w)(?:\w[\s.\-_*/\\]){2,}\w(?!\w)')
+NON_WORD_RE = re.compile(r'[^\w]+')
+REPEAT_RE = re.compile(r'(\w)\1{2,}')
+MIN_TEXT_LENGTH = 20
+
+
+def translate_leet(match):
+    token = match.group()
+    if sum(char.isalpha() for char in token) < 2:
+        return token
+    return token.translate(LEET_TABLE)
+
+
+def normalize_text(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = LEET_TOKEN_RE.sub(translate_leet, text.lower())
+    text = SPACED_LETTERS_RE.sub(lambda match: ''.join(char for char in match.group() if char.isalnum()), text)
+    text = REPEAT_RE.sub(r'\1\1', text)
+    text = NON_WORD_RE.sub(' ', text).replace('_', ' ')
+    return ' '.join(text.split())
+
+
+def content_hash(text):
+    normalized = normalize_text(text)
+    if len(normalized) < MIN_TEXT_LENGTH:
+        return ''
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def remove_from_trigram_index(schema_editor, ids):
+    """Drop deleted rows from the trigram table detection 0005 created."""
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.executemany(
+                'DELETE FROM monitoring_collectedcontent_trgm WHERE rowid = %s', [(pk,) for pk in ids]
+            )
+        elif vendor == 'postgresql':
+            cursor.execute('DELETE FROM monitoring_collectedcontent_trgm WHERE id = ANY(%s)', [list(ids)])
+
+
+def populate_dedup_keys(apps, schema_editor):
+    """Fill platform and content_hash, then drop repeated (platform, channel, content_id) rows."""
+    CollectedContent = apps.get_model('monitoring', 'CollectedContent')
+    MonitoringSession = apps.get_model('monitoring', 'MonitoringSession')
+    for session_id, platform_id in MonitoringSession.objects.values_list('id', 'platform_id'):
+        CollectedContent.objects.filter(monitoring_session_id=session_id).update(platform_id=platform_id)
+
+    batch = []
+    for content in CollectedContent.objects.only('id', 'content_text').iterator(chunk_size=1000):
+        content.content_hash = content_hash(content.content_text)
+        batch.append(content)
+        if len(batch) >= 1000:
+            CollectedContent.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    CollectedContent.objects.bulk_update(batch, ['content_hash'])
+
+    # Keep the first copy of every (platform, channel, content_id).
+    groups = CollectedContent.objects.values('platform_id', 'channel_id', 'content_id').annotate(
+        first_id=models.Min('id'), count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    duplicates = []
+    for group in list(groups):
+        duplicates.extend(CollectedContent.objects.filter(
+            platform_id=group['platform_id'], channel_id=group['channel_id'],
+            content_id=group['content_id'], id__gt=group['first_id'],
+        ).values_list('id', flat=True))
+    if duplicates:
+        CollectedContent.objects.filter(id__in=duplicates).delete()
+        remove_from_trigram_index(schema_editor, duplicates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_detection_rollups'),
+        ('monitoring', '0003_collection_cursors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectedcontent',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='collectedcontent',
+            name='platform',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='collected_content', to='detection.platform'),
+        ),
+        # Irreversible data step: reversing only drops the new columns (the
+        # AddField operations); duplicate rows deleted here are not restored.
+        migrations.RunPython(populate_dedup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='collectedcontent',
+            index=models.Index(fields=['platform', 'content_hash'], name='monitoring__platfor_89b832_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='collectedcontent',
+            constraint=models.UniqueConstraint(fields=('platform', 'channel_id', 'content_id'), name='unique_platform_channel_content_id'),
+        ),
+    ]
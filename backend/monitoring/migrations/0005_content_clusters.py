@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_content_dedup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('is_suspicious', models.BooleanField(default=False)),
+                ('confidence_score', models.FloatField(blank=True, null=True)),
+                ('detected_keywords', models.JSONField(blank=True, default=list)),
+                ('analysis', models.JSONField(blank=True, default=dict)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('representative', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='monitoring.collectedcontent')),
+            ],
+            options={
+                'verbose_name': 'Content Cluster',
+                'verbose_name_plural': 'Content Clusters',
+                'ordering': ['-size'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ContentClusterBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='monitoring.contentcluster')),
+            ],
+            options={
+                'verbose_name': 'Content Cluster Band',
+                'verbose_name_plural': 'Content Cluster Bands',
+            },
+        ),
+        migrations.AddField(
+            model_name='collectedcontent',
+            name='cluster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='members', to='monitoring.contentcluster'),
+        ),
+        migrations.AddIndex(
+            model_name='contentcluster',
+            index=models.Index(fields=['size', 'last_seen'], name='monitoring__size_3632ac_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_content_clusters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectioncursor',
+            name='sequence',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
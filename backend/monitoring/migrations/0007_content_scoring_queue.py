@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_collection_cursor_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectedcontent',
+            name='scoring_queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='collectedcontent',
+            index=models.Index(fields=['processed', 'scoring_queued_at'], name='monitoring__process_cab86c_idx'),
+        ),
+    ]
@@ -99,12 +99,20 @@ class CollectedContent(models.Model):
         on_delete=models.CASCADE, 
         related_name='collected_content'
     )
+    platform = models.ForeignKey(
+        Platform,
+        on_delete=models.CASCADE,
+        related_name='collected_content',
+        null=True,
+        blank=True
+    )
     
     # Content information
     content_type = models.CharField(max_length=20, choices=CONTENT_TYPES)
     content_id = models.CharField(max_length=255)  # Platform-specific ID
     content_text = models.TextField(blank=True)
     content_url = models.URLField(blank=True)
+    content_hash = models.CharField(max_length=40, blank=True)  # Normalized text hash, see monitoring.dedup
     
     # User information
     user_id = models.CharField(max_length=255, blank=True)
@@ -130,9 +138,19 @@ class CollectedContent(models.Model):
     location_data = models.JSONField(default=dict, blank=True)
     timestamp = models.DateTimeField()
     
+    # Near-duplicate cluster, see monitoring.clusters
+    cluster = models.ForeignKey(
+        'ContentCluster',
+        on_delete=models.SET_NULL,
+        related_name='members',
+        null=True,
+        blank=True
+    )
+    
     # Collection info
     collected_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
+    scoring_queued_at = models.DateTimeField(null=True, blank=True)  # Last queued for scoring, see detection.tasks
     
     class Meta:
         verbose_name = 'Collected Content'
@@ -142,11 +160,29 @@ class CollectedContent(models.Model):
             models.Index(fields=['content_type', 'collected_at']),
             models.Index(fields=['is_suspicious', 'collected_at']),
             models.Index(fields=['monitoring_session', 'collected_at']),
+            models.Index(fields=['platform', 'content_hash']),
+            models.Index(fields=['processed', 'scoring_queued_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['platform', 'channel_id', 'content_id'],
+                name='unique_platform_channel_content_id'
+            ),
         ]
     
     def __str__(self):
         return f"{self.content_type} from {self.username} - {self.collected_at}"
     
+    def save(self, *args, **kwargs):
+        """Fill in the dedup keys for rows created outside the collector."""
+        if self._state.adding:
+            from .dedup import content_hash
+            if self.platform_id is None:
+                self.platform_id = self.monitoring_session.platform_id
+            if not self.content_hash:
+                self.content_hash = content_hash(self.content_text)
+        super().save(*args, **kwargs)
+    
     def mark_suspicious(self, confidence_score, keywords=None, ml_analysis=None):
         """Mark content as suspicious."""
         self.is_suspicious = True
@@ -165,6 +201,91 @@ class CollectedContent(models.Model):
         self.save(update_fields=['processed'])
 
 
+class ContentCluster(models.Model):
+    """
+    Near-duplicate collected messages, e.g. one ad reposted with small
+    edits across channels.
+
+    Members are matched against the MinHash signature of the
+    representative. The representative's score is stored here and
+    reused for every member scored with the same pattern version.
+    """
+    representative = models.ForeignKey(
+        CollectedContent,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    signature = models.BinaryField()  # MinHash of the representative text
+    size = models.PositiveIntegerField(default=0)
+    
+    # Score of the representative, copied to members
+    is_suspicious = models.BooleanField(default=False)
+    confidence_score = models.FloatField(null=True, blank=True)
+    detected_keywords = models.JSONField(default=list, blank=True)
+    analysis = models.JSONField(default=dict, blank=True)
+    
+    # Timestamps
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Content Cluster'
+        verbose_name_plural = 'Content Clusters'
+        ordering = ['-size']
+        indexes = [
+            models.Index(fields=['size', 'last_seen']),
+        ]
+    
+    def __str__(self):
+        return f"Cluster {self.pk} ({self.size} messages)"
+
+
+class ContentClusterBand(models.Model):
+    """
+    LSH bucket of a cluster signature; one row per band.
+    """
+    cluster = models.ForeignKey(ContentCluster, on_delete=models.CASCADE, related_name='bands')
+    bucket = models.BigIntegerField(db_index=True)
+    
+    class Meta:
+        verbose_name = 'Content Cluster Band'
+        verbose_name_plural = 'Content Cluster Bands'
+
+
+class CollectionCursor(models.Model):
+    """
+    Where collection of one session channel stopped.
+
+    Written in the same transaction as the CollectedContent batch it
+    covers, so a restarted collector resumes exactly after the last
+    stored message.
+    """
+    monitoring_session = models.ForeignKey(
+        MonitoringSession,
+        on_delete=models.CASCADE,
+        related_name='cursors'
+    )
+    channel_id = models.CharField(max_length=255)
+
+    # Opaque connector cursor passed back to fetch_since()
+    cursor = models.CharField(max_length=255)
+    last_message_id = models.CharField(max_length=255, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    sequence = models.BigIntegerField(default=0)  # fetch time in ns; cursors only move forward
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Collection Cursor'
+        verbose_name_plural = 'Collection Cursors'
+        unique_together = ['monitoring_session', 'channel_id']
+
+    def __str__(self):
+        return f"{self.monitoring_session.name} / {self.channel_id} @ {self.cursor}"
+
+
 class MonitoringRule(models.Model):
     """
     Rules for monitoring and content collection.
@@ -334,4 +455,6 @@ class PlatformConnection(models.Model):
         self.rate_limit_reset = reset_time
         if remaining == 0:
             self.status = 'rate_limited'
+        elif self.status == 'rate_limited':
+            self.status = 'connected'
         self.save(update_fields=['rate_limit_remaining', 'rate_limit_reset', 'status'])
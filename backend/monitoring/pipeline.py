@@ -0,0 +1,404 @@
+"""
+Staged ingest pipeline between collectors and the database.
+
+Collectors hand every fetched page to the pipeline, which moves it
+through asyncio stages connected by bounded queues:
+
+    collect -> normalize -> dedup -> score -> persist
+
+* normalize: hash the normalized text of each message (per page).
+* dedup: group pages into batches of about PIPELINE_BATCH_SIZE messages,
+  drop duplicates (monitoring.dedup) and match near-duplicate clusters
+  in memory (monitoring.clusters).
+* score: run the detection engine, once per cluster, and prepare
+  DetectionResult rows for suspicious messages.
+* persist: write new clusters, CollectedContent, cursors, cluster
+  membership and DetectionResult rows of a batch in one transaction.
+
+Each stage has its own worker count (PIPELINE_*_WORKERS). Dedup keeps
+in-process state and always runs a single worker. When a stage falls
+behind, its inbox fills up, the stage before it blocks on put(), and so
+on back to the collectors, so a slow database or scoring stage slows
+down fetching instead of growing memory.
+
+A page and the cursor after it travel as one item, so a cursor is only
+stored together with the messages it covers. submit() returns a future
+that resolves to True once the page's batch has committed and to False
+when a stage failed on it; the collector only moves on from a page once
+it is stored, so a failed page is fetched again on the next poll. The
+dedup keys of a failed batch are released for that.
+"""
+
+import asyncio
+import logging
+import time
+from collections import namedtuple, Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from detection.cache import get_pattern_set
+from detection.fuzzy import index_objects
+from detection.models import Platform
+from detection.services import (
+    SCORED_CLUSTER_FIELDS, bulk_create_detections, detection_fields, score_contents,
+)
+from .clusters import create_clusters, match_clusters, record_members
+from .dedup import ContentDeduplicator, content_hash, insert_contents
+from .models import CollectionCursor, ContentCluster
+from .signals import record_content_counts
+
+logger = logging.getLogger('monitoring')
+
+# Position of a session channel after a fetched page. ``sequence``
+# orders updates of one channel (nanoseconds at fetch time).
+CursorUpdate = namedtuple('CursorUpdate', [
+    'session_id', 'channel', 'cursor', 'last_message_id', 'last_timestamp', 'sequence',
+])
+
+# Unsaved CollectedContent of one fetched page, the cursor after it and
+# the future resolved with whether the page was stored.
+Page = namedtuple('Page', ['contents', 'cursor', 'stored'], defaults=(None,))
+
+
+class IngestBatch:
+    """
+    Pages grouped by the dedup stage, plus what later stages add to them.
+    """
+
+    def __init__(self, pages):
+        self.cursors = [page.cursor for page in pages]
+        self.contents = [content for page in pages for content in page.contents]
+        self.received = len(self.contents)
+        self.pages_stored = [page.stored for page in pages]
+        self.deduplicated = False
+        self.new_clusters = {}
+        self.clusters = {}
+        self.detections = []
+
+
+def settle(item, stored):
+    """Resolve the ``stored`` futures of a Page or IngestBatch."""
+    futures = item.pages_stored if isinstance(item, IngestBatch) else [item.stored]
+    for future in futures:
+        if future is not None and not future.done():
+            future.set_result(stored)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_page(page):
+    """Fill in the text hash of every message of a page."""
+    for content in page.contents:
+        if not content.content_hash:
+            content.content_hash = content_hash(content.content_text)
+    return page
+
+
+def dedup_batch(batch, deduplicator):
+    """
+    Drop seen content from a batch and assign the rest to clusters; new
+    clusters are only inserted by persist_batch().
+    """
+    batch.contents = deduplicator.filter(batch.contents)
+    batch.deduplicated = True
+    if batch.contents and _setting('CONTENT_CLUSTERING_ENABLED', True):
+        batch.new_clusters = match_clusters(batch.contents)
+    return batch
+
+
+def score_batch(batch):
+    """Score a batch, once per near-duplicate cluster, and prepare detections."""
+    if not batch.contents:
+        return batch
+    pattern_set = get_pattern_set()
+    clusters = ContentCluster.objects.only('id', *SCORED_CLUSTER_FIELDS).in_bulk(
+        {content.cluster_id for content in batch.contents if content.cluster_id and content.cluster_id > 0}
+    )
+    clusters.update((placeholder, new.cluster) for placeholder, new in batch.new_clusters.items())
+    batch.clusters, propagated = score_contents(batch.contents, clusters, pattern_set)
+    batch.detections = [content for content in batch.contents if content.is_suspicious]
+    return batch
+
+
+def _advance_cursor(update):
+    """Store update unless a newer one is stored already; False if no row exists."""
+    return CollectionCursor.objects.filter(
+        monitoring_session_id=update.session_id,
+        channel_id=update.channel,
+        sequence__lt=update.sequence,
+    ).update(
+        cursor=str(update.cursor),
+        last_message_id=update.last_message_id,
+        last_timestamp=update.last_timestamp,
+        sequence=update.sequence,
+        updated_at=timezone.now(),
+    ) > 0
+
+
+def save_cursors(updates):
+    """
+    Store the latest CursorUpdate per session channel.
+
+    Batches may commit out of order when several score or persist
+    workers run, so a cursor only moves to a higher sequence.
+    """
+    latest = {}
+    for update in updates:
+        key = (update.session_id, update.channel)
+        if key not in latest or latest[key].sequence < update.sequence:
+            latest[key] = update
+    missing = [update for update in latest.values() if not _advance_cursor(update)]
+    if missing:
+        CollectionCursor.objects.bulk_create(
+            [
+                CollectionCursor(
+                    monitoring_session_id=update.session_id,
+                    channel_id=update.channel,
+                    cursor=str(update.cursor),
+                    last_message_id=update.last_message_id,
+                    last_timestamp=update.last_timestamp,
+                    sequence=update.sequence,
+                )
+                for update in missing
+            ],
+            ignore_conflicts=True,
+        )
+        # A concurrent batch may have created the row first.
+        for update in missing:
+            _advance_cursor(update)
+
+
+def persist_batch(batch):
+    """
+    Write a batch in one transaction: new clusters, content, cluster
+    membership and scores, detections and cursors. Returns the number of
+    rows stored.
+    """
+    with transaction.atomic():
+        # New clusters carry their score already; known ones are updated.
+        representatives = create_clusters(batch.contents, batch.new_clusters)
+        contents = insert_contents(batch.contents) if batch.contents else []
+        if contents:
+            index_objects(contents)
+            record_members(contents, representatives)
+            known = [
+                cluster for cluster_id, cluster in batch.clusters.items() if cluster_id not in batch.new_clusters
+            ]
+            if known:
+                ContentCluster.objects.bulk_update(known, SCORED_CLUSTER_FIELDS)
+            stored = set(map(id, contents))
+            suspicious = [content for content in batch.detections if id(content) in stored]
+            by_platform = defaultdict(list)
+            for content in suspicious:
+                by_platform[content.platform_id].append(detection_fields(content))
+            platforms = Platform.objects.in_bulk(list(by_platform))
+            for platform_id, items in by_platform.items():
+                bulk_create_detections(platforms[platform_id], items)
+
+            per_session = defaultdict(Counter)
+            for content in contents:
+                per_session[content.monitoring_session_id]['collected'] += 1
+            for content in suspicious:
+                per_session[content.monitoring_session_id]['suspicious'] += 1
+            record_content_counts(
+                {
+                    session_id: (counts['collected'], counts['suspicious'])
+                    for session_id, counts in per_session.items()
+                },
+                len(contents), len(suspicious),
+            )
+        if batch.cursors:
+            save_cursors(batch.cursors)
+    return len(contents)
+
+
+# Queued to tell a stage worker to finish.
+_CLOSE = object()
+
+
+class Stage:
+    """
+    ``workers`` tasks taking items from the stage's bounded inbox,
+    running ``handler`` on them and passing results to ``next_stage``.
+    Items the handler fails on are passed to ``on_error``.
+    """
+
+    def __init__(self, name, handler, workers, queue_size, next_stage=None, on_error=None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.inbox = asyncio.Queue(queue_size)
+        self.next_stage = next_stage
+        self.on_error = on_error
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    async def run(self):
+        """Run the workers until closed, then close the next stage."""
+        await asyncio.gather(*(self._work() for _ in range(self.workers)))
+        if self.next_stage is not None:
+            await self.next_stage.close()
+
+    async def close(self):
+        """Let each worker finish once the items queued before are done."""
+        for _ in range(self.workers):
+            await self.inbox.put(_CLOSE)
+
+    async def _work(self):
+        while True:
+            item = await self.inbox.get()
+            if item is _CLOSE:
+                return
+            await self._handle(item)
+
+    async def _handle(self, item):
+        started = time.monotonic()
+        try:
+            result = await self.handler(item)
+        except Exception:
+            logger.exception('Ingest stage %s failed', self.name)
+            self.failed += 1
+            if self.on_error is not None:
+                await self.on_error(item)
+            return
+        finally:
+            self.busy_time += time.monotonic() - started
+        self.processed += 1
+        if self.next_stage is not None and result is not None:
+            await self.next_stage.inbox.put(result)
+
+
+class BatchingStage(Stage):
+    """
+    Single-worker stage that groups pages into IngestBatches of about
+    ``batch_size`` messages, waiting at most ``flush_interval`` seconds.
+    """
+
+    def __init__(self, name, handler, queue_size, next_stage, batch_size, flush_interval, on_error=None):
+        super().__init__(name, handler, 1, queue_size, next_stage, on_error)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    async def _work(self):
+        while True:
+            pages, closed = await self._next_pages()
+            if pages:
+                await self._handle(IngestBatch(pages))
+            if closed:
+                return
+
+    async def _next_pages(self):
+        """Return (pages, closed) once a batch is full, stale or closed."""
+        page = await self.inbox.get()
+        if page is _CLOSE:
+            return [], True
+        pages, size = [page], len(page.contents)
+        deadline = time.monotonic() + self.flush_interval
+        while size < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                page = await asyncio.wait_for(self.inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if page is _CLOSE:
+                return pages, True
+            pages.append(page)
+            size += len(page.contents)
+        return pages, False
+
+
+class IngestPipeline:
+    """
+    The normalize, dedup, score and persist stages and their queues.
+
+    Start it with run() as a task, feed it with submit() and call close()
+    to drain everything queued and stop.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, queue_size=None,
+                 normalize_workers=None, score_workers=None, persist_workers=None):
+        queue_size = queue_size or _setting('PIPELINE_QUEUE_SIZE', 50)
+        self.deduplicator = ContentDeduplicator()
+        self.stored = 0
+        persist = Stage(
+            'persist',
+            self._persist,
+            persist_workers or _setting('PIPELINE_PERSIST_WORKERS', 1),
+            queue_size,
+            on_error=self._failed,
+        )
+        score = Stage(
+            'score',
+            sync_to_async(score_batch, thread_sensitive=False),
+            score_workers or _setting('PIPELINE_SCORE_WORKERS', 2),
+            queue_size, persist,
+            on_error=self._failed,
+        )
+        dedup = BatchingStage(
+            'dedup',
+            self._dedup,
+            queue_size, score,
+            batch_size or _setting('PIPELINE_BATCH_SIZE', 500),
+            flush_interval or _setting('PIPELINE_FLUSH_INTERVAL', 2.0),
+            on_error=self._failed,
+        )
+        normalize = Stage(
+            'normalize',
+            sync_to_async(normalize_page, thread_sensitive=False),
+            normalize_workers or _setting('PIPELINE_NORMALIZE_WORKERS', 2),
+            queue_size, dedup,
+            on_error=self._failed,
+        )
+        self.stages = [normalize, dedup, score, persist]
+
+    async def _dedup(self, batch):
+        return await sync_to_async(dedup_batch)(batch, self.deduplicator)
+
+    async def _persist(self, batch):
+        self.stored += await sync_to_async(persist_batch, thread_sensitive=False)(batch)
+        settle(batch, True)
+
+    async def _failed(self, item):
+        """Report a page or batch a stage failed on as not stored."""
+        if isinstance(item, IngestBatch) and item.deduplicated:
+            # Runs in the dedup stage's thread, like filter().
+            await sync_to_async(self.deduplicator.forget)(item.contents)
+        settle(item, False)
+
+    async def submit(self, contents, cursor_update):
+        """
+        Queue a fetched page; blocks while the pipeline is full. Returns
+        a future resolved with whether the page was stored.
+        """
+        stored = asyncio.get_running_loop().create_future()
+        await self.stages[0].inbox.put(Page(contents, cursor_update, stored))
+        return stored
+
+    async def run(self):
+        """Run every stage until close() has drained the pipeline."""
+        await asyncio.gather(*(stage.run() for stage in self.stages))
+
+    async def close(self):
+        """Stop accepting pages; run() returns once everything is stored."""
+        await self.stages[0].close()
+
+    def stats(self):
+        """Per-stage processed items, busy seconds and queue depth."""
+        return {
+            stage.name: {
+                'processed': stage.processed,
+                'failed': stage.failed,
+                'busy_seconds': round(stage.busy_time, 3),
+                'queued': stage.inbox.qsize(),
+                'workers': stage.workers,
+            }
+            for stage in self.stages
+        }
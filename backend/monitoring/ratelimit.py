@@ -0,0 +1,283 @@
+"""
+Per-platform rate limiting for Hack2Drug collectors.
+
+Every platform request first reserves a slot from the platform's limiter.
+Limiters implement GCRA, a token bucket expressed as a "theoretical
+arrival time" (TAT): with a budget of ``Platform.rate_limit`` requests per
+minute, slots are handed out one ``interval`` apart after an initial burst
+of RATE_LIMIT_BURST. Callers are scheduled into the next free slot
+instead of being rejected, so the quota is used evenly and in full rather
+than spent in a burst that ends in 429s.
+
+Responses feed back into the limiter: rate limit headers clamp what is
+left of the current window and spread it up to the reset time, and a 429
+or ``remaining == 0`` holds the platform until the reset. The last seen
+values are written to PlatformConnection periodically.
+
+Limiters live in process memory by default. Set RATE_LIMIT_REDIS_URL to
+share them between collector processes.
+"""
+
+import asyncio
+import time
+import weakref
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+# Header names used by the platforms we poll, most specific first.
+REMAINING_HEADERS = ('X-RateLimit-Remaining', 'RateLimit-Remaining', 'X-Rate-Limit-Remaining')
+RESET_HEADERS = ('X-RateLimit-Reset', 'RateLimit-Reset', 'X-Rate-Limit-Reset')
+
+# Reset values above this are epoch timestamps, below it seconds from now.
+_EPOCH_THRESHOLD = 10 ** 9
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _first_header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _seconds_or_epoch(value, now):
+    value = float(value)
+    return value if value > _EPOCH_THRESHOLD else now + value
+
+
+def parse_rate_limit_headers(headers, now=None):
+    """
+    Return (remaining, reset_at, retry_at) from response headers.
+
+    Times are epoch seconds; missing or malformed values are None.
+    """
+    now = now or time.time()
+    remaining = reset_at = retry_at = None
+    try:
+        value = _first_header(headers, REMAINING_HEADERS)
+        remaining = int(float(value)) if value is not None else None
+    except ValueError:
+        pass
+    try:
+        value = _first_header(headers, RESET_HEADERS)
+        reset_at = _seconds_or_epoch(value, now) if value is not None else None
+    except ValueError:
+        pass
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            retry_at = now + float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value).timestamp()
+            except (TypeError, ValueError):
+                pass
+    return remaining, reset_at, retry_at
+
+
+# asyncio Redis clients are bound to the loop that created them, and
+# test_connection() runs each call on a fresh loop via async_to_sync.
+_redis_clients = weakref.WeakKeyDictionary()
+
+
+def _redis_client(url):
+    import redis.asyncio
+
+    loop = asyncio.get_running_loop()
+    client = _redis_clients.get(loop)
+    if client is None:
+        client = _redis_clients[loop] = redis.asyncio.from_url(url)
+    return client
+
+
+class TokenBucket:
+    """
+    In-process GCRA limiter for one platform.
+    """
+
+    def __init__(self, rate_per_minute, burst=None, clock=time.time):
+        self.clock = clock
+        self.tat = 0.0
+        self.held_until = 0.0
+        self.remaining = None
+        self.reset_at = None
+        self.dirty = False
+        self.configure(rate_per_minute, burst)
+
+    def configure(self, rate_per_minute, burst=None):
+        """Apply a (possibly changed) requests-per-minute budget."""
+        self.rate_per_minute = max(rate_per_minute, 1)
+        self.burst = max(burst or _setting('RATE_LIMIT_BURST', 5), 1)
+        self.interval = 60.0 / self.rate_per_minute
+        self.tau = (self.burst - 1) * self.interval
+
+    async def acquire(self):
+        """Wait for this caller's slot."""
+        while True:
+            now = self.clock()
+            if self.held_until > now:
+                await asyncio.sleep(self.held_until - now)
+                continue
+            delay = await self.reserve(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # A hold that arrived while we slept cancels the reservation.
+            if self.held_until <= self.clock():
+                return
+
+    async def reserve(self, now):
+        """Claim the next slot and return how long to wait for it."""
+        start = max(now, self.tat - self.tau)
+        self.tat = max(self.tat, now) + self.interval
+        return start - now
+
+    async def push_back(self, tat):
+        """Move the next free slot to no earlier than ``tat - tau``."""
+        self.tat = max(self.tat, tat)
+
+    async def hold_until(self, when):
+        """Hand out no slots before ``when`` (epoch seconds)."""
+        self.held_until = max(self.held_until, when)
+        await self.push_back(when + self.tau)
+
+    async def observe(self, status, headers):
+        """Adapt to the rate limit state reported by a response."""
+        now = self.clock()
+        remaining, reset_at, retry_at = parse_rate_limit_headers(headers, now)
+        if remaining is not None:
+            self.remaining, self.reset_at, self.dirty = remaining, reset_at, True
+
+        if status == 429 or retry_at is not None:
+            backoff = _setting('RATE_LIMIT_429_BACKOFF', 60)
+            await self.hold_until(retry_at or reset_at or now + backoff)
+            return
+        if remaining is None:
+            return
+        if remaining <= 0:
+            await self.hold_until(reset_at or now + self.interval)
+            return
+        # Never plan more back-to-back requests than the server has left...
+        await self.push_back(now + self.tau - (remaining - 1) * self.interval)
+        if reset_at and reset_at > now:
+            # ...and spread the rest evenly up to the reset.
+            spacing = (reset_at - now) / remaining
+            if spacing > self.interval:
+                await self.push_back(now + self.tau + spacing)
+
+    def take_report(self):
+        """Return (remaining, reset_at) once after each change, else None."""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        return self.remaining, self.reset_at
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    GCRA limiter whose TAT lives in Redis, shared across processes.
+    """
+
+    RESERVE_SCRIPT = """
+        local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+        local now = tonumber(ARGV[1])
+        local interval = tonumber(ARGV[2])
+        local tau = tonumber(ARGV[3])
+        local start = math.max(now, tat - tau)
+        local new_tat = math.max(tat, now) + interval
+        redis.call('SET', KEYS[1], tostring(new_tat), 'EX', math.ceil(new_tat - now + tau) + 60)
+        return tostring(start - now)
+    """
+
+    PUSH_BACK_SCRIPT = """
+        local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+        local value = tonumber(ARGV[1])
+        if value > tat then
+            redis.call('SET', KEYS[1], tostring(value), 'EX', math.ceil(value - tonumber(ARGV[2])) + 60)
+        end
+        return 1
+    """
+
+    def __init__(self, redis_url, key, rate_per_minute, burst=None, clock=time.time):
+        super().__init__(rate_per_minute, burst=burst, clock=clock)
+        self.redis_url = redis_url
+        self.key = key
+
+    def _script(self, source):
+        return _redis_client(self.redis_url).register_script(source)
+
+    async def reserve(self, now):
+        delay = await self._script(self.RESERVE_SCRIPT)(
+            keys=[self.key], args=[now, self.interval, self.tau]
+        )
+        return float(delay)
+
+    async def push_back(self, tat):
+        await self._script(self.PUSH_BACK_SCRIPT)(keys=[self.key], args=[tat, self.clock()])
+
+
+class RateLimiterRegistry:
+    """
+    One limiter per platform, shared by every session polling it.
+    """
+
+    def __init__(self):
+        self._limiters = {}
+
+    def get(self, platform_id, rate_per_minute):
+        """Return the platform's limiter, updated to the current budget."""
+        limiter = self._limiters.get(platform_id)
+        if limiter is None:
+            redis_url = _setting('RATE_LIMIT_REDIS_URL', '')
+            if redis_url:
+                limiter = RedisTokenBucket(
+                    redis_url,
+                    f'hack2drug:ratelimit:platform:{platform_id}',
+                    rate_per_minute,
+                )
+            else:
+                limiter = TokenBucket(rate_per_minute)
+            self._limiters[platform_id] = limiter
+        elif limiter.rate_per_minute != max(rate_per_minute, 1):
+            limiter.configure(rate_per_minute)
+        return limiter
+
+    def take_reports(self):
+        """Return {platform_id: (remaining, reset_at)} for changed limiters."""
+        reports = {}
+        for platform_id, limiter in self._limiters.items():
+            report = limiter.take_report()
+            if report is not None:
+                reports[platform_id] = report
+        return reports
+
+
+def load_rate_limit_holds(platform_ids):
+    """Return {platform_id: reset epoch} for platforms still out of quota."""
+    from .models import PlatformConnection
+
+    rows = PlatformConnection.objects.filter(
+        platform_id__in=platform_ids,
+        rate_limit_remaining=0,
+        rate_limit_reset__gt=timezone.now(),
+    ).values_list('platform_id', 'rate_limit_reset')
+    return {platform_id: reset.timestamp() for platform_id, reset in rows}
+
+
+def save_rate_limit_reports(reports):
+    """Persist the last rate limit headers seen per platform."""
+    from .models import PlatformConnection
+
+    for platform_id, (remaining, reset_at) in reports.items():
+        connection, created = PlatformConnection.objects.get_or_create(platform_id=platform_id)
+        reset_time = datetime.fromtimestamp(reset_at, tz=dt_timezone.utc) if reset_at else None
+        connection.update_rate_limit(max(remaining, 0), reset_time)
+
+
+rate_limiters = RateLimiterRegistry()
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import (
-    MonitoringSession, CollectedContent, MonitoringRule, 
+    MonitoringSession, CollectedContent, ContentCluster, MonitoringRule,
     MonitoringMetrics, PlatformConnection
 )
 
@@ -28,7 +28,7 @@ class CollectedContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = CollectedContent
         fields = '__all__'
-        read_only_fields = ['id', 'collected_at', 'created_at']
+        read_only_fields = ['id', 'collected_at', 'created_at', 'scoring_queued_at']
 
 
 class CollectedContentCreateSerializer(serializers.ModelSerializer):
@@ -37,6 +37,16 @@ class CollectedContentCreateSerializer(serializers.ModelSerializer):
         fields = ['session', 'platform', 'content_type', 'content', 'source_url', 'author', 'metadata']
 
 
+class ContentClusterSerializer(serializers.ModelSerializer):
+    representative_text = serializers.CharField(source='representative.content_text', read_only=True)
+    channel_count = serializers.IntegerField(read_only=True)
+    platform_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ContentCluster
+        exclude = ['signature']
+
+
 class MonitoringRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = MonitoringRule
@@ -90,6 +100,13 @@ class BulkContentSerializer(serializers.Serializer):
     batch_id = serializers.CharField(required=False)
 
 
+class ContentScoringSerializer(serializers.Serializer):
+    content_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    session_id = serializers.IntegerField(required=False)
+    unprocessed_only = serializers.BooleanField(default=True)
+    batch_size = serializers.IntegerField(required=False, min_value=1, max_value=10000)
+
+
 class MonitoringSearchSerializer(serializers.Serializer):
     query = serializers.CharField(required=False)
     platform = serializers.IntegerField(required=False)
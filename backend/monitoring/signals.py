@@ -2,77 +2,80 @@
 Signals for monitoring app.
 """
 
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from hack2drug.counter_buffer import counter_buffer
+from detection.fuzzy import get_trigram_index
 from .models import MonitoringSession, CollectedContent, MonitoringMetrics
 
+SESSION_COUNTER_FIELDS = {
+    'telegram': 'telegram_sessions',
+    'instagram': 'instagram_sessions',
+    'whatsapp': 'whatsapp_sessions',
+    'twitter': 'twitter_sessions',
+}
+
+
+def record_content_counts(session_deltas, collected, suspicious, date=None):
+    """
+    Queue content counters on the write-behind buffer after commit.
+
+    ``session_deltas`` maps session id to (collected, suspicious) counts.
+    """
+    date = date or timezone.now().date()
+    session_deltas = dict(session_deltas)
+
+    def enqueue():
+        counter_buffer.increment(
+            MonitoringMetrics,
+            {'date': date},
+            {'total_content_collected': collected, 'suspicious_content_found': suspicious},
+            create=True,
+        )
+        now = timezone.now()
+        for session_id, (session_collected, session_suspicious) in session_deltas.items():
+            counter_buffer.increment(
+                MonitoringSession,
+                {'pk': session_id},
+                {'content_collected': session_collected, 'detections_found': session_suspicious},
+                assign={'last_activity': now},
+            )
+
+    transaction.on_commit(enqueue)
+
 
 @receiver(post_save, sender=MonitoringSession)
 def update_monitoring_metrics(sender, instance, created, **kwargs):
-    """Update monitoring metrics when session is created/updated."""
+    """Update monitoring metrics when session is created."""
     if created:
-        # Update daily metrics
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        metrics, created = MonitoringMetrics.objects.get_or_create(
-            date=today,
-            defaults={
-                'telegram_sessions': 0,
-                'instagram_sessions': 0,
-                'whatsapp_sessions': 0,
-                'twitter_sessions': 0,
-                'total_content_collected': 0,
-                'suspicious_content_found': 0,
-                'false_positives': 0,
-            }
-        )
-        
-        # Update platform-specific session counts
-        platform_type = instance.platform.platform_type
-        if platform_type == 'telegram':
-            metrics.telegram_sessions += 1
-        elif platform_type == 'instagram':
-            metrics.instagram_sessions += 1
-        elif platform_type == 'whatsapp':
-            metrics.whatsapp_sessions += 1
-        elif platform_type == 'twitter':
-            metrics.twitter_sessions += 1
-        
-        metrics.save()
+        field = SESSION_COUNTER_FIELDS.get(instance.platform.platform_type)
+        if field:
+            date = timezone.now().date()
+            transaction.on_commit(lambda: counter_buffer.increment(
+                MonitoringMetrics, {'date': date}, {field: 1}, create=True
+            ))
 
 
 @receiver(post_save, sender=CollectedContent)
 def update_content_metrics(sender, instance, created, **kwargs):
     """Update content metrics when content is collected."""
     if created:
-        # Update daily metrics
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        metrics, created = MonitoringMetrics.objects.get_or_create(
-            date=today,
-            defaults={
-                'telegram_sessions': 0,
-                'instagram_sessions': 0,
-                'whatsapp_sessions': 0,
-                'twitter_sessions': 0,
-                'total_content_collected': 0,
-                'suspicious_content_found': 0,
-                'false_positives': 0,
-            }
+        suspicious = int(instance.is_suspicious)
+        record_content_counts(
+            {instance.monitoring_session_id: (1, suspicious)}, 1, suspicious
         )
-        
-        metrics.total_content_collected += 1
-        
-        if instance.is_suspicious:
-            metrics.suspicious_content_found += 1
-        
-        metrics.save()
-        
-        # Update session statistics
-        session = instance.monitoring_session
-        session.content_collected += 1
-        if instance.is_suspicious:
-            session.detections_found += 1
-        session.save()
+
+
+@receiver(post_save, sender=CollectedContent)
+def index_content_trigrams(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the fuzzy search trigram index in step with content_text."""
+    if created or update_fields is None or 'content_text' in update_fields:
+        get_trigram_index().index(sender, [instance])
+
+
+@receiver(post_delete, sender=CollectedContent)
+def remove_content_trigrams(sender, instance, **kwargs):
+    """Drop deleted content from the trigram index."""
+    get_trigram_index().remove(sender, [instance.pk])
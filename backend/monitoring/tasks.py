@@ -0,0 +1,31 @@
+"""
+Celery tasks for the monitoring app, routed to the ``bulk`` queue.
+"""
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from hack2drug.retention import delete_in_chunks
+from .models import CollectedContent, ContentCluster
+
+logger = logging.getLogger('monitoring')
+
+
+@shared_task(acks_late=True)
+def purge_expired_content():
+    """
+    Delete collected content older than CONTENT_RETENTION_DAYS that was
+    not found suspicious, and clusters without members seen since.
+    Suspicious content is kept as evidence.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.CONTENT_RETENTION_DAYS)
+    contents = delete_in_chunks(
+        CollectedContent.objects.filter(collected_at__lt=cutoff, is_suspicious=False)
+    )
+    clusters = delete_in_chunks(ContentCluster.objects.filter(last_seen__lt=cutoff))
+    logger.info('Purged %s collected items and %s clusters', contents, clusters)
+    return {'content': contents, 'clusters': clusters}
@@ -1,3 +1,537 @@
-from django.test import TestCase
+"""
+Tests for content deduplication, the ingest pipeline and rate limiting.
+"""
 
-# Create your tests here.
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from detection.cache import pattern_cache
+from detection.models import DetectionPattern, DetectionResult, Platform
+from detection.tasks import score_unprocessed_content
+from hack2drug.counter_buffer import counter_buffer
+from hack2drug.testing import IsolatedTestCase
+from users.models import User
+from .clusters import assign_clusters, match_clusters
+from .collector import SessionCollector, SessionSpec, load_active_sessions, load_cursors
+from .connectors import BaseConnector, Batch, ConnectorError, HTTPConnector, Message, PlatformSpec, get_connector
+from .dedup import ContentDeduplicator, content_hash, content_keys, insert_contents
+from .fakeplatform import FakePlatform
+from .models import (
+    CollectedContent, CollectionCursor, ContentCluster, ContentClusterBand, MonitoringSession,
+)
+from .pipeline import (
+    CursorUpdate, IngestBatch, IngestPipeline, Page, dedup_batch, persist_batch, save_cursors, score_batch,
+)
+from .ratelimit import TokenBucket
+from .tasks import purge_expired_content
+from .views import CollectedContentViewSet
+
+AD_TEXT = 'Selling pure cocaine, DM for prices and same day delivery'
+
+
+def content(session, content_id, text, channel='channel-1'):
+    """An unsaved CollectedContent as the collector builds it."""
+    return CollectedContent(
+        monitoring_session_id=session.pk,
+        platform_id=session.platform_id,
+        content_type='message',
+        content_id=content_id,
+        content_text=text,
+        content_hash=content_hash(text),
+        channel_id=channel,
+        timestamp=timezone.now(),
+    )
+
+
+class MonitoringTestCase(IsolatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='analyst', password='secret')
+        self.platform = Platform.objects.create(name='Telegram', platform_type='telegram')
+        self.session = MonitoringSession.objects.create(
+            platform=self.platform, user=self.user, name='Markets', target_channels=['channel-1'],
+        )
+
+
+class ContentHashTests(SimpleTestCase):
+
+    def test_obfuscated_reposts_share_a_hash(self):
+        self.assertEqual(content_hash(AD_TEXT), content_hash(AD_TEXT.upper()))
+        self.assertEqual(
+            content_hash('Selling pure c0ca1ne, DM for prices and same day delivery'),
+            content_hash(AD_TEXT),
+        )
+        self.assertNotEqual(content_hash(AD_TEXT), content_hash(AD_TEXT + ' tonight'))
+
+    def test_short_texts_are_not_hashed(self):
+        self.assertEqual(content_hash('ok'), '')
+        self.assertEqual(content_hash(''), '')
+
+
+class DeduplicationTests(MonitoringTestCase):
+
+    def test_drops_repeats_within_a_batch(self):
+        deduplicator = ContentDeduplicator()
+        kept = deduplicator.filter([
+            content(self.session, '1', AD_TEXT),
+            content(self.session, '1', 'another message entirely, long enough'),
+            content(self.session, '2', AD_TEXT.upper()),
+            content(self.session, '3', 'ok'),
+            content(self.session, '4', 'ok'),
+            content(self.session, '1', 'same id in another channel', channel='channel-2'),
+        ])
+        self.assertEqual(
+            [(item.channel_id, item.content_id) for item in kept],
+            [('channel-1', '1'), ('channel-1', '3'), ('channel-1', '4'), ('channel-2', '1')],
+        )
+        self.assertEqual(deduplicator.dropped, 2)
+
+    def test_drops_stored_content(self):
+        insert_contents(ContentDeduplicator().filter([
+            content(self.session, '1', AD_TEXT),
+            content(self.session, '2', 'ok'),
+        ]))
+        # A fresh deduplicator learns the stored keys from the database.
+        kept = ContentDeduplicator().filter([
+            content(self.session, '1', 'edited text of the first message'),
+            content(self.session, '3', AD_TEXT.lower()),
+            content(self.session, '2', 'ok', channel='channel-2'),
+        ])
+        self.assertEqual([item.content_id for item in kept], ['2'])
+
+    def test_forget_lets_content_through_again(self):
+        deduplicator = ContentDeduplicator()
+        batch = [content(self.session, '1', AD_TEXT)]
+        self.assertEqual(len(deduplicator.filter(batch)), 1)
+        self.assertEqual(deduplicator.filter(batch), [])
+        deduplicator.forget(batch)
+        self.assertEqual(len(deduplicator.filter([content(self.session, '1', AD_TEXT)])), 1)
+
+    def test_unique_constraint(self):
+        content(self.session, '1', AD_TEXT).save()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            content(self.session, '1', 'different text').save()
+        content(self.session, '1', 'same id in another channel', channel='channel-2').save()
+        self.assertEqual(CollectedContent.objects.count(), 2)
+
+    def test_insert_skips_rows_stored_meanwhile(self):
+        content(self.session, '1', AD_TEXT).save()
+        # Not filtered, as when another process stored the row first.
+        inserted = insert_contents([
+            content(self.session, '1', AD_TEXT),
+            content(self.session, '2', 'a new message that nobody stored'),
+        ])
+        self.assertEqual([item.content_id for item in inserted], ['2'])
+        self.assertIsNotNone(inserted[0].pk)
+        self.assertEqual(
+            sorted(CollectedContent.objects.values_list('content_id', flat=True)), ['1', '2']
+        )
+
+
+class PersistBatchTests(MonitoringTestCase):
+
+    def setUp(self):
+        super().setUp()
+        DetectionPattern.objects.create(name='cocaine', pattern_type='keyword', pattern_data='cocaine')
+        pattern_cache.invalidate()
+
+    def batch(self):
+        update = CursorUpdate(self.session.pk, 'channel-1', '2', '2', timezone.now(), 1)
+        batch = IngestBatch([Page([
+            content(self.session, '1', AD_TEXT),
+            content(self.session, '2', 'Just a friendly chat about the weather today'),
+        ], update)])
+        return score_batch(dedup_batch(batch, ContentDeduplicator()))
+
+    def test_failed_batch_leaves_nothing_behind(self):
+        batch = self.batch()
+        self.assertEqual(len(batch.new_clusters), 2)
+        with mock.patch('monitoring.pipeline.save_cursors', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                persist_batch(batch)
+        self.assertFalse(CollectedContent.objects.exists())
+        self.assertFalse(ContentCluster.objects.exists())
+        self.assertFalse(ContentClusterBand.objects.exists())
+        self.assertFalse(DetectionResult.objects.exists())
+        self.assertFalse(CollectionCursor.objects.exists())
+
+    def test_batch_is_stored_in_one_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(persist_batch(self.batch()), 2)
+        counter_buffer.flush()
+        suspicious = CollectedContent.objects.get(content_id='1')
+        self.assertTrue(suspicious.is_suspicious)
+        self.assertEqual(suspicious.cluster.representative_id, suspicious.pk)
+        self.assertEqual(suspicious.cluster.size, 1)
+        self.assertEqual(DetectionResult.objects.get().content_id, '1')
+        self.assertEqual(CollectionCursor.objects.get(channel_id='channel-1').cursor, '2')
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.content_collected, self.session.detections_found), (2, 1))
+
+
+class ScoreEndpointTests(MonitoringTestCase):
+
+    def setUp(self):
+        super().setUp()
+        CollectedContent.objects.bulk_create([
+            content(self.session, str(index), f'{AD_TEXT} {index}') for index in range(7)
+        ])
+        self.view = CollectedContentViewSet.as_view({'post': 'score'})
+
+    def post(self, data):
+        request = APIRequestFactory().post('/monitoring/content/score/', data, format='json')
+        force_authenticate(request, self.user)
+        with mock.patch('detection.tasks.score_content_batch.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.view(request)
+        return response, delay
+
+    @override_settings(DETECTION_SCORING_MAX_BATCHES=2)
+    def test_queues_capped_batches_instead_of_scoring_inline(self):
+        response, delay = self.post({'batch_size': 3})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['queued'], response.data['batches'], response.data['more']), (6, 2, True))
+        self.assertEqual([len(call.args[0]) for call in delay.call_args_list], [3, 3])
+        self.assertFalse(CollectedContent.objects.filter(processed=True).exists())
+
+    def test_content_ids_are_rescored(self):
+        ids = list(CollectedContent.objects.order_by('pk').values_list('pk', flat=True)[:2])
+        response, delay = self.post({'content_ids': ids})
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once_with(ids, False)
+
+
+class ScoringQueueTests(MonitoringTestCase):
+
+    def setUp(self):
+        super().setUp()
+        CollectedContent.objects.bulk_create([
+            content(self.session, str(index), f'{AD_TEXT} {index}') for index in range(7)
+        ])
+        self.ids = list(CollectedContent.objects.order_by('pk').values_list('pk', flat=True))
+
+    def run_task(self):
+        with mock.patch('detection.tasks.score_content_batch.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                score_unprocessed_content(batch_size=3)
+        return [call.args[0] for call in delay.call_args_list]
+
+    def test_queued_rows_are_not_queued_again_until_stale(self):
+        CollectedContent.objects.filter(pk=self.ids[6]).update(processed=True)
+        self.assertEqual(self.run_task(), [self.ids[0:3], self.ids[3:6]])
+        self.assertEqual(self.run_task(), [])
+
+        # Only the batch that has waited longer than REQUEUE_AFTER is queued again.
+        stale = timezone.now() - timedelta(seconds=settings.DETECTION_SCORING_REQUEUE_AFTER + 1)
+        CollectedContent.objects.filter(pk__in=self.ids[0:3]).update(scoring_queued_at=stale)
+        self.assertEqual(self.run_task(), [self.ids[0:3]])
+
+
+class FailingScoreStageTests(SimpleTestCase):
+
+    @override_settings(CONTENT_CLUSTERING_ENABLED=False)
+    def test_failed_page_is_reported_and_released(self):
+        session = MonitoringSession(pk=1, platform_id=1)
+        keys = content_keys(content(session, '1', AD_TEXT))
+
+        async def run():
+            with mock.patch('monitoring.pipeline.score_batch', side_effect=RuntimeError('scoring failed')):
+                pipeline = IngestPipeline(flush_interval=0.01)
+            pipeline.deduplicator.seeded = True
+            task = asyncio.create_task(pipeline.run())
+            stored = await pipeline.submit([content(session, '1', AD_TEXT)], None)
+            result = await stored
+            await pipeline.close()
+            await task
+            return pipeline, result
+
+        with self.assertLogs('monitoring', 'ERROR') as logs:
+            pipeline, result = asyncio.run(run())
+        self.assertIn('Ingest stage score failed', logs.output[0])
+        self.assertIs(result, False)
+        self.assertEqual(pipeline.stats()['score']['failed'], 1)
+        self.assertEqual(pipeline.stored, 0)
+        for key in keys:
+            self.assertNotIn(key, pipeline.deduplicator.recent)
+
+
+class PagedConnector(BaseConnector):
+    """Serves numbered pages of one message; the cursor is the page number."""
+
+    platform_types = ('telegram',)
+    pages = 3
+
+    async def fetch_since(self, channel, cursor, limit=100, keywords=()):
+        page = int(cursor or 0) + 1
+        if page > self.pages:
+            return Batch([], str(self.pages), False)
+        message = Message(str(page), f'message {page}', 'u1', 'user', timezone.now(), '', channel,
+                          'message', {})
+        return Batch([message], str(page), page < self.pages)
+
+
+class RecordingPipeline:
+    """Stands in for IngestPipeline; stores pages until told to fail."""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.pages = []
+
+    async def submit(self, contents, cursor_update):
+        stored = asyncio.get_running_loop().create_future()
+        ok = self.fail_after is None or len(self.pages) < self.fail_after
+        if ok:
+            self.pages.append(cursor_update.cursor)
+        stored.set_result(ok)
+        return stored
+
+
+@override_settings(PLATFORM_CONNECTORS={'telegram': 'monitoring.tests.PagedConnector'})
+class CollectorCursorTests(SimpleTestCase):
+
+    def collector(self, pipeline, cursors):
+        platform = PlatformSpec(1, 'Telegram', 'telegram', '', '', '', 60)
+        spec = SessionSpec(1, 'Markets', platform, ('channel-1',), (), 60, 100)
+        return SessionCollector(spec, None, pipeline, cursors=cursors)
+
+    def test_follows_has_more(self):
+        pipeline, cursors = RecordingPipeline(), {}
+        collected = asyncio.run(self.collector(pipeline, cursors).collect_channel('channel-1'))
+        self.assertEqual(collected, 3)
+        self.assertEqual(pipeline.pages, ['1', '2', '3'])
+        self.assertEqual(cursors, {'channel-1': '3'})
+
+    def test_cursor_stays_before_a_page_that_was_not_stored(self):
+        pipeline, cursors = RecordingPipeline(fail_after=1), {}
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.collector(pipeline, cursors).collect_channel('channel-1'))
+        self.assertEqual(cursors, {'channel-1': '1'})
+
+        pipeline.fail_after = None
+        asyncio.run(self.collector(pipeline, cursors).collect_channel('channel-1'))
+        self.assertEqual(pipeline.pages, ['1', '2', '3'])
+        self.assertEqual(cursors, {'channel-1': '3'})
+
+
+class BrokenChannelConnector(PagedConnector):
+    """PagedConnector whose 'broken' channel always fails."""
+
+    async def fetch_since(self, channel, cursor, limit=100, keywords=()):
+        if channel == 'broken':
+            raise ConnectionError('channel unavailable')
+        return await super().fetch_since(channel, cursor, limit, keywords)
+
+
+class SessionCollectorTests(MonitoringTestCase):
+
+    def test_loads_active_sessions_on_enabled_platforms(self):
+        MonitoringSession.objects.create(
+            platform=self.platform, user=self.user, name='Paused', target_channels=['c'], status='paused',
+        )
+        disabled = Platform.objects.create(name='Twitter', platform_type='twitter', monitoring_enabled=False)
+        MonitoringSession.objects.create(platform=disabled, user=self.user, name='Off', target_channels=['c'])
+        spec, = load_active_sessions()
+        self.assertEqual((spec.id, spec.channels, spec.platform.id), (self.session.pk, ('channel-1',), self.platform.pk))
+
+    @override_settings(PLATFORM_CONNECTORS={'telegram': 'monitoring.tests.BrokenChannelConnector'})
+    def test_failed_channel_is_counted_without_stopping_the_others(self):
+        platform = PlatformSpec(1, 'Telegram', 'telegram', '', '', '', 60)
+        spec = SessionSpec(self.session.pk, 'Markets', platform, ('broken', 'channel-1'), (), 60, 100)
+        pipeline = RecordingPipeline()
+        with self.assertLogs('monitoring', 'WARNING'):
+            asyncio.run(SessionCollector(spec, None, pipeline).poll())
+        self.assertEqual(pipeline.pages, ['1', '2', '3'])
+        counter_buffer.flush()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.errors_encountered, 1)
+
+
+class ClusterTests(MonitoringTestCase):
+
+    REPOST = 'SELLING pure c0caine!! DM for prices and same-day delivery'
+
+    def test_reposts_share_a_cluster_within_a_batch(self):
+        contents = [
+            content(self.session, '1', AD_TEXT),
+            content(self.session, '2', self.REPOST),
+            content(self.session, '3', 'Just a friendly chat about the weather today'),
+        ]
+        new_clusters = match_clusters(contents)
+        self.assertEqual(len(new_clusters), 2)
+        self.assertEqual(contents[0].cluster_id, contents[1].cluster_id)
+        self.assertNotEqual(contents[0].cluster_id, contents[2].cluster_id)
+        self.assertIs(new_clusters[contents[0].cluster_id].representative, contents[0])
+
+    def test_later_repost_joins_the_stored_cluster(self):
+        original = content(self.session, '1', AD_TEXT)
+        original.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            assign_clusters([original])
+        repost, other = content(self.session, '2', self.REPOST), content(self.session, '3', 'Weather chat')
+        self.assertEqual(list(match_clusters([repost, other])), [-1])
+        self.assertEqual(repost.cluster_id, original.cluster_id)
+
+        repost.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            assign_clusters([repost])
+        counter_buffer.flush()
+        cluster = ContentCluster.objects.get()
+        self.assertEqual((cluster.representative_id, cluster.size), (original.pk, 2))
+
+
+class RetentionTests(MonitoringTestCase):
+
+    def test_purge_keeps_suspicious_and_recent_content(self):
+        for content_id, suspicious in (('old', False), ('evidence', True), ('new', False)):
+            item = content(self.session, content_id, f'message {content_id}')
+            item.is_suspicious = suspicious
+            item.save()
+        expired = timezone.now() - timedelta(days=settings.CONTENT_RETENTION_DAYS + 1)
+        CollectedContent.objects.exclude(content_id='new').update(collected_at=expired)
+        ContentCluster.objects.create(signature=b'', last_seen=expired)
+
+        self.assertEqual(purge_expired_content(), {'content': 1, 'clusters': 1})
+        self.assertEqual(
+            sorted(CollectedContent.objects.values_list('content_id', flat=True)), ['evidence', 'new']
+        )
+
+
+@override_settings(PLATFORM_CONNECTORS={'telegram': 'monitoring.tests.PagedConnector'})
+class CursorResumeTests(MonitoringTestCase):
+
+    def update(self, cursor, sequence):
+        return CursorUpdate(self.session.pk, 'channel-1', cursor, cursor, timezone.now(), sequence)
+
+    def test_resumed_collector_fetches_only_later_pages(self):
+        save_cursors([self.update('2', 2)])
+        cursors = load_cursors([self.session.pk])
+        self.assertEqual(cursors, {self.session.pk: {'channel-1': '2'}})
+
+        platform = PlatformSpec(self.platform.pk, 'Telegram', 'telegram', '', '', '', 60)
+        spec = SessionSpec(self.session.pk, 'Markets', platform, ('channel-1',), (), 60, 100)
+        pipeline = RecordingPipeline()
+        collector = SessionCollector(spec, None, pipeline, cursors=cursors[self.session.pk])
+        asyncio.run(collector.collect_channel('channel-1'))
+        self.assertEqual(pipeline.pages, ['3'])
+
+    def test_out_of_order_updates_never_move_a_cursor_back(self):
+        save_cursors([self.update('3', 3), self.update('1', 1)])
+        save_cursors([self.update('2', 2)])
+        stored = CollectionCursor.objects.get(monitoring_session=self.session, channel_id='channel-1')
+        self.assertEqual((stored.cursor, stored.sequence), ('3', 3))
+
+
+class ConnectorTests(SimpleTestCase):
+
+    def platform(self, endpoint='', platform_type='telegram'):
+        return PlatformSpec(900, 'Fake', platform_type, endpoint, 'secret', '', 60000)
+
+    def test_connector_class_follows_platform_type_and_overrides(self):
+        self.assertIsInstance(get_connector(self.platform(), None), HTTPConnector)
+        with override_settings(PLATFORM_CONNECTORS={'telegram': 'monitoring.tests.PagedConnector'}):
+            self.assertIsInstance(get_connector(self.platform(), None), PagedConnector)
+        with self.assertRaises(ConnectorError):
+            get_connector(self.platform(platform_type='carrier-pigeon'), None)
+
+    def test_http_connector_pages_through_the_fake_platform(self):
+        fake = FakePlatform(message_rate=0, backlog=5)
+
+        async def fetch_all():
+            batches = []
+            async with TestServer(fake.application()) as server, aiohttp.ClientSession() as http:
+                connector = get_connector(self.platform(str(server.make_url('')).rstrip('/')), http)
+                cursor, has_more = None, True
+                while has_more:
+                    batch = await connector.fetch_since('channel-1', cursor, limit=2)
+                    batches.append(batch)
+                    cursor, has_more = batch.cursor, batch.has_more
+                status = await connector.test_connection()
+            return batches, status
+
+        batches, status = asyncio.run(fetch_all())
+        self.assertEqual([[message.id for message in batch.messages] for batch in batches],
+                         [['1', '2'], ['3', '4'], ['5']])
+        self.assertEqual([batch.cursor for batch in batches], [2, 4, 5])
+        self.assertEqual(batches[0].messages[0], HTTPConnector(None, None).parse_message(fake.message('channel-1', 1)))
+        self.assertEqual((status['api_version'], status['details']['messages']), ('fake-1', 5))
+
+
+class FakeClock:
+    """Injected limiter clock; sleeping advances it instantly."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+@override_settings(RATE_LIMIT_429_BACKOFF=60)
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        # 60 requests per minute: one slot a second after a burst of 3.
+        self.bucket = TokenBucket(60, burst=3, clock=self.clock)
+
+    def reserve(self, count):
+        async def run():
+            return [await self.bucket.reserve(self.clock()) for _ in range(count)]
+        return asyncio.run(run())
+
+    def acquire_times(self, count):
+        async def run():
+            times = []
+            for _ in range(count):
+                await self.bucket.acquire()
+                times.append(self.clock.now - 1000.0)
+            return times
+        with mock.patch('monitoring.ratelimit.asyncio.sleep', self.clock.sleep):
+            return asyncio.run(run())
+
+    def test_burst_then_one_slot_per_interval(self):
+        self.assertEqual(self.reserve(5), [0.0, 0.0, 0.0, 1.0, 2.0])
+
+    def test_idle_time_refills_the_burst(self):
+        self.reserve(3)
+        self.clock.now += 10
+        self.assertEqual(self.reserve(4), [0.0, 0.0, 0.0, 1.0])
+
+    def test_acquire_waits_for_each_slot(self):
+        self.assertEqual(self.acquire_times(6), [0.0, 0.0, 0.0, 1.0, 2.0, 3.0])
+
+    def test_hold_blocks_until_reset(self):
+        asyncio.run(self.bucket.hold_until(1030.0))
+        self.assertEqual(self.acquire_times(3), [30.0, 31.0, 32.0])
+
+    def test_rate_limited_response_holds_for_retry_after(self):
+        asyncio.run(self.bucket.observe(429, {'Retry-After': '20'}))
+        self.assertEqual(self.bucket.held_until, 1020.0)
+        asyncio.run(self.bucket.observe(429, {}))
+        self.assertEqual(self.bucket.held_until, 1060.0)
+
+    def test_remaining_quota_is_spread_to_the_reset(self):
+        asyncio.run(self.bucket.observe(200, {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '60'}))
+        self.assertEqual(self.bucket.take_report(), (10, 1060.0))
+        self.assertIsNone(self.bucket.take_report())
+        # Ten requests left for sixty seconds: one every six.
+        self.assertEqual(self.reserve(2), [6.0, 7.0])
+
+    def test_exhausted_quota_holds_until_reset(self):
+        asyncio.run(self.bucket.observe(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '45'}))
+        self.assertEqual(self.acquire_times(1), [45.0])
@@ -12,6 +12,7 @@ app_name = 'monitoring'
 router = DefaultRouter()
 router.register(r'sessions', views.MonitoringSessionViewSet, basename='session')
 router.register(r'content', views.CollectedContentViewSet, basename='content')
+router.register(r'clusters', views.ContentClusterViewSet, basename='cluster')
 router.register(r'rules', views.MonitoringRuleViewSet, basename='rule')
 router.register(r'metrics', views.MonitoringMetricsViewSet, basename='metric')
 router.register(r'connections', views.PlatformConnectionViewSet, basename='connection')
@@ -30,6 +31,7 @@ urlpatterns = [
     path('content/<int:pk>/mark-suspicious/', views.CollectedContentViewSet.as_view({'post': 'mark_suspicious'}), name='mark_suspicious'),
     path('content/<int:pk>/mark-clean/', views.CollectedContentViewSet.as_view({'post': 'mark_clean'}), name='mark_clean'),
     path('content/<int:pk>/process/', views.CollectedContentViewSet.as_view({'post': 'process'}), name='process_content'),
+    path('content/score/', views.CollectedContentViewSet.as_view({'post': 'score'}), name='score_content'),
     
     # Rule execution endpoint
     path('rules/<int:pk>/execute/', views.MonitoringRuleViewSet.as_view({'post': 'execute'}), name='execute_rule'),
@@ -4,18 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.db.models import Count, Avg, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
 from .models import (
-    MonitoringSession, CollectedContent, MonitoringRule, 
+    MonitoringSession, CollectedContent, ContentCluster, MonitoringRule,
     MonitoringMetrics, PlatformConnection
 )
 from .serializers import (
-    MonitoringSessionSerializer, CollectedContentSerializer, 
+    MonitoringSessionSerializer, CollectedContentSerializer, ContentClusterSerializer,
     MonitoringRuleSerializer, MonitoringMetricsSerializer, 
-    PlatformConnectionSerializer
+    PlatformConnectionSerializer, ContentScoringSerializer
 )
+from detection.tasks import queue_content_scoring
 
 
 class MonitoringSessionViewSet(viewsets.ModelViewSet):
@@ -23,36 +27,30 @@ class MonitoringSessionViewSet(viewsets.ModelViewSet):
     serializer_class = MonitoringSessionSerializer
     permission_classes = [IsAuthenticated]
     
+    # The collector daemon (manage.py run_collectors) polls sessions whose
+    # status is 'active' and picks up changes on its next refresh.
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         session = self.get_object()
-        session.status = 'ACTIVE'
-        session.started_at = timezone.now()
-        session.save()
+        session.start()
         return Response({'message': 'Monitoring session started'})
     
     @action(detail=True, methods=['post'])
     def stop(self, request, pk=None):
         session = self.get_object()
-        session.status = 'STOPPED'
-        session.stopped_at = timezone.now()
-        session.save()
+        session.stop()
         return Response({'message': 'Monitoring session stopped'})
     
     @action(detail=True, methods=['post'])
     def pause(self, request, pk=None):
         session = self.get_object()
-        session.status = 'PAUSED'
-        session.paused_at = timezone.now()
-        session.save()
+        session.pause()
         return Response({'message': 'Monitoring session paused'})
     
     @action(detail=True, methods=['post'])
     def restart(self, request, pk=None):
         session = self.get_object()
-        session.status = 'ACTIVE'
-        session.restarted_at = timezone.now()
-        session.save()
+        session.start()
         return Response({'message': 'Monitoring session restarted'})
 
 
@@ -82,6 +80,85 @@ class CollectedContentViewSet(viewsets.ModelViewSet):
         content.processed_at = timezone.now()
         content.save()
         return Response({'message': 'Content processed'})
+    
+    @action(detail=False, methods=['post'])
+    def score(self, request):
+        """
+        Queue scoring of the selected content on the ``ml`` workers and
+        return 202. At most DETECTION_SCORING_MAX_BATCHES batches are
+        queued per call; ``more`` tells whether rows were left out.
+        """
+        serializer = ContentScoringSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        queryset = CollectedContent.objects.all()
+        unprocessed_only = data['unprocessed_only']
+        if data.get('content_ids'):
+            queryset = queryset.filter(id__in=data['content_ids'])
+            unprocessed_only = False
+        elif unprocessed_only:
+            queryset = queryset.filter(processed=False)
+        if data.get('session_id'):
+            queryset = queryset.filter(monitoring_session_id=data['session_id'])
+        
+        batch_size = data.get('batch_size') or settings.DETECTION_SCORING_BATCH_SIZE
+        limit = batch_size * settings.DETECTION_SCORING_MAX_BATCHES
+        content_ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:limit + 1])
+        more = len(content_ids) > limit
+        content_ids = content_ids[:limit]
+        batches = queue_content_scoring(content_ids, batch_size, unprocessed_only)
+        return Response({
+            'message': f"{len(content_ids)} content items queued for scoring",
+            'queued': len(content_ids),
+            'batches': batches,
+            'more': more,
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class ContentClusterViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Near-duplicate clusters, largest first: "same ad posted N times".
+    """
+    serializer_class = ContentClusterSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = ContentCluster.objects.select_related('representative').annotate(
+            channel_count=Count('members__channel_id', distinct=True),
+            platform_count=Count('members__platform', distinct=True),
+        ).order_by('-size', '-last_seen')
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        try:
+            min_size = int(params.get('min_size', 2))
+        except ValueError:
+            raise ValidationError({'min_size': 'Must be an integer.'})
+        queryset = queryset.filter(size__gte=min_size)
+        if params.get('suspicious') in ('1', 'true'):
+            queryset = queryset.filter(is_suspicious=True)
+        if params.get('since'):
+            try:
+                since = parse_datetime(params['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise ValidationError({'since': 'Must be an ISO 8601 date and time.'})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            queryset = queryset.filter(last_seen__gte=since)
+        return queryset
+    
+    @action(detail=True, methods=['get'])
+    def members(self, request, pk=None):
+        cluster = self.get_object()
+        queryset = cluster.members.select_related('platform').order_by('timestamp')
+        page = self.paginate_queryset(queryset)
+        serializer = CollectedContentSerializer(page if page is not None else queryset, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
 
 class MonitoringRuleViewSet(viewsets.ModelViewSet):